@@ -5,16 +5,15 @@
 
 # Libraries
 import argparse
-import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, time
-from functools import partial
 from typing import Literal
 
 from tqdm import tqdm
 
-from src.bfs.bfs import bfs_wrap, get_all_trains_single, BFSResult, total_transfer, expand_path, get_result
+from src.bfs.bfs import get_all_trains_single, BFSResult, total_transfer, expand_path
 from src.bfs.common import AbstractPath, Path
+from src.bfs.lean_result import sweep_lean_bfs, from_lean
+from src.bfs.raptor import raptor_profile
 from src.city.ask_for_city import ask_for_city, ask_for_station, ask_for_date, ask_for_station_list
 from src.city.city import City
 from src.city.line import Line, station_full_name
@@ -22,10 +21,21 @@ from src.city.through_spec import ThroughSpec
 from src.city.transfer import Transfer
 from src.common.common import to_minutes, from_minutes, get_time_repr, parse_time_opt, percentage_coverage, \
     percentage_str, suffix_s, average, distance_str, parse_comma, stddev, to_pinyin, TimeSpec, diff_time_tuple
+from src.common.worker_pool import get_pool
 from src.fare.fare import Fare
 from src.routing.through_train import ThroughTrain, parse_through_train
 from src.routing.train import Train, parse_all_trains
 
+# Parsed trains of a city: train dict, through train dict
+CityTrains = tuple[dict[str, dict[str, dict[str, list[Train]]]], dict[ThroughSpec, list[ThroughTrain]]]
+
+# Shared by every search without virtual transfers, so that the worker pool is kept
+NO_VIRTUAL: dict[tuple[str, str], Transfer] = {}
+
+# Parsed trains by (city, included lines, excluded lines), so that repeated searches share the same objects
+_city_trains: dict[tuple[int, frozenset[str] | None, frozenset[str] | None], tuple[City, CityTrains]] = {}
+_CITY_TRAINS_SIZE = 8
+
 # Duration, Path, BFS Result
 PathInfo = tuple[int, Path, BFSResult]
 
@@ -53,25 +63,21 @@ def get_minute_list(
 
 def reconstruct_paths(paths: list[PathInfo]) -> list[PathInfo]:
     """ Reconstruct the path on time between trains """
-    paths = sorted(paths, key=lambda x: x[2].initial_time_str())
+    paths = sorted(paths, key=lambda x: x[2].initial_minute)
     new_paths = paths[:]
     for i, (duration, path, result) in enumerate(paths):
         if i == 0:
             continue
-        last_time, last_day = paths[i - 1][2].initial_time, paths[i - 1][2].initial_day
-        init_minute = to_minutes(last_time, last_day)
-        last_minute = to_minutes(result.initial_time, result.initial_day)
+        init_minute = paths[i - 1][2].initial_minute
+        last_minute = result.initial_minute
         for minute in range(init_minute + 1, last_minute):
-            cur_time, cur_day = from_minutes(minute)
             new_result = BFSResult(
-                result.station, result.start_date,
-                cur_time, cur_day,
-                result.arrival_time, result.arrival_day,
+                result.station, result.start_date, minute, result.arrival_minute,
                 result.prev_station, result.prev_train,
                 force_next_day=result.force_next_day
             )
             new_paths.append((duration + last_minute - minute, path, new_result))
-    return sorted(new_paths, key=lambda x: x[2].initial_time_str())
+    return sorted(new_paths, key=lambda x: x[2].initial_minute)
 
 
 def all_time_bfs(
@@ -81,7 +87,7 @@ def all_time_bfs(
     start_date: date, start_station: str, *,
     limit_start: time | None = None, limit_start_day: bool = False,
     limit_end: time | None = None, limit_end_day: bool = False,
-    exclude_edge: bool = False, include_express: bool = False
+    exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs"
 ) -> dict[str, list[PathInfo]]:
     """ Run BFS through all times, tally to each station """
     results: dict[str, list[PathInfo]] = {}
@@ -90,33 +96,27 @@ def all_time_bfs(
         limit_start=limit_start, limit_start_day=limit_start_day,
         limit_end=limit_end, limit_end_day=limit_end_day
     )
+    if engine == "raptor":
+        return all_time_profile(
+            lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, start_station, all_list,
+            exclude_edge=exclude_edge, include_express=include_express
+        )
+    assert engine == "bfs", engine
     with tqdm(desc=("Calculating " + station_full_name(start_station, lines)), total=len(all_list)) as bar:
-        executor_cls = ProcessPoolExecutor if mp.parent_process() is None else ThreadPoolExecutor
-        with executor_cls() as executor:
-            work = partial(
-                bfs_wrap, lines, train_dict, through_dict, transfer_dict, virtual_dict,
-                start_date, start_station, exclude_edge=exclude_edge, include_express=include_express
-            )
-            iterator = executor.map(work, all_list, chunksize=50)
-            multi_result = []
-            for elem in iterator:
-                bar.set_description("Calculating " + station_full_name(start_station, lines) +
-                                    " at " + get_time_repr(elem[0], elem[1]))
-                bar.update()
-                multi_result.append(elem)
-
-    for _, _, bfs_result in multi_result:
-        stations = {x[0] for x in bfs_result.keys()}
-        for station in stations:
-            result = get_result(bfs_result, station, transfer_dict, through_dict)
-            if result is None:
-                continue
-            single_result = result[1]
-            if station not in results:
-                results[station] = []
-            results[station].append((
-                single_result.total_duration(), single_result.shortest_path(bfs_result), single_result
-            ))
+        pool = get_pool(lines, train_dict, through_dict, transfer_dict, virtual_dict)
+        iterator = sweep_lean_bfs(
+            pool, [(start_station, minute) for minute in all_list],
+            lines, train_dict, through_dict, transfer_dict, virtual_dict,
+            start_date, exclude_edge=exclude_edge, include_express=include_express
+        )
+        for (_, minute), lean_results in iterator:
+            bar.set_description("Calculating " + station_full_name(start_station, lines) +
+                                " at " + get_time_repr(*from_minutes(minute)))
+            bar.update()
+            for station, lean_result in lean_results.items():
+                if station not in results:
+                    results[station] = []
+                results[station].append(from_lean(train_dict, start_date, lean_result))
 
     # Reconstruct the paths
     for station, paths in results.items():
@@ -124,6 +124,44 @@ def all_time_bfs(
     return results
 
 
+def all_time_profile(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, start_station: str, all_list: list[int], *,
+    exclude_edge: bool = False, include_express: bool = False
+) -> dict[str, list[PathInfo]]:
+    """ Same as all_time_bfs(), but with one backward profile search instead of a BFS for each minute """
+    results: dict[str, list[PathInfo]] = {}
+    path_cache: dict[BFSResult, Path] = {}
+    with tqdm(desc=("Calculating " + station_full_name(start_station, lines)), total=len(all_list)) as bar:
+        for minute, station_results in raptor_profile(
+            lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, start_station, all_list,
+            exclude_edge=exclude_edge, include_express=include_express
+        ):
+            cur_time, cur_day = from_minutes(minute)
+            bar.set_description("Calculating " + station_full_name(start_station, lines) +
+                                " at " + get_time_repr(cur_time, cur_day))
+            bar.update()
+            for station, result in station_results.items():
+                if result not in path_cache:
+                    path_cache[result] = result.shortest_path()
+
+                # The result may come from a later minute, so wait at the start station
+                single_result = BFSResult(
+                    result.station, result.start_date, minute, result.arrival_minute,
+                    result.prev_station, result.prev_train,
+                    force_next_day=result.force_next_day
+                )
+                if station not in results:
+                    results[station] = []
+                results[station].append((single_result.total_duration(), path_cache[result], single_result))
+
+    for station, paths in results.items():
+        results[station] = reconstruct_paths(paths)
+    return results
+
+
 data_criteria = ["time", "stddev", "transfer", "station", "distance", "fare", "max", "min"]
 
 
@@ -133,7 +171,7 @@ def calculate_shortest(
     transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
     start_date: date, start_station: str, *,
     limit_start_tuple: TimeSpec | None = None, limit_end_tuple: TimeSpec | None = None,
-    exclude_edge: bool = False, include_express: bool = False,
+    exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs",
     fare_rules: Fare | None = None
 ) -> dict[str, tuple[float, float, float, float, float, float | None, PathInfo, PathInfo,
           list[tuple[float, AbstractPath, list[PathInfo]]]]]:
@@ -144,7 +182,7 @@ def calculate_shortest(
         limit_start_day=(False if limit_start_tuple is None else limit_start_tuple[1]),
         limit_end=(None if limit_end_tuple is None else limit_end_tuple[0]),
         limit_end_day=(False if limit_end_tuple is None else limit_end_tuple[1]),
-        exclude_edge=exclude_edge, include_express=include_express
+        exclude_edge=exclude_edge, include_express=include_express, engine=engine
     )
     result_dict: dict[str, tuple[float, float, float, float, float, float | None, PathInfo, PathInfo,
                       list[tuple[float, AbstractPath, list[PathInfo]]]]] = {}
@@ -171,12 +209,34 @@ def calculate_shortest(
     return result_dict
 
 
+def parse_city_trains(
+    city: City, *, include_lines: set[str] | str | None = None, exclude_lines: set[str] | str | None = None
+) -> CityTrains:
+    """ Parse the trains of a city once, to be shared by several searches (the result must not be modified) """
+    def lines_key(names: set[str] | str | None) -> frozenset[str] | None:
+        """ Normalize the line names for the cache key """
+        if isinstance(names, str):
+            return frozenset(x.strip() for x in names.split(","))
+        return None if names is None else frozenset(names)
+
+    key = (id(city), lines_key(include_lines), lines_key(exclude_lines))
+    if key in _city_trains and _city_trains[key][0] is city:
+        return _city_trains[key][1]
+    train_dict = parse_all_trains(list(city.lines.values()), include_lines=include_lines, exclude_lines=exclude_lines)
+    _, through_dict = parse_through_train(train_dict, city.through_specs)
+    if len(_city_trains) >= _CITY_TRAINS_SIZE:
+        del _city_trains[next(iter(_city_trains))]
+    _city_trains[key] = (city, (train_dict, through_dict))
+    return _city_trains[key][1]
+
+
 def shortest_in_city(
     limit_start: str | None = None,
     limit_end: str | None = None,
     city_station: tuple[City, str, date] | None = None, *,
     include_lines: set[str] | str | None = None, exclude_lines: set[str] | str | None = None,
-    exclude_virtual: bool = False, exclude_edge: bool = False, include_express: bool = False
+    exclude_virtual: bool = False, exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs",
+    trains: CityTrains | None = None
 ) -> tuple[City, str, dict[ThroughSpec, list[ThroughTrain]], dict[str,
            tuple[float, float, float, float, float, float | None, PathInfo, PathInfo,
                  list[tuple[float, AbstractPath, list[PathInfo]]]]
@@ -189,14 +249,15 @@ def shortest_in_city(
     else:
         city, start, start_date = city_station
     lines = city.lines
-    train_dict = parse_all_trains(list(lines.values()), include_lines=include_lines, exclude_lines=exclude_lines)
-    _, through_dict = parse_through_train(train_dict, city.through_specs)
-    virtual_transfers = city.virtual_transfers if not exclude_virtual else {}
+    if trains is None:
+        trains = parse_city_trains(city, include_lines=include_lines, exclude_lines=exclude_lines)
+    train_dict, through_dict = trains
+    virtual_transfers = city.virtual_transfers if not exclude_virtual else NO_VIRTUAL
     return city, start, through_dict, calculate_shortest(
         lines, train_dict, through_dict, city.transfers, virtual_transfers, start_date, start,
         limit_start_tuple=parse_time_opt(limit_start),
         limit_end_tuple=parse_time_opt(limit_end),
-        exclude_edge=exclude_edge, include_express=include_express, fare_rules=city.fare_rules
+        exclude_edge=exclude_edge, include_express=include_express, engine=engine, fare_rules=city.fare_rules
     )
 
 
@@ -205,7 +266,7 @@ def avg_shortest_in_city(
     limit_end: str | None = None,
     *,
     include_lines: set[str] | str | None = None, exclude_lines: set[str] | str | None = None,
-    exclude_virtual: bool = False, exclude_edge: bool = False, include_express: bool = False,
+    exclude_virtual: bool = False, exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs",
     strategy: Literal["avg", "min", "max"] = "avg"
 ) -> tuple[City, list[str], dict[str, tuple[float, float, float, float]]]:
     """ Find the shortest path to several different stations """
@@ -218,7 +279,8 @@ def avg_shortest_in_city(
         _, _, _, result = shortest_in_city(
             limit_start, limit_end, (city, station, start_date),
             include_lines=include_lines, exclude_lines=exclude_lines,
-            exclude_virtual=exclude_virtual, exclude_edge=exclude_edge, include_express=include_express
+            exclude_virtual=exclude_virtual, exclude_edge=exclude_edge, include_express=include_express,
+            engine=engine
         )
         if station not in len_dict:
             len_dict[station] = 0
@@ -343,7 +405,7 @@ def get_waiting_time(
 
 def shortest_path_args(
     parser: argparse.ArgumentParser,
-    *, have_single: bool = False, have_express: bool = True, have_edge: bool = True
+    *, have_single: bool = False, have_express: bool = True, have_edge: bool = True, have_engine: bool = False
 ) -> None:
     """ Add the shortest path arguments like --include-lines """
     group = parser.add_mutually_exclusive_group()
@@ -357,6 +419,8 @@ def shortest_path_args(
                             help="Include non-essential use of express lines")
     if have_single:
         parser.add_argument("--exclude-single", action="store_true", help="Exclude single-direction lines")
+    if have_engine:
+        parser.add_argument("--engine", choices=["bfs", "raptor"], default="bfs", help="Search engine to use")
 
 
 def avg_shortest_args(parser: argparse.ArgumentParser, *, include_limits: bool = True) -> None:
@@ -425,6 +489,7 @@ def find_avg_paths(
         args.limit_start, args.limit_end, city_station,
         include_lines=args.include_lines, exclude_lines=args.exclude_lines,
         exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express,
+        engine=args.engine
     )
     result_dict = dict(sorted(result_dict.items(),
                               key=lambda x: (x[1][data_criteria.index(args.data_source)], x[1][0], to_pinyin(x[0])[0])))
@@ -454,7 +519,7 @@ def main() -> None:
     """ Main function """
     parser = argparse.ArgumentParser()
     avg_shortest_args(parser)
-    shortest_path_args(parser)
+    shortest_path_args(parser, have_engine=True)
     args = parser.parse_args()
     find_avg_paths(args)
 
@@ -6,18 +6,22 @@
 # Libraries
 from __future__ import annotations
 
+import heapq
+from collections import deque
 from datetime import date, time, timedelta
+from itertools import count
 from math import floor, ceil
 from typing import Any
 
 from src.bfs.common import VTSpec, Path
 from src.city.line import Line, station_full_name
 from src.city.through_spec import ThroughSpec
-from src.city.train_route import TrainRoute
-from src.city.transfer import Transfer, format_transfer_data
-from src.common.common import diff_time, format_duration, get_time_str, add_min, suffix_s, distance_str, \
-    get_time_repr, from_minutes
+from src.city.transfer import Transfer, TransferData, format_transfer_data
+from src.city.transfer_table import get_transfer_table
+from src.common.common import diff_time, format_duration, get_time_str, suffix_s, distance_str, \
+    get_time_repr, from_minutes, to_minutes
 from src.fare.fare import Fare
+from src.routing.departure_index import get_departure_index
 from src.routing.through_train import ThroughTrain, find_through_train
 from src.routing.train import Train
 
@@ -25,19 +29,99 @@ from src.routing.train import Train
 class BFSResult:
     """ Contains the result of searching for each station """
 
-    def __init__(self, station: str, start_date: date,
-                 initial_time: time, initial_day: bool,
-                 arrival_time: time, arrival_day: bool,
+    def __init__(self, station: str, start_date: date, initial_minute: int, arrival_minute: int,
                  prev_station: str | None = None, prev_train: Train | VTSpec | None = None,
                  *, force_next_day: bool = False) -> None:
         """ Constructor """
+        # Times are kept as minutes since the start of the service day, see from_minutes()
         self.station = station
         self.start_date = start_date
-        self.initial_time, self.initial_day = initial_time, initial_day
-        self.arrival_time, self.arrival_day = arrival_time, arrival_day
+        self.initial_minute, self.arrival_minute = initial_minute, arrival_minute
         self.prev_station, self.prev_train = prev_station, prev_train
         self.force_next_day = force_next_day
 
+        # Running aggregates of shortest_path(), maintained by bfs() so that comparing two results
+        # does not require re-walking their paths (see comparison_key())
+        self.train_legs, self.virtual_legs = 0, 0
+        self.first_virtual, self.last_virtual = False, False
+        self.transfer_sum: tuple[float, int, int] = (0.0, 0, 0)
+        self.pending_transfer: TransferData | None = None
+        self.station_count, self.distance = 0, 0
+        self.visited: frozenset[str] = frozenset()
+
+    def inherit(self, parent: BFSResult | None) -> BFSResult:
+        """ Copy the running aggregates from the result whose path this one extends """
+        if parent is not None:
+            self.train_legs, self.virtual_legs = parent.train_legs, parent.virtual_legs
+            self.first_virtual, self.last_virtual = parent.first_virtual, parent.last_virtual
+            self.transfer_sum = parent.transfer_sum
+            self.station_count, self.distance = parent.station_count, parent.distance
+            self.visited = parent.visited
+        return self
+
+    def add_leg(
+        self, station: str, train: Train | VTSpec, station_count: int = 1, distance: int = 0,
+        transfer_data: TransferData | None = None
+    ) -> BFSResult:
+        """ Append a leg boarded at station (and the transfer before it, if any) to the running aggregates """
+        if isinstance(train, Train):
+            self.train_legs += 1
+            self.last_virtual = False
+        else:
+            if self.train_legs + self.virtual_legs == 0:
+                self.first_virtual = True
+            self.virtual_legs += 1
+            self.last_virtual = True
+            transfer_data = train[3]
+        if transfer_data is not None:
+            self.transfer_sum = (
+                self.transfer_sum[0] + transfer_data[0],
+                self.transfer_sum[1] + (transfer_data[1] or 0),
+                self.transfer_sum[2] + (transfer_data[2] or 0)
+            )
+        self.station_count += station_count
+        self.distance += distance
+        self.visited = self.visited | {station}
+        return self
+
+    def comparison_key(self) -> tuple[int | float | tuple, ...]:
+        """ Same as path_index() on shortest_path(), computed from the running aggregates """
+        num_legs = self.train_legs + self.virtual_legs
+        return (
+            self.total_duration(),
+            self.train_legs - 1 + (1 if self.first_virtual else 0) +
+            (1 if self.last_virtual and num_legs > 1 else 0) + self.virtual_legs,
+            (0.0, 0, 0) if num_legs <= 1 else self.transfer_sum,
+            self.station_count,
+            self.distance
+        )
+
+    @property
+    def initial_time(self) -> time:
+        """ Initial time """
+        return from_minutes(self.initial_minute)[0]
+
+    @property
+    def initial_day(self) -> bool:
+        """ Whether the initial time is on the next day """
+        return self.initial_minute >= 24 * 60
+
+    @property
+    def arrival_time(self) -> time:
+        """ Arrival time """
+        return from_minutes(self.arrival_minute)[0]
+
+    @property
+    def arrival_day(self) -> bool:
+        """ Whether the arrival time is on the next day """
+        return self.arrival_minute >= 24 * 60
+
+    def final_minute(self) -> int:
+        """ Arrival time in minutes, considering force_next_day """
+        if self.force_next_day and self.arrival_minute < 24 * 60:
+            return self.arrival_minute + 24 * 60
+        return self.arrival_minute
+
     def initial_time_str(self) -> str:
         """ Get string representation of initial time """
         return get_time_str(self.initial_time, self.initial_day)
@@ -94,12 +178,8 @@ class BFSResult:
 
     def total_duration(self) -> int:
         """ Get total duration """
-        result = diff_time(
-            self.arrival_time, self.initial_time,
-            self.arrival_day or self.force_next_day, self.initial_day
-        )
-        assert result >= 0, (self.initial_time, self.initial_day,
-                             self.arrival_time, self.arrival_day, self.force_next_day)
+        result = self.final_minute() - self.initial_minute
+        assert result >= 0, (self.initial_minute, self.arrival_minute, self.force_next_day)
         return result
 
     def total_distance(self, path: Path) -> int:
@@ -163,7 +243,7 @@ class BFSResult:
         line_list: list[str] = []
         if isinstance(path[0][1], Train):
             first_time, first_day = path[0][1].arrival_time[path[0][0]]
-            first_waiting = diff_time(first_time, self.initial_time, first_day, self.initial_day)
+            first_waiting = to_minutes(first_time, first_day) - self.initial_minute
             if first_waiting < 0:
                 assert self.force_next_day, (self.initial_time, self.initial_day, first_time, first_day)
                 first_waiting += 24 * 60
@@ -264,6 +344,30 @@ class BFSResult:
         print(indent_str + preamble + line_list[-1])
 
 
+class SearchResults(dict[tuple[str, str, str], BFSResult]):
+    """ Results of bfs(), also keeping the best key of each station as labels are recorded """
+
+    def __init__(self) -> None:
+        """ Constructor """
+        super().__init__()
+        # station -> (key, comparison_key()) of the best result; ties go to the key recorded first
+        self.best: dict[str, tuple[tuple[str, str, str], tuple]] = {}
+        self.order: dict[tuple[str, str, str], int] = {}
+
+    def record(self, key: tuple[str, str, str], result: BFSResult, index: tuple | None = None) -> None:
+        """ Store the result of key """
+        if key not in self.order:
+            self.order[key] = len(self.order)
+        self[key] = result
+        if index is None:
+            index = result.comparison_key()
+        station = key[0]
+        if station not in self.best or self.best[station][0] == key or index < self.best[station][1] or (
+            index == self.best[station][1] and self.order[key] < self.order[self.best[station][0]]
+        ):
+            self.best[station] = (key, index)
+
+
 def combine_trains(path1: Path, path2: Path, end_station: str) -> Path:
     """ Collapse path such that adjacent same-line trains are merged """
     assert len(path1) == len(path2) == 1, (path1, path2, end_station)
@@ -291,16 +395,7 @@ def get_all_trains_single(
     cur_date: date
 ) -> list[Train]:
     """ Get all trains passing through a station, ordered by passing through time """
-    all_passing: list[Train] = []
-    for line, line_dict in train_dict.items():
-        for direction_dict in line_dict.values():
-            for date_group, date_dict in direction_dict.items():
-                if not lines[line].date_groups[date_group].covers(cur_date):
-                    continue
-                for train in date_dict:
-                    if station in train.arrival_time and station not in train.skip_stations:
-                        all_passing.append(train)
-    return sorted(all_passing, key=lambda t: get_time_str(*t.arrival_time[station]))
+    return list(get_departure_index(train_dict, cur_date).passing_all(station)[1])
 
 
 def find_next_train(
@@ -310,22 +405,9 @@ def find_next_train(
 ) -> list[Train]:
     """ Find all possible next trains """
     # Find one for each line/direction/routes pair
-    result: dict[tuple[str, str, frozenset[TrainRoute]], Train] = {}
-    all_passing: list[Train] = []
-    for date_group, date_dict in train_dict[line.name][direction].items():
-        if not line.date_groups[date_group].covers(cur_date):
-            continue
-        for train in date_dict:
-            if station in train.arrival_time and station not in train.skip_stations:
-                arr_time, arr_day = train.arrival_time[station]
-                if diff_time(arr_time, cur_time, arr_day, cur_day) < 0:
-                    continue
-                all_passing.append(train)
-    for train in sorted(all_passing, key=lambda st: get_time_str(*st.arrival_time[station])):
-        key = (train.line.name, train.direction, frozenset(train.routes))
-        if key not in result:
-            result[key] = train
-    return list(result.values())
+    return get_departure_index(train_dict, cur_date).next_trains(
+        station, line.name, direction, to_minutes(cur_time, cur_day)
+    )
 
 
 def total_transfer(path: Path, *, through_dict: dict[ThroughSpec, list[ThroughTrain]] | None = None) -> int:
@@ -467,9 +549,13 @@ def bfs(
     exclude_stations: set[str] | None = None,
     exclude_edges: dict[str, set[tuple[Line, str]]] | None = None,  # station -> line, direction
     exclude_edge: bool = False,
-    include_express: bool = False
+    include_express: bool = False,
+    label_setting: bool = True
 ) -> dict[tuple[str, str, str], BFSResult]:
     """ Search for the shortest path (by time) to every station """
+    # With label_setting, states are expanded in path_index() order from a heap and settled once,
+    # comparing the running aggregates on BFSResult; otherwise a FIFO queue is used, states are
+    # re-expanded whenever they are improved and paths are compared through superior_path()
     # Construct a station -> (line, direction) dict
     station_dict: dict[str, list[tuple[Line, str]]] = {}
     for line in lines.values():
@@ -483,23 +569,25 @@ def bfs(
         if station1 not in virtual_station_dict:
             virtual_station_dict[station1] = set()
         virtual_station_dict[station1].add(station2)
+    index = get_departure_index(train_dict, start_date)
+    transfers = get_transfer_table(lines, transfer_dict, virtual_dict, start_date)
 
     start_time, start_day = start_time_tuple
-    starting_time_dict: dict[tuple[str, str], tuple[time, bool]] | None = None
+    start_minute = to_minutes(start_time, start_day)
+    round_func = floor if exclude_edge else ceil
+    starting_time_dict: dict[tuple[str, str], int] | None = None
     if initial_line_direction is not None:
         # Calculate appropriate starting time
         starting_time_dict = {}
         for line, direction in station_dict[start_station]:
             if line.name == initial_line_direction[0].name and direction == initial_line_direction[1]:
-                starting_time_dict[(line.name, direction)] = (start_time, start_day)
+                starting_time_dict[(line.name, direction)] = start_minute
             elif line.name != initial_line_direction[0].name:
-                transfer_time, _ = transfer_dict[start_station].get_transfer_time(
-                    initial_line_direction[0], initial_line_direction[1], line, direction,
-                    start_date, start_time, start_day
-                )
-                starting_time_dict[(line.name, direction)] = add_min(
-                    start_time, (floor if exclude_edge else ceil)(transfer_time[0]), start_day
+                transfer_time, _ = transfers.transfer_time(
+                    start_station, start_station, initial_line_direction[0].name, initial_line_direction[1],
+                    line.name, direction, start_minute
                 )
+                starting_time_dict[(line.name, direction)] = start_minute + round_func(transfer_time[0])
 
     # Set starting point at all possible lines and directions
     queue = [
@@ -509,7 +597,8 @@ def bfs(
             (line, direction) not in exclude_edges[start_station]
         )
     ]
-    results: dict[tuple[str, str, str], BFSResult] = {}
+    # The best result of each station is only tracked with label_setting, where comparison_key() is final
+    results: dict[tuple[str, str, str], BFSResult] = SearchResults() if label_setting else {}
     if start_station in virtual_station_dict:
         for new_station in virtual_station_dict[start_station]:
             for line, direction in station_dict[new_station]:
@@ -518,41 +607,82 @@ def bfs(
                     continue
                 if line.name not in train_dict or direction not in train_dict[line.name]:
                     continue
-                fr_line, fr_dir, to_line, to_dir, transfer_time, special = virtual_dict[
-                    (start_station, new_station)
-                ].get_smallest_time(
-                    to_line=line, to_direction=direction, cur_date=start_date, cur_time=start_time, cur_day=start_day
+                fr_line, fr_dir, to_line, to_dir, transfer_time, special = transfers.smallest_time(
+                    start_station, new_station, line.name, direction, start_minute
                 )
-                next_time, next_day = add_min(start_time, (floor if exclude_edge else ceil)(transfer_time[0]), start_day)
                 queue.append((new_station, line.name, direction))
-                results[(new_station, line.name, direction)] = BFSResult(
-                    new_station, start_date,
-                    start_time, start_day,
-                    next_time, next_day,
-                    start_station, (
-                        start_station, new_station, (fr_line, fr_dir, to_line, to_dir), transfer_time, special
-                    )
+                virtual_spec: VTSpec = (
+                    start_station, new_station, (fr_line, fr_dir, to_line, to_dir), transfer_time, special
                 )
+                virtual_result = BFSResult(
+                    new_station, start_date, start_minute, start_minute + round_func(transfer_time[0]),
+                    start_station, virtual_spec
+                ).add_leg(start_station, virtual_spec)
+                if isinstance(results, SearchResults):
+                    results.record((new_station, line.name, direction), virtual_result)
+                else:
+                    results[(new_station, line.name, direction)] = virtual_result
+    heap: list[tuple[tuple, int, tuple[str, str, str]]] = []
+    tie_breaker = count()
+    settled: set[tuple[str, str, str]] = set()
+    if label_setting:
+        for key in queue:
+            heapq.heappush(heap, (results[key].comparison_key() if key in results else (), next(tie_breaker), key))
+    fifo = deque(queue)
     in_queue = set(queue)
-    while len(queue) > 0:
-        key, queue = queue[0], queue[1:]
+
+    def relax(new_key: tuple[str, str, str], new_result: BFSResult) -> None:
+        """ Record new_result for new_key if it is better than the current one """
+        if label_setting:
+            if new_key in settled:
+                return
+            new_index = new_result.comparison_key()
+            if new_key in results and not new_index < results[new_key].comparison_key():
+                return
+            assert isinstance(results, SearchResults)
+            results.record(new_key, new_result, new_index)
+            heapq.heappush(heap, (new_index, next(tie_breaker), new_key))
+            return
+        if new_key in results and not superior_path(results, new_result, results[new_key], transfer_dict, through_dict):
+            return
+        results[new_key] = new_result
+        if new_key not in in_queue:
+            in_queue.add(new_key)
+            fifo.append(new_key)
+
+    while len(heap if label_setting else fifo) > 0:
+        if label_setting:
+            _, _, key = heapq.heappop(heap)
+            if key in settled:
+                continue
+            settled.add(key)
+        else:
+            key = fifo.popleft()
+            in_queue.remove(key)
         station, line_name, direction = key
         line = lines[line_name]
-        in_queue.remove(key)
         # print("Dequeue", key)
         if station == start_station:
             if starting_time_dict is None:
-                cur_time, cur_day = start_time, start_day
+                cur_minute = start_minute
             elif (line_name, direction) not in starting_time_dict:
                 continue
             else:
-                cur_time, cur_day = starting_time_dict[(line_name, direction)]
+                cur_minute = starting_time_dict[(line_name, direction)]
             prev_train = None
             prev_station: str | None = None
         else:
-            cur_time, cur_day = results[key].arrival_time, results[key].arrival_day or results[key].force_next_day
+            cur_minute = results[key].final_minute()
             prev_train = results[key].prev_train
             prev_station = results[key].prev_station
+        cur_result = results[key] if station != start_station else None
+        if key not in results:
+            visited: frozenset[str] = frozenset()
+        elif label_setting:
+            visited = results[key].visited
+        else:
+            # Labels may still change in FIFO mode, so re-walk the current path instead
+            visited = frozenset(x[0] for x in results[key].shortest_path(results))
 
         # Iterate through all possible next steps
         exclude_tuple: set[tuple[Line, str]] = set()
@@ -565,20 +695,27 @@ def bfs(
         if prev_train is not None and isinstance(prev_train, Train) and prev_train.line.name == line_name:
             next_trains = []
         else:
-            next_trains = find_next_train(train_dict, start_date, cur_time, cur_day, station, line, direction)
+            next_trains = index.next_trains(station, line_name, direction, cur_minute)
         for next_train in next_trains:
-            next_train_virtual = next_train.arrival_time_virtual(station)
+            next_minutes = next_train.minutes_virtual(station)
+            pending_transfer = None if cur_result is None else cur_result.pending_transfer
+            if pending_transfer is not None and isinstance(prev_train, Train) and through_dict is not None:
+                # Through-train transfers are excluded in total_transfer_duration()
+                through = find_through_train(through_dict, prev_train)
+                if through is not None and next_train in through[1].trains.values():
+                    pending_transfer = None
             if len(next_train.line.must_include) != 0 and station not in next_train.line.must_include and not (
                 station == start_station and initial_line_direction is not None and
                 initial_line_direction[0] == next_train.line
             ) and not include_express:
+                next_positions = {st: i for i, (st, _) in enumerate(next_minutes)}
                 next_stations = [
-                    (st, next_train_virtual[st]) for st in next_train.line.must_include
-                    if st in next_train_virtual and st != station
+                    (next_positions[st], next_minutes[next_positions[st]]) for st in next_train.line.must_include
+                    if st in next_positions and st != station
                 ]
             else:
-                next_stations = list(next_train_virtual.items())[1:]
-            for next_station, (next_time, next_day) in next_stations:
+                next_stations = list(enumerate(next_minutes))[1:]
+            for next_position, (next_station, next_minute) in next_stations:
                 if next_station in next_train.skip_stations:
                     continue
                 if next_train.loop_next is not None and next_station not in next_train.arrival_time and \
@@ -590,22 +727,14 @@ def bfs(
                     break
 
                 next_result = BFSResult(
-                    next_station, start_date,
-                    start_time, start_day,
-                    next_time, next_day,
-                    station, next_train
+                    next_station, start_date, start_minute, next_minute, station, next_train
+                ).inherit(cur_result).add_leg(
+                    station, next_train, next_position,
+                    next_train.two_station_dist(station, next_station), pending_transfer
                 )
                 new_key = (next_station, next_train.line.name, next_train.direction)
-                if (
-                    key not in results or
-                    next_station not in [x[0] for x in results[key].shortest_path(results)]
-                ) and (new_key not in results or superior_path(
-                    results, next_result, results[new_key], transfer_dict, through_dict
-                )):
-                    results[new_key] = next_result
-                    if new_key not in in_queue:
-                        in_queue.add(new_key)
-                        queue.append(new_key)
+                if next_station not in visited:
+                    relax(new_key, next_result)
 
         # We do not want to do two transfers in a row
         if isinstance(prev_train, Train) and prev_train.line.name != line_name:
@@ -613,54 +742,29 @@ def bfs(
         if prev_train is None:
             continue
 
-        # Update all the transfer-able points
-        update_list: list[tuple[str, Line, str]] = []
-        for new_line, new_direction in station_dict[station]:
-            if new_line.name == line_name:
-                # For now, don't consider same-line transfers
-                continue
+        # Update all the transfer-able points, both in-station and virtual
+        for new_station, new_line, new_direction, transfer_time, special in transfers.outgoing(
+            station, line_name, direction, cur_minute
+        ):
             if (new_line, new_direction) in exclude_tuple:
                 continue
             if new_line.name not in train_dict or new_direction not in train_dict[new_line.name]:
                 continue
-            update_list.append((station, new_line, new_direction))
-
-        # Update all the virtual transfer-able points
-        if station in virtual_station_dict:
-            for new_station in virtual_station_dict[station]:
-                for new_line, new_direction in station_dict[new_station]:
-                    if (new_line, new_direction) in exclude_tuple:
-                        continue
-                    if new_line.name not in train_dict or new_direction not in train_dict[new_line.name]:
-                        continue
-                    update_list.append((new_station, new_line, new_direction))
-
-        for new_station, new_line, new_direction in update_list:
             transfer_spec = (line_name, direction, new_line.name, new_direction)
-            transfer_obj = transfer_dict[station] if new_station == station else virtual_dict[(station, new_station)]
-            transfer_time, special = transfer_obj.get_transfer_time(
-                line, direction, new_line, new_direction,
-                start_date, cur_time, cur_day
-            )
-            next_time, next_day = add_min(cur_time, (floor if exclude_edge else ceil)(transfer_time[0]), cur_day)
+            assert transfer_time is not None, (station, new_station, transfer_spec)
             new_result = BFSResult(
-                station, start_date,
-                start_time, start_day,
-                next_time, next_day,
+                station, start_date, start_minute, cur_minute + round_func(transfer_time[0]),
                 prev_station if new_station == station else station,
                 prev_train if new_station == station else (station, new_station, transfer_spec, transfer_time, special)
-            )
+            ).inherit(cur_result)
+            if new_station == station:
+                # After a virtual transfer, the path folds this transfer into the virtual one
+                new_result.pending_transfer = transfer_time if isinstance(prev_train, Train) else None
+            else:
+                new_result.add_leg(station, (station, new_station, transfer_spec, transfer_time, special))
             new_key = (new_station, new_line.name, new_direction)
-            if (
-                key not in results or
-                new_station not in [x[0] for x in results[key].shortest_path(results)]
-            ) and (new_key not in results or superior_path(
-                results, new_result, results[new_key], transfer_dict, through_dict
-            )):
-                results[new_key] = new_result
-                if new_key not in in_queue:
-                    in_queue.add(new_key)
-                    queue.append(new_key)
+            if new_station not in visited:
+                relax(new_key, new_result)
 
     return results
 
@@ -670,6 +774,11 @@ def get_result(
     through_dict: dict[ThroughSpec, list[ThroughTrain]] | None = None
 ) -> tuple[tuple[str, str, str], BFSResult] | None:
     """ Get the result for a specific station """
+    if isinstance(results, SearchResults):
+        if end_station not in results.best:
+            return None
+        key = results.best[end_station][0]
+        return key, results[key]
     candidate: tuple[tuple[str, str, str], BFSResult] | None = None
     for key, result in results.items():
         if key[0] != end_station:
@@ -684,6 +793,32 @@ def get_result(
     return candidate
 
 
+def best_results(
+    results: dict[tuple[str, str, str], BFSResult], transfer_dict: dict[str, Transfer],
+    through_dict: dict[ThroughSpec, list[ThroughTrain]] | None = None
+) -> dict[str, tuple[tuple[str, str, str], BFSResult]]:
+    """ Get the result for every station, same as calling get_result() on each of them """
+    if isinstance(results, SearchResults):
+        return {station: (key, results[key]) for station, (key, _) in results.best.items()}
+
+    # Otherwise compare the candidates of each station in one pass, walking each path only once
+    best: dict[str, tuple[tuple[str, str, str], BFSResult]] = {}
+    paths: dict[tuple[str, str, str], Path] = {}
+    for key, result in results.items():
+        if key[0] not in best:
+            best[key[0]] = (key, result)
+            continue
+        candidate_key, candidate = best[key[0]]
+        for path_key, path_result in [(key, result), (candidate_key, candidate)]:
+            if path_key not in paths:
+                paths[path_key] = path_result.shortest_path(results)
+        if superior_path(
+            results, result, candidate, transfer_dict, through_dict, path1=paths[key], path2=paths[candidate_key]
+        ):
+            best[key[0]] = (key, result)
+    return best
+
+
 def bfs_wrap(lines: dict[str, Line],
              train_dict: dict[str, dict[str, dict[str, list[Train]]]],
              through_dict: dict[ThroughSpec, list[ThroughTrain]],
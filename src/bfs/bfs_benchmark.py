@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Benchmark the time and memory allocations of a full search from one station """
+
+# Libraries
+import argparse
+import gc
+import tracemalloc
+from collections.abc import Callable
+from time import perf_counter
+from typing import Any
+
+from src.bfs.avg_shortest_time import shortest_path_args
+from src.bfs.raptor import engines
+from src.city.ask_for_city import ask_for_city, ask_for_station, ask_for_date, ask_for_time
+from src.common.common import average, stddev, suffix_s
+from src.routing.departure_index import get_departure_index
+from src.routing.through_train import parse_through_train
+from src.routing.train import parse_all_trains
+
+
+def benchmark(func: Callable[[], Any], repeat: int = 10) -> tuple[list[float], int, int]:
+    """ Run func repeatedly, return (seconds of each run, peak bytes allocated, # of gen-0 collections) """
+    func()  # warm up caches like the departure index
+
+    durations: list[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        durations.append(perf_counter() - start)
+
+    # Number of gen-0 collections is a proxy for the number of container objects allocated
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return durations, peak, gc.get_stats()[0]["collections"] - collections
+
+
+def main() -> None:
+    """ Main function """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="Number of timed runs")
+    shortest_path_args(parser, have_engine=True)
+    args = parser.parse_args()
+
+    city = ask_for_city()
+    start_station, _ = ask_for_station(city)
+    start_date = ask_for_date()
+    start_time, start_day = ask_for_time()
+    train_dict = parse_all_trains(
+        list(city.lines.values()), include_lines=args.include_lines, exclude_lines=args.exclude_lines
+    )
+    _, through_dict = parse_through_train(train_dict, city.through_specs)
+    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else {}
+
+    start = perf_counter()
+    get_departure_index(train_dict, start_date)
+    print(f"Departure index built in {perf_counter() - start:.3f}s")
+
+    search = engines[args.engine]
+    durations, peak, collections = benchmark(lambda: search(
+        city.lines, train_dict, through_dict, city.transfers, virtual_transfers,
+        start_date, start_station, (start_time, start_day),
+        exclude_edge=args.exclude_edge, include_express=args.include_express
+    ), args.repeat)
+    print(f"{args.engine}() over " + suffix_s("run", args.repeat) +
+          f": avg {average(durations):.3f}s (stddev {stddev(durations):.3f}s, " +
+          f"min {min(durations):.3f}s, max {max(durations):.3f}s)")
+    print(f"Peak allocation: {peak / 1024 / 1024:.2f}MiB, " + suffix_s("gen-0 collection", collections))
+
+
+# Call main
+if __name__ == "__main__":
+    main()
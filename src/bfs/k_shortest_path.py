@@ -4,18 +4,31 @@
 """ Implement the k-shortest path algorithm """
 
 # Libraries
+import heapq
 from datetime import date
 from math import floor, ceil
-from typing import Callable
+from typing import Callable, Iterable
 
-from src.bfs.bfs import Path, BFSResult, bfs, expand_path, superior_path, path_index, get_result, combine_trains
+from src.bfs.bfs import Path, BFSResult, expand_path, superior_path, path_index, get_result, combine_trains
+from src.bfs.lean_result import LeanResult, to_lean, from_lean
+from src.bfs.raptor import engines
 from src.city.line import Line
 from src.city.through_spec import ThroughSpec
 from src.city.transfer import Transfer
-from src.common.common import add_min, TimeSpec
+from src.common.common import add_min, TimeSpec, to_minutes, from_minutes
+from src.common.worker_pool import existing_pool
 from src.routing.through_train import ThroughTrain
 from src.routing.train import Train
 
+# Spur search: deviation station, arrival minute, (line, direction) arrived with (None at the start station),
+# stations and (line, direction) edges from the deviation station to exclude
+SpurSpec = tuple[str, int, tuple[str, str] | None, frozenset[str], frozenset[tuple[str, str]]]
+
+# Fewer spur searches than this run inline, the pool round trip would cost more than the searches
+_POOL_MIN_SPURS = 8
+
+_edge_cache: tuple[dict[str, dict[str, dict[str, list[Train]]]], dict[str, dict[str, int]]] | None = None
+
 
 def limit_path(path: Path, station: str, end_station: str) -> Path:
     """ Limit a path to a station """
@@ -112,21 +125,98 @@ def fix_path(path: Path, virtual_dict: dict[tuple[str, str], Transfer], start_da
     return fixed_path
 
 
+def reverse_edges(
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]]
+) -> dict[str, dict[str, int]]:
+    """ Get the minimum riding minutes between consecutive stations (reversed: to -> from -> minutes), cached """
+    global _edge_cache
+    if _edge_cache is not None and _edge_cache[0] is train_dict:
+        return _edge_cache[1]
+    edges: dict[str, dict[str, int]] = {}
+    for line_dict in train_dict.values():
+        for direction_dict in line_dict.values():
+            for train_list in direction_dict.values():
+                for train in train_list:
+                    stops = [(station, to_minutes(*arrival)) for station, arrival in train.arrival_time.items()]
+                    if train.loop_next is not None:
+                        station, arrival = next(iter(train.loop_next.arrival_time.items()))
+                        stops.append((station, to_minutes(*arrival)))
+                    for (station1, minute1), (station2, minute2) in zip(stops, stops[1:]):
+                        if station2 not in edges:
+                            edges[station2] = {}
+                        edges[station2][station1] = min(edges[station2].get(station1, minute2 - minute1),
+                                                         minute2 - minute1)
+    _edge_cache = (train_dict, edges)
+    return edges
+
+
+def travel_lower_bound(
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], virtual_dict: dict[tuple[str, str], Transfer],
+    end_station: str
+) -> dict[str, int]:
+    """ Lower bound of minutes needed from each station to end_station (riding only, no waiting or transfers) """
+    edges = reverse_edges(train_dict)
+    virtual_edges: dict[str, set[str]] = {}
+    for station1, station2 in virtual_dict.keys():
+        if station2 not in virtual_edges:
+            virtual_edges[station2] = set()
+        virtual_edges[station2].add(station1)
+
+    bound: dict[str, int] = {}
+    heap = [(0, end_station)]
+    while len(heap) > 0:
+        minutes, station = heapq.heappop(heap)
+        if station in bound:
+            continue
+        bound[station] = minutes
+        for prev_station, edge_minutes in edges.get(station, {}).items():
+            if prev_station not in bound:
+                heapq.heappush(heap, (minutes + edge_minutes, prev_station))
+        for prev_station in virtual_edges.get(station, set()):
+            if prev_station not in bound:
+                heapq.heappush(heap, (minutes, prev_station))
+    return bound
+
+
+def spur_search(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, end_station: str, spec: SpurSpec,
+    *, engine: str = "bfs", exclude_edge: bool = False, include_express: bool = False
+) -> LeanResult | None:
+    """ Search from the deviation station of spec to end_station """
+    station, minute, line_direction, exclude_stations, exclude_edges = spec
+    bfs_result = engines[engine](
+        lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
+        station, from_minutes(minute),
+        initial_line_direction=(None if line_direction is None else (lines[line_direction[0]], line_direction[1])),
+        exclude_stations=set(exclude_stations),
+        exclude_edges={station: {(lines[line_name], direction) for line_name, direction in exclude_edges}},
+        exclude_edge=exclude_edge, include_express=include_express
+    )
+    end_result = get_result(bfs_result, end_station, transfer_dict, through_dict)
+    if end_result is None:
+        return None
+    return to_lean(train_dict, end_result[1], end_result[1].shortest_path(bfs_result))
+
+
 def k_shortest_path(
     lines: dict[str, Line],
     train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
     transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
     start_station: str, end_station: str,
     start_date: date, start_time: TimeSpec,
-    k: int = 1, *, exclude_edge: bool = False, include_express: bool = False,
-    progress_callback: Callable[[int, int], None] | None = None
+    k: int = 1, *, exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs",
+    progress_callback: Callable[[int, int], None] | None = None, verbose: bool = True
 ) -> list[tuple[BFSResult, Path]]:
     """ Find the k shortest paths """
     result: list[tuple[BFSResult, Path]] = []
     candidate: list[tuple[BFSResult, Path]] = []
+    search = engines[engine]
 
     # First find p1
-    bfs_result = bfs(
+    bfs_result = search(
         lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
         start_station, start_time, exclude_edge=exclude_edge, include_express=include_express
     )
@@ -135,18 +225,33 @@ def k_shortest_path(
         return result
     first_path = end_result[1].shortest_path(bfs_result)
     result.append((end_result[1], first_path))
-    print(f"Found {len(result)}-th shortest path!")
+    result_traces = [expand_path(first_path, end_station)]
+    if verbose:
+        print(f"Found {len(result)}-th shortest path!")
     if progress_callback is not None:
         progress_callback(1, k)
+    if k == 1:
+        return result
+
+    # Spur searches are repeated across iterations (the prefix shared with the previous path gets the same
+    # exclusions), so their results are cached
+    start_minute = to_minutes(*start_time)
+    spur_cache: dict[SpurSpec, LeanResult | None] = {}
+    bound = travel_lower_bound(train_dict, virtual_dict, end_station)
+    spur_args = (lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, end_station)
+
+    # Only use a pool that the caller already started for this network, starting one costs more than a query
+    pool = existing_pool(lines, train_dict, through_dict, transfer_dict, virtual_dict)
 
     # Main loop
     while len(result) < k:
         _, pk_path = result[-1]
 
         # Iterate through all possible deviate points
-        trace = expand_path(pk_path, end_station)
+        trace = result_traces[-1]
         saved_station, saved_train = None, None
         saved_arrival_time = start_time
+        specs: list[SpurSpec] = []
         for i, (station, train) in enumerate(trace):
             if saved_station is None:
                 saved_station = station
@@ -155,9 +260,8 @@ def k_shortest_path(
 
             # Calculate exclude edges,
             # i.e., In paths p1-pk: all edges originated from station
-            exclude_edges: dict[str, set[tuple[Line, str]]] = {station: set()}
-            for _, prev_path in result:
-                prev_trace = expand_path(prev_path, end_station)
+            exclude_edges: set[tuple[Line, str]] = set()
+            for prev_trace in result_traces:
                 if len(prev_trace) <= i:
                     continue
                 prev_station, prev_train = prev_trace[i]
@@ -174,51 +278,69 @@ def k_shortest_path(
                     for direction in target_line.directions.keys():
                         if target_line.end_circle_start is None and direction == target_direction:
                             continue
-                        exclude_edges[prev_station].add((target_line, direction))
+                        exclude_edges.add((target_line, direction))
                 if isinstance(prev_train, Train):
                     if prev_train.line.end_circle_start is not None:
                         for direction in prev_train.line.directions.keys():
-                            exclude_edges[prev_station].add((prev_train.line, direction))
+                            exclude_edges.add((prev_train.line, direction))
                     else:
-                        exclude_edges[prev_station].add((prev_train.line, prev_train.direction))
+                        exclude_edges.add((prev_train.line, prev_train.direction))
                 elif i == len(prev_trace) - 1 or lines[prev_train[2][2]].end_circle_start is not None:
                     # Special case the ending + virtual transfer case
                     for direction in lines[prev_train[2][2]].directions.keys():
-                        exclude_edges[prev_station].add((lines[prev_train[2][2]], direction))
+                        exclude_edges.add((lines[prev_train[2][2]], direction))
                 else:
-                    exclude_edges[prev_station].add((lines[prev_train[2][2]], prev_train[2][3]))
+                    exclude_edges.add((lines[prev_train[2][2]], prev_train[2][3]))
 
             # Calculate deviate -> end and pin with start -> deviate together
             if station == start_station:
                 line_direction = None
                 saved_arrival_time = start_time
             elif isinstance(saved_train, Train):
-                line_direction = (saved_train.line, saved_train.direction)
+                line_direction = (saved_train.line.name, saved_train.direction)
                 saved_arrival_time = saved_train.arrival_time_virtual(saved_station)[station]
             else:
-                line_direction = (lines[saved_train[2][2]], saved_train[2][3])
+                line_direction = (saved_train[2][2], saved_train[2][3])
                 saved_arrival_time = add_min(
                     saved_arrival_time[0], (floor if exclude_edge else ceil)(saved_train[3][0]), saved_arrival_time[1]
                 )
-            bfs_result = bfs(
-                lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
-                station, saved_arrival_time,
-                initial_line_direction=(None if i == 0 else line_direction),
-                exclude_stations={x[0] for x in trace[:i]},
-                exclude_edges=exclude_edges, exclude_edge=exclude_edge, include_express=include_express
-            )
+            specs.append((
+                station, to_minutes(*saved_arrival_time), None if i == 0 else line_direction,
+                frozenset(x[0] for x in trace[:i]),
+                frozenset((line.name, direction) for line, direction in exclude_edges)
+            ))
             if saved_train != train:
                 saved_station = station
                 saved_train = train
 
-            new_result_tuple = get_result(bfs_result, end_station, transfer_dict, through_dict)
-            if new_result_tuple is None:
+        # A spur cannot make it into the final k paths if even its lower bound is worse than
+        # (k - found)-th best candidate so far
+        need = k - len(result)
+        cut = sorted(x[0].total_duration() for x in candidate)[need - 1] if len(candidate) >= need else None
+        pending = [
+            spec for spec in dict.fromkeys(specs) if spec not in spur_cache and spec[0] in bound and (
+                cut is None or spec[1] - start_minute + bound[spec[0]] <= cut
+            )
+        ]
+        lean_results: Iterable[LeanResult | None]
+        if pool is not None and len(pending) >= _POOL_MIN_SPURS:
+            lean_results = pool.imap(
+                spur_search, pending, *spur_args,
+                engine=engine, exclude_edge=exclude_edge, include_express=include_express, chunksize=1
+            )
+        else:
+            lean_results = (spur_search(
+                *spur_args, spec, engine=engine, exclude_edge=exclude_edge, include_express=include_express
+            ) for spec in pending)
+        for spec, lean_result in zip(pending, lean_results):
+            spur_cache[spec] = lean_result
+
+        for i, spec in enumerate(specs):
+            if spur_cache.get(spec) is None:
                 continue
-            new_result = new_result_tuple[1]
-            new_path = new_result.shortest_path(bfs_result)
-            new_result.initial_time = start_time[0]
-            new_result.initial_day = start_time[1]
-            final_path = merge_path(limit_path(pk_path, station, end_station), new_path, end_station)
+            _, new_path, new_result = from_lean(train_dict, start_date, spur_cache[spec])  # type: ignore
+            new_result.initial_minute = start_minute
+            final_path = merge_path(limit_path(pk_path, spec[0], end_station), new_path, end_station)
             fixed_path = fix_path(final_path, virtual_dict, start_date)
             new_candidate = (new_result, fixed_path)
 
@@ -230,8 +352,8 @@ def k_shortest_path(
 
                         # Store only the lowest duration one
                         if superior_path(
-                            bfs_result, new_candidate[0], cur_result, transfer_dict, through_dict,
-                            path1=new_candidate[1]
+                            None, new_candidate[0], cur_result, transfer_dict, through_dict,
+                            path1=new_candidate[1], path2=cur_candidate
                         ):
                             candidate[j] = new_candidate
                         break
@@ -248,7 +370,9 @@ def k_shortest_path(
             return result
         candidate_list = sorted(candidate, key=lambda p: path_index(p[0], p[1], transfer_dict, through_dict))
         result.append(candidate_list[0])
-        print(f"Found {len(result)}-th shortest path!")
+        result_traces.append(expand_path(candidate_list[0][1], end_station))
+        if verbose:
+            print(f"Found {len(result)}-th shortest path!")
         if progress_callback is not None:
             progress_callback(len(result), k)
         candidate = candidate_list[1:]
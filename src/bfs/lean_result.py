@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Compact BFS results that are cheap to send from worker processes back to the parent """
+
+# Libraries
+from __future__ import annotations
+
+import pickle
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from datetime import date
+from typing import Any
+
+from src.bfs.bfs import BFSResult, bfs, best_results
+from src.bfs.common import Path, VTSpec
+from src.city.line import Line
+from src.city.service_pattern import train_pattern, transfer_pattern
+from src.city.through_spec import ThroughSpec
+from src.city.transfer import Transfer
+from src.common.common import from_minutes
+from src.common.worker_pool import WorkerPool
+from src.routing.through_train import ThroughTrain
+from src.routing.train import Train
+
+# Train reference: line, direction, date group, index in train_dict
+TrainRef = tuple[str, str, str, int]
+
+# Leg: (station, train reference | virtual transfer spec)
+LeanLeg = tuple[str, TrainRef | VTSpec]
+
+# Lean result: station, duration, initial minute, arrival minute, force next day, previous leg, path legs
+LeanResult = tuple[str, int, int, int, bool, LeanLeg, list[LeanLeg]]
+
+_ref_cache: tuple[dict[str, dict[str, dict[str, list[Train]]]], dict[int, TrainRef]] | None = None
+
+# Pickled lean_bfs() results by (service pattern, options, (station, minute)), for the network in _lean_owner
+_lean_cache: dict[tuple, bytes] = {}
+_lean_owner: tuple[Any, ...] = ()
+_lean_size = 0
+_LEAN_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def train_refs(train_dict: dict[str, dict[str, dict[str, list[Train]]]]) -> dict[int, TrainRef]:
+    """ Get the reference of every train in train_dict (keyed by id), building it only once """
+    global _ref_cache
+    if _ref_cache is None or _ref_cache[0] is not train_dict:
+        _ref_cache = (train_dict, {
+            id(train): (line_name, direction, date_group, i)
+            for line_name, line_dict in train_dict.items()
+            for direction, direction_dict in line_dict.items()
+            for date_group, train_list in direction_dict.items()
+            for i, train in enumerate(train_list)
+        })
+    return _ref_cache[1]
+
+
+def to_lean(
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], result: BFSResult, path: Path
+) -> LeanResult:
+    """ Reduce a result and its shortest path """
+    refs = train_refs(train_dict)
+    assert result.prev_station is not None and result.prev_train is not None, result.station
+    return (
+        result.station, result.total_duration(), result.initial_minute, result.arrival_minute, result.force_next_day,
+        (result.prev_station, to_ref(refs, result.prev_train)),
+        [(station, to_ref(refs, train)) for station, train in path]
+    )
+
+
+def to_ref(refs: dict[int, TrainRef], train: Train | VTSpec) -> TrainRef | VTSpec:
+    """ Replace a train by its reference """
+    return refs[id(train)] if isinstance(train, Train) else train
+
+
+def from_ref(train_dict: dict[str, dict[str, dict[str, list[Train]]]], ref: TrainRef | VTSpec) -> Train | VTSpec:
+    """ Resolve a train reference (virtual transfers have 5 elements and are kept as-is) """
+    if len(ref) == 4:
+        return train_dict[ref[0]][ref[1]][ref[2]][ref[3]]  # type: ignore
+    return ref  # type: ignore
+
+
+def from_lean(
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], start_date: date, lean: LeanResult
+) -> tuple[int, Path, BFSResult]:
+    """ Rehydrate a lean result into (duration, path, result) """
+    station, duration, initial_minute, arrival_minute, force_next_day, (prev_station, prev_ref), legs = lean
+    return duration, [(leg_station, from_ref(train_dict, ref)) for leg_station, ref in legs], BFSResult(
+        station, start_date, initial_minute, arrival_minute, prev_station, from_ref(train_dict, prev_ref),
+        force_next_day=force_next_day
+    )
+
+
+def lean_bfs(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, data: tuple[str, int],
+    *_: Any, destinations: set[str] | None = None, **kwargs: Any
+) -> tuple[tuple[str, int], dict[str, LeanResult]]:
+    """ Run bfs() from (station, minute) and reduce it to the best result for each destination """
+    start_station, minute = data
+    results = bfs(
+        lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, start_station,
+        from_minutes(minute), **kwargs
+    )
+    lean_results: dict[str, LeanResult] = {}
+    for station, (_, result) in best_results(results, transfer_dict, through_dict).items():
+        if destinations is not None and station not in destinations:
+            continue
+        lean_results[station] = to_lean(train_dict, result, result.shortest_path(results))
+    return data, lean_results
+
+
+def sweep_lean_bfs(
+    pool: WorkerPool, data_set: Iterable[tuple[str, int]], lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, *, destinations: set[str] | None = None, **kwargs: Any
+) -> Iterator[tuple[tuple[str, int], dict[str, LeanResult]]]:
+    """ Stream lean_bfs() for each (station, minute) in order, reusing results of dates with the same service """
+    # Lean results do not refer to the date, so they are valid for every date where the same trains run
+    # and the same special transfer times apply
+    global _lean_owner, _lean_size
+    owner = (lines, train_dict, through_dict, transfer_dict, virtual_dict)
+    if len(owner) != len(_lean_owner) or any(x is not y for x, y in zip(owner, _lean_owner)):
+        _lean_cache.clear()
+        _lean_owner = owner
+        _lean_size = 0
+    prefix = (
+        train_pattern(train_dict, start_date), transfer_pattern(transfer_dict, virtual_dict, start_date),
+        None if destinations is None else frozenset(destinations), tuple(sorted(kwargs.items()))
+    )
+    data_list = list(data_set)
+
+    # Results are only kept in hits until their last use in data_list
+    remaining = Counter(data_list)
+    hits = {data: _lean_cache[(prefix, data)] for data in remaining if (prefix, data) in _lean_cache}
+    missing = [data for data in remaining if data not in hits]
+    iterator = pool.imap(
+        lean_bfs, missing, lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
+        destinations=destinations, **kwargs
+    )
+    try:
+        for data in data_list:
+            remaining[data] -= 1
+            if data in hits:
+                pickled = hits[data] if remaining[data] > 0 else hits.pop(data)
+                yield data, pickle.loads(pickled)
+                continue
+            result_data, lean_results = next(iterator)
+            assert result_data == data, (result_data, data)
+            pickled = pickle.dumps(lean_results, pickle.HIGHEST_PROTOCOL)
+            if remaining[data] > 0:
+                hits[data] = pickled
+            if len(pickled) <= _LEAN_CACHE_BYTES:
+                while _lean_size + len(pickled) > _LEAN_CACHE_BYTES:
+                    _lean_size -= len(_lean_cache.pop(next(iter(_lean_cache))))
+                _lean_cache[(prefix, data)] = pickled
+                _lean_size += len(pickled)
+            yield data, lean_results
+    finally:
+        iterator.close()
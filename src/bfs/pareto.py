@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Multi-criteria search keeping every non-dominated journey over time, transfers, walking and fare """
+
+# Libraries
+from __future__ import annotations
+
+import heapq
+from datetime import date, time
+from itertools import count
+from math import floor, ceil
+
+from src.bfs.bfs import BFSResult, Path
+from src.bfs.common import VTSpec
+from src.bfs.raptor import RaptorResult
+from src.city.line import Line
+from src.city.through_spec import ThroughSpec
+from src.city.transfer import Transfer
+from src.city.transfer_table import get_transfer_table
+from src.common.common import to_minutes
+from src.fare.fare import Fare
+from src.routing.departure_index import get_departure_index
+from src.routing.through_train import ThroughTrain, find_through_train
+from src.routing.train import Train
+
+# Criteria (all minimized): arrival minute, transfers, transfer walking distance, stairs, riding distance (tie-break)
+Criteria = tuple[int, int, int, int, int]
+
+# Non-dominated journey: result, path, fare (None if the city has no fare rules)
+Journey = tuple[BFSResult, Path, float | None]
+
+
+def criteria(label: BFSResult) -> Criteria:
+    """ Get the criteria of a label, counting a pending transfer as already walked """
+    pending = label.pending_transfer or (0.0, None, None)
+    return (
+        label.final_minute(), label.comparison_key()[1],  # type: ignore
+        label.transfer_sum[1] + (pending[1] or 0), label.transfer_sum[2] + (pending[2] or 0),
+        label.distance
+    )
+
+
+def dominates(crit1: tuple, crit2: tuple) -> bool:
+    """ Determine if crit1 is no worse than crit2 in every criterion, with the last one only breaking ties """
+    main1, main2 = crit1[:-1], crit2[:-1]
+    return all(x <= y for x, y in zip(main1, main2)) and (main1 != main2 or crit1[-1] <= crit2[-1])
+
+
+class Bag:
+    """ Set of mutually non-dominated labels, optionally bounded """
+
+    def __init__(self, max_size: int | None = None) -> None:
+        """ Constructor """
+        self.max_size = max_size
+        self.labels: list[tuple[Criteria, RaptorResult]] = []
+
+        # Whether a non-dominated label was dropped because the bag was full
+        self.truncated = False
+
+    def dominated(self, crit: Criteria) -> bool:
+        """ Determine if a label with these criteria is dominated by (or equal to) a label in the bag """
+        return any(dominates(bag_crit, crit) for bag_crit, _ in self.labels)
+
+    def add(self, crit: Criteria, label: RaptorResult) -> bool:
+        """ Add a label, returns False if it is dominated or does not fit """
+        if self.dominated(crit):
+            return False
+        self.labels = [(bag_crit, bag_label) for bag_crit, bag_label in self.labels if not dominates(crit, bag_crit)]
+        if self.max_size is not None and len(self.labels) >= self.max_size:
+            # Keep the lexicographically best labels (arrival time first)
+            self.truncated = True
+            worst = max(range(len(self.labels)), key=lambda i: self.labels[i][0])
+            if crit >= self.labels[worst][0]:
+                return False
+            del self.labels[worst]
+        self.labels.append((crit, label))
+        return True
+
+    def __contains__(self, label: RaptorResult) -> bool:
+        """ Determine if label is still in the bag """
+        return any(bag_label is label for _, bag_label in self.labels)
+
+
+def pareto_search(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, start_station: str, start_time_tuple: tuple[time, bool],
+    end_station: str | None = None,
+    *,
+    exclude_edge: bool = False,
+    include_express: bool = False,
+    max_bag: int | None = None
+) -> dict[str, list[RaptorResult]]:
+    """ Search for the non-dominated results to every station (or only end_station, which is much faster) """
+    # Same moves as bfs(), but each (station, line, direction) keeps a bag of labels instead of the best one.
+    # All criteria only grow along a path, so labels dominated by a result at end_station are dropped as well.
+    # Bags are unbounded unless max_bag is given, in which case some non-dominated results may be lost.
+    station_dict: dict[str, list[tuple[Line, str]]] = {}
+    for line in lines.values():
+        for station in line.stations:
+            if station not in station_dict:
+                station_dict[station] = []
+            for direction in line.directions.keys():
+                station_dict[station].append((line, direction))
+    virtual_station_dict: dict[str, set[str]] = {}
+    for station1, station2 in virtual_dict.keys():
+        if station1 not in virtual_station_dict:
+            virtual_station_dict[station1] = set()
+        virtual_station_dict[station1].add(station2)
+    index = get_departure_index(train_dict, start_date)
+    transfers = get_transfer_table(lines, transfer_dict, virtual_dict, start_date)
+    start_time, start_day = start_time_tuple
+    start_minute = to_minutes(start_time, start_day)
+    round_func = floor if exclude_edge else ceil
+
+    bags: dict[tuple[str, str, str], Bag] = {}
+    end_bag = Bag(max_bag)
+    heap: list[tuple[Criteria, int, tuple[str, str, str], RaptorResult]] = []
+    tie_breaker = count()
+
+    def relax(new_key: tuple[str, str, str], new_label: RaptorResult) -> None:
+        """ Add new_label to the bag of new_key if it is not dominated """
+        crit = criteria(new_label)
+        if end_station is not None and end_bag.dominated(crit):
+            return
+        if new_key not in bags:
+            bags[new_key] = Bag(max_bag)
+        if not bags[new_key].add(crit, new_label):
+            return
+        if new_key[0] == end_station:
+            end_bag.add(crit, new_label)
+        heapq.heappush(heap, (crit, next(tie_breaker), new_key, new_label))
+
+    def ride(
+        station: str, line_name: str, direction: str, cur_minute: int, board: RaptorResult | None
+    ) -> None:
+        """ Ride the next trains of (line, direction) from station """
+        for next_train in index.next_trains(station, line_name, direction, cur_minute):
+            next_minutes = next_train.minutes_virtual(station)
+            pending_transfer = None if board is None else board.pending_transfer
+            prev_train = None if board is None else board.prev_train
+            if pending_transfer is not None and isinstance(prev_train, Train) and through_dict is not None:
+                # Through-train transfers are excluded in total_transfer_duration()
+                through = find_through_train(through_dict, prev_train)
+                if through is not None and next_train in through[1].trains.values():
+                    pending_transfer = None
+            if len(next_train.line.must_include) != 0 and station not in next_train.line.must_include \
+                    and not include_express:
+                next_positions = {st: i for i, (st, _) in enumerate(next_minutes)}
+                next_stations = [
+                    (next_positions[st], next_minutes[next_positions[st]]) for st in next_train.line.must_include
+                    if st in next_positions and st != station
+                ]
+            else:
+                next_stations = list(enumerate(next_minutes))[1:]
+            visited = frozenset() if board is None else board.visited
+            for next_position, (next_station, next_minute) in next_stations:
+                if next_station in next_train.skip_stations:
+                    continue
+                if next_train.loop_next is not None and next_station not in next_train.arrival_time and \
+                        next_station in next_train.loop_next.skip_stations:
+                    continue
+                if next_station == start_station:
+                    break
+                if next_station in visited:
+                    continue
+                relax((next_station, next_train.line.name, next_train.direction), RaptorResult(
+                    next_station, start_date, start_minute, next_minute, station, next_train, parent=board
+                ).inherit(board).add_leg(
+                    station, next_train, next_position,
+                    next_train.two_station_dist(station, next_station), pending_transfer
+                ))
+
+    # Start from all lines at the start station, and all virtual transfers from it
+    for line, direction in station_dict[start_station]:
+        if line.name in train_dict and direction in train_dict[line.name]:
+            ride(start_station, line.name, direction, start_minute, None)
+    for new_station in virtual_station_dict.get(start_station, set()):
+        for line, direction in station_dict[new_station]:
+            if line.name not in train_dict or direction not in train_dict[line.name]:
+                continue
+            fr_line, fr_dir, to_line, to_dir, transfer_time, special = transfers.smallest_time(
+                start_station, new_station, line.name, direction, start_minute
+            )
+            virtual_spec: VTSpec = (
+                start_station, new_station, (fr_line, fr_dir, to_line, to_dir), transfer_time, special
+            )
+            relax((new_station, line.name, direction), RaptorResult(
+                new_station, start_date, start_minute, start_minute + round_func(transfer_time[0]),
+                start_station, virtual_spec
+            ).add_leg(start_station, virtual_spec))
+
+    while len(heap) > 0:
+        _, _, key, label = heapq.heappop(heap)
+        if label not in bags[key]:
+            continue
+        if end_station is not None and end_bag.dominated(criteria(label)) and label not in end_bag:
+            continue
+        station, line_name, direction = key
+        if station == end_station:
+            continue
+        line = lines[line_name]
+        cur_minute = label.final_minute()
+        prev_train = label.prev_train
+        if not isinstance(prev_train, Train) or prev_train.line.name != line_name:
+            ride(station, line_name, direction, cur_minute, label)
+
+        # We do not want to do two transfers in a row
+        if isinstance(prev_train, Train) and prev_train.line.name != line_name:
+            continue
+        exclude_tuple = {(line, direction2) for direction2 in line.directions.keys() if direction2 != direction}
+        for new_station, new_line, new_direction, transfer_time, special in transfers.outgoing(
+            station, line_name, direction, cur_minute
+        ):
+            if new_station in label.visited or (new_line, new_direction) in exclude_tuple:
+                continue
+            if new_line.name not in train_dict or new_direction not in train_dict[new_line.name]:
+                continue
+            transfer_spec = (line_name, direction, new_line.name, new_direction)
+            assert transfer_time is not None, (station, new_station, transfer_spec)
+            next_minute = cur_minute + round_func(transfer_time[0])
+            if new_station == station:
+                new_label = RaptorResult(
+                    station, start_date, start_minute, next_minute, label.prev_station, prev_train,
+                    parent=label.parent
+                ).inherit(label)
+                new_label.pending_transfer = transfer_time if isinstance(prev_train, Train) else None
+            else:
+                vt_spec: VTSpec = (station, new_station, transfer_spec, transfer_time, special)
+                new_label = RaptorResult(
+                    station, start_date, start_minute, next_minute, station, vt_spec, parent=label
+                ).inherit(label).add_leg(station, vt_spec)
+            relax((new_station, new_line.name, new_direction), new_label)
+
+    if any(bag.truncated for bag in bags.values()) or end_bag.truncated:
+        print(f"Warning: some non-dominated journeys were dropped because of max_bag={max_bag}")
+    fronts: dict[str, list[RaptorResult]] = {}
+    for (station, _, _), bag in bags.items():
+        if end_station is not None and station != end_station:
+            continue
+        fronts.setdefault(station, []).extend(label for _, label in bag.labels)
+    for station, labels in fronts.items():
+        candidates = sorted(((criteria(label), label) for label in labels), key=lambda x: x[0])
+        fronts[station] = [
+            label for i, (crit, label) in enumerate(candidates)
+            if not any(dominates(other, crit) for other, _ in candidates[:i])
+        ]
+    return fronts
+
+
+def pareto_journeys(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_station: str, end_station: str, start_date: date, start_time: tuple[time, bool],
+    *, fare_rules: Fare | None = None, exclude_edge: bool = False, include_express: bool = False,
+    max_bag: int | None = None
+) -> list[Journey]:
+    """ Find all the non-dominated journeys between two stations, ordered by arrival time """
+    # Fare does not add up along a path (it depends on the total distance of each fare region), so it is not kept
+    # in the bags: it only filters the journeys found, and a cheaper journey that ties with a shorter ride is lost
+    front = pareto_search(
+        lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, start_station, start_time,
+        end_station, exclude_edge=exclude_edge, include_express=include_express, max_bag=max_bag
+    ).get(end_station, [])
+    journeys: list[tuple[tuple, Journey]] = []
+    for label in front:
+        path = label.shortest_path()
+        fare = None if fare_rules is None else fare_rules.get_total_fare(lines, path, end_station, start_date)
+        journeys.append((criteria(label)[:-1] + (fare or 0.0, label.distance), (label, path, fare)))
+    return [journey for crit, journey in journeys if not any(
+        other != crit and dominates(other, crit) for other, _ in journeys
+    )]
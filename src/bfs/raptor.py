@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Implement a round-based (RAPTOR-style) search as an alternative engine to bfs() """
+
+# Libraries
+from __future__ import annotations
+
+from datetime import date, time
+from math import floor, ceil
+from typing import Any, Callable, Iterator
+
+from src.bfs.bfs import BFSResult, bfs
+from src.bfs.common import VTSpec, Path
+from src.city.line import Line
+from src.city.through_spec import ThroughSpec
+from src.city.transfer import Transfer
+from src.city.transfer_table import get_transfer_table
+from src.common.common import to_minutes, from_minutes
+from src.routing.departure_index import get_departure_index
+from src.routing.through_train import ThroughTrain, find_through_train
+from src.routing.train import Train
+
+
+class RaptorResult(BFSResult):
+    """ A BFS result that links to its parent label, so that its path does not depend on the result dict """
+
+    def __init__(self, *args: Any, parent: RaptorResult | None = None, **kwargs: Any) -> None:
+        """ Constructor """
+        super().__init__(*args, **kwargs)
+        self.parent = parent
+
+    def arrival_key(self) -> tuple[int | float | tuple, ...]:
+        """ Same as comparison_key(), but using the arrival time instead of the total duration """
+        return (self.final_minute(),) + self.comparison_key()[1:]
+
+    def shortest_path(self, results: dict[tuple[str, str, str], BFSResult] | None = None) -> Path:
+        """ Return the shortest path """
+        # Labels of different rounds may share a key, so rebuild the chain this label comes from
+        chain: dict[tuple[str, str, str], BFSResult] = {}
+        cur = self
+        while cur.parent is not None:
+            chain[cur.prev_key()] = cur.parent
+            cur = cur.parent
+        return super().shortest_path(chain)
+
+
+def raptor_rounds(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, start_station: str, start_time_tuple: tuple[time, bool],
+    *,
+    initial_line_direction: tuple[Line, str] | None = None,
+    exclude_stations: set[str] | None = None,
+    exclude_edges: dict[str, set[tuple[Line, str]]] | None = None,  # station -> line, direction
+    exclude_edge: bool = False,
+    include_express: bool = False,
+    max_rounds: int = 10,
+    best_arrival: dict[tuple[str, str, str], tuple[int, RaptorResult | None]] | None = None,
+    best_ready: dict[tuple[str, str, str], tuple[int, RaptorResult | None]] | None = None
+) -> list[dict[tuple[str, str, str], RaptorResult]]:
+    """ Search for the earliest arrival to every station, using at most i trains in the i-th round """
+    # Round i only rides from the (station, line, direction) states whose boarding time improved in round i - 1,
+    # and takes the earliest catchable train of each route set from a sorted array instead of scanning all trains.
+    # best_arrival/best_ready may be kept from a search with a later start time (see raptor_profile()),
+    # in which case only labels improving on them are returned
+    station_dict: dict[str, list[tuple[Line, str]]] = {}
+    for line in lines.values():
+        for station in line.stations:
+            if station not in station_dict:
+                station_dict[station] = []
+            for direction in line.directions.keys():
+                station_dict[station].append((line, direction))
+    virtual_station_dict: dict[str, set[str]] = {}
+    for station1, station2 in virtual_dict.keys():
+        if station1 not in virtual_station_dict:
+            virtual_station_dict[station1] = set()
+        virtual_station_dict[station1].add(station2)
+    index = get_departure_index(train_dict, start_date)
+    transfers = get_transfer_table(lines, transfer_dict, virtual_dict, start_date)
+    round_func = floor if exclude_edge else ceil
+
+    def allowed(station: str, line: Line, direction: str) -> bool:
+        """ Determine if we can board (line, direction) at station """
+        if line.name not in train_dict or direction not in train_dict[line.name]:
+            return False
+        return exclude_edges is None or station not in exclude_edges or\
+            (line, direction) not in exclude_edges[station]
+
+    start_time, start_day = start_time_tuple
+    start_minute = to_minutes(start_time, start_day)
+    initial_labels: dict[tuple[str, str, str], RaptorResult] = {}
+
+    # (station, line, direction) -> (time ready to board, label that reached here)
+    ready: dict[tuple[str, str, str], tuple[int, RaptorResult | None]] = {}
+    for line, direction in station_dict[start_station]:
+        if not allowed(start_station, line, direction):
+            continue
+        if initial_line_direction is None or (
+            line.name == initial_line_direction[0].name and direction == initial_line_direction[1]
+        ):
+            cur_minute = start_minute
+        elif line.name != initial_line_direction[0].name:
+            transfer_time, _ = transfers.transfer_time(
+                start_station, start_station, initial_line_direction[0].name, initial_line_direction[1],
+                line.name, direction, start_minute
+            )
+            cur_minute = start_minute + round_func(transfer_time[0])
+        else:
+            continue
+        ready[(start_station, line.name, direction)] = (cur_minute, None)
+    for new_station in virtual_station_dict.get(start_station, set()):
+        for line, direction in station_dict[new_station]:
+            if not allowed(start_station, line, direction):
+                continue
+            fr_line, fr_dir, to_line, to_dir, transfer_time, special = transfers.smallest_time(
+                start_station, new_station, line.name, direction, start_minute
+            )
+            next_minute = start_minute + round_func(transfer_time[0])
+            virtual_spec: VTSpec = (
+                start_station, new_station, (fr_line, fr_dir, to_line, to_dir), transfer_time, special
+            )
+            label = RaptorResult(
+                new_station, start_date, start_minute, next_minute, start_station, virtual_spec
+            ).add_leg(start_station, virtual_spec)
+            new_key = (new_station, line.name, direction)
+            initial_labels[new_key] = label
+            ready[new_key] = (next_minute, label)
+
+    def improves(
+        best: dict[tuple[str, str, str], tuple[int, RaptorResult | None]], new_key: tuple[str, str, str],
+        new_minute: int, new_label: RaptorResult | None
+    ) -> bool:
+        """ Determine if new_label is better than the best one for new_key in all the rounds so far """
+        if new_key not in best or new_minute < best[new_key][0]:
+            return True
+        best_label = best[new_key][1]
+        # Labels may come from different start times, so compare everything except the duration
+        return new_minute == best[new_key][0] and new_label is not None and best_label is not None and\
+            new_label.comparison_key()[1:] < best_label.comparison_key()[1:]
+
+    rounds = [initial_labels]
+    if best_arrival is None:
+        best_arrival = {}
+    if best_ready is None:
+        best_ready = {}
+    for new_key, new_ready in list(ready.items()):
+        if improves(best_ready, new_key, *new_ready):
+            best_ready[new_key] = new_ready
+        else:
+            del ready[new_key]
+    for _ in range(max_rounds):
+        if len(ready) == 0:
+            break
+
+        # Ride the earliest train of each route set from every improved boarding state
+        arrived: dict[tuple[str, str, str], RaptorResult] = {}
+        for (station, line_name, direction), (ready_minute, board) in ready.items():
+            for next_train in index.next_trains(station, line_name, direction, ready_minute):
+                next_minutes = next_train.minutes_virtual(station)
+                pending_transfer = None if board is None else board.pending_transfer
+                prev_train = None if board is None else board.prev_train
+                if pending_transfer is not None and isinstance(prev_train, Train) and through_dict is not None:
+                    # Through-train transfers are excluded in total_transfer_duration()
+                    through = find_through_train(through_dict, prev_train)
+                    if through is not None and next_train in through[1].trains.values():
+                        pending_transfer = None
+                if len(next_train.line.must_include) != 0 and station not in next_train.line.must_include and not (
+                    station == start_station and initial_line_direction is not None and
+                    initial_line_direction[0] == next_train.line
+                ) and not include_express:
+                    next_positions = {st: i for i, (st, _) in enumerate(next_minutes)}
+                    next_stations = [
+                        (next_positions[st], next_minutes[next_positions[st]]) for st in next_train.line.must_include
+                        if st in next_positions and st != station
+                    ]
+                else:
+                    next_stations = list(enumerate(next_minutes))[1:]
+                visited = frozenset() if board is None else board.visited
+                for next_position, (next_station, next_minute) in next_stations:
+                    if next_station in next_train.skip_stations:
+                        continue
+                    if next_train.loop_next is not None and next_station not in next_train.arrival_time and \
+                            next_station in next_train.loop_next.skip_stations:
+                        continue
+                    if exclude_stations is not None and next_station in exclude_stations:
+                        break
+                    if next_station == start_station:
+                        break
+                    if next_station in visited:
+                        continue
+                    new_key = (next_station, line_name, direction)
+                    if new_key in best_arrival and next_minute > best_arrival[new_key][0]:
+                        continue
+                    next_label = RaptorResult(
+                        next_station, start_date, start_minute, next_minute, station, next_train, parent=board
+                    ).inherit(board).add_leg(
+                        station, next_train, next_position,
+                        next_train.two_station_dist(station, next_station), pending_transfer
+                    )
+                    if improves(best_arrival, new_key, next_minute, next_label):
+                        arrived[new_key] = next_label
+                        best_arrival[new_key] = (next_minute, next_label)
+
+        # Transfer from every improved arrival state, both in-station and virtual
+        transferred: dict[tuple[str, str, str], RaptorResult] = {}
+        ready = {}
+        for (station, line_name, direction), label in arrived.items():
+            line = lines[line_name]
+            exclude_tuple = {(line, direction2) for direction2 in line.directions.keys() if direction2 != direction}
+            if exclude_edges is not None and station in exclude_edges:
+                exclude_tuple |= exclude_edges[station]
+            for new_station, new_line, new_direction, transfer_time, special in transfers.outgoing(
+                station, line_name, direction, label.arrival_minute
+            ):
+                if new_station in label.visited or (new_line, new_direction) in exclude_tuple:
+                    continue
+                if new_line.name not in train_dict or new_direction not in train_dict[new_line.name]:
+                    continue
+                transfer_spec = (line_name, direction, new_line.name, new_direction)
+                assert transfer_time is not None, (station, new_station, transfer_spec)
+                next_minute = label.arrival_minute + round_func(transfer_time[0])
+                new_key = (new_station, new_line.name, new_direction)
+                if new_key in best_ready and next_minute > best_ready[new_key][0]:
+                    continue
+                if new_station == station:
+                    new_label = RaptorResult(
+                        station, start_date, start_minute, next_minute,
+                        label.prev_station, label.prev_train, parent=label.parent
+                    ).inherit(label)
+                    new_label.pending_transfer = transfer_time
+                else:
+                    vt_spec: VTSpec = (station, new_station, transfer_spec, transfer_time, special)
+                    new_label = RaptorResult(
+                        station, start_date, start_minute, next_minute, station, vt_spec, parent=label
+                    ).inherit(label).add_leg(station, vt_spec)
+                if improves(best_ready, new_key, next_minute, new_label):
+                    transferred[new_key] = new_label
+                    ready[new_key] = best_ready[new_key] = (next_minute, new_label)
+
+        for new_key, new_label in transferred.items():
+            if new_key not in arrived or new_label.comparison_key() < arrived[new_key].comparison_key():
+                arrived[new_key] = new_label
+        rounds.append(arrived)
+    return rounds
+
+
+def raptor(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, start_station: str, start_time_tuple: tuple[time, bool],
+    **kwargs: Any
+) -> dict[tuple[str, str, str], BFSResult]:
+    """ Search for the shortest path (by time) to every station, with the same output as bfs() """
+    results: dict[tuple[str, str, str], BFSResult] = {}
+    for labels in raptor_rounds(
+        lines, train_dict, through_dict, transfer_dict, virtual_dict,
+        start_date, start_station, start_time_tuple, **kwargs
+    ):
+        for key, label in labels.items():
+            if key not in results or label.comparison_key() < results[key].comparison_key():
+                results[key] = label
+    return results
+
+
+def raptor_profile(
+    lines: dict[str, Line],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, start_station: str, minutes: list[int],
+    **kwargs: Any
+) -> Iterator[tuple[int, dict[str, RaptorResult]]]:
+    """ Search from each of the starting minutes, latest first, yielding the best result for each station """
+    # Labels found for a later start time stay valid (by waiting at the start station) for all earlier ones,
+    # so each search only expands the states it improves. The yielded results may therefore have a later
+    # initial time than the minute they are yielded for. Ties in arrival time are broken by comparison_key() over
+    # the whole journey, which may pick a better journey than the one bfs() keeps, so secondary stats may differ.
+    best_arrival: dict[tuple[str, str, str], tuple[int, RaptorResult | None]] = {}
+    best_ready: dict[tuple[str, str, str], tuple[int, RaptorResult | None]] = {}
+    best_station: dict[str, RaptorResult] = {}
+    for minute in sorted(minutes, reverse=True):
+        for labels in raptor_rounds(
+            lines, train_dict, through_dict, transfer_dict, virtual_dict,
+            start_date, start_station, from_minutes(minute), **kwargs,
+            best_arrival=best_arrival, best_ready=best_ready
+        ):
+            for (station, _, _), label in labels.items():
+                if station not in best_station or label.arrival_key() < best_station[station].arrival_key():
+                    best_station[station] = label
+        yield minute, dict(best_station)
+
+
+def pareto_results(rounds: list[dict[tuple[str, str, str], RaptorResult]]) -> dict[str, list[RaptorResult]]:
+    """ Get the arrival time/number of trains pareto set for each station, from raptor_rounds() """
+    fronts: dict[str, list[RaptorResult]] = {}
+    for labels in rounds:
+        round_best: dict[str, RaptorResult] = {}
+        for (station, _, _), label in labels.items():
+            if station not in round_best or label.comparison_key() < round_best[station].comparison_key():
+                round_best[station] = label
+        for station, label in round_best.items():
+            if station not in fronts or label.total_duration() < fronts[station][-1].total_duration():
+                fronts.setdefault(station, []).append(label)
+    return fronts
+
+
+# Search engines that can be used interchangeably
+engines: dict[str, Callable[..., dict[tuple[str, str, str], BFSResult]]] = {
+    "bfs": bfs,
+    "raptor": raptor
+}
@@ -8,9 +8,10 @@ import argparse
 import sys
 from datetime import date, time
 
-from src.bfs.avg_shortest_time import all_time_bfs, shortest_path_args, PathInfo
+from src.bfs.avg_shortest_time import all_time_bfs, shortest_path_args, PathInfo, NO_VIRTUAL, parse_city_trains
 from src.bfs.bfs import BFSResult, Path
 from src.bfs.k_shortest_path import k_shortest_path
+from src.bfs.pareto import pareto_journeys
 from src.city.ask_for_city import ask_for_city, ask_for_station_pair, ask_for_date, ask_for_time
 from src.city.city import City
 from src.city.line import Line
@@ -19,8 +20,8 @@ from src.city.transfer import Transfer
 from src.common.common import get_time_str, TimeSpec, suffix_s, average, stddev
 from src.dist_graph.adaptor import get_dist_graph, to_trains, all_time_path
 from src.dist_graph.shortest_path import shortest_path
-from src.routing.through_train import ThroughTrain, parse_through_train
-from src.routing.train import Train, parse_all_trains
+from src.routing.through_train import ThroughTrain
+from src.routing.train import Train
 
 
 def find_last_train(
@@ -28,12 +29,12 @@ def find_last_train(
     train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
     transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
     start_date: date, start_station: str, end_station: str, *,
-    exclude_edge: bool = False, include_express: bool = False
+    exclude_edge: bool = False, include_express: bool = False, engine: str = "bfs"
 ) -> TimeSpec:
     """ Calculate the last possible time to reach station """
     results = all_time_bfs(
         lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date, start_station,
-        exclude_edge=exclude_edge, include_express=include_express
+        exclude_edge=exclude_edge, include_express=include_express, engine=engine
     )
     max_result = max(results[end_station], key=lambda x: (
         x[2].arrival_time_str(), x[2].initial_time_str()
@@ -48,11 +49,9 @@ def ask_for_shortest_path(
     """ Ask information for shortest path computation """
     city = existing_city or ask_for_city()
     start, end = ask_for_station_pair(city)
-    lines = city.lines
-    train_dict = parse_all_trains(
-        list(lines.values()), include_lines=args.include_lines, exclude_lines=args.exclude_lines
+    train_dict, through_dict = parse_city_trains(
+        city, include_lines=args.include_lines, exclude_lines=args.exclude_lines
     )
-    _, through_dict = parse_through_train(train_dict, city.through_specs)
     return city, start, end, train_dict, through_dict
 
 
@@ -75,7 +74,7 @@ def ask_for_shortest_time(
                     if start in train.arrival_time:
                         all_trains.append(train)
     all_trains = sorted(all_trains, key=lambda t: get_time_str(*t.arrival_time[start]))
-    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else {}
+    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else NO_VIRTUAL
 
     start_time, start_day = ask_for_time(
         allow_first=lambda: all_trains[0].arrival_time[start],
@@ -83,7 +82,7 @@ def ask_for_shortest_time(
             lines, train_dict, through_dict,
             city.transfers, virtual_transfers,
             start_date, start, end,
-            exclude_edge=args.exclude_edge, include_express=args.include_express
+            exclude_edge=args.exclude_edge, include_express=args.include_express, engine=args.engine
         ))),
         allow_empty=allow_empty
     )
@@ -138,23 +137,32 @@ def get_kth_path(
     city, start, end, train_dict, through_dict = ask_for_shortest_path(args, existing_city=existing_city)
     start_date, start_time, start_day = ask_for_shortest_time(
         args, city, start[0], end[0], train_dict, through_dict,
-        allow_empty=(args.data_source != "time")
+        allow_empty=(args.data_source not in ["time", "pareto"])
     )
     lines = city.lines
-    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else {}
+    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else NO_VIRTUAL
 
-    if args.data_source == "time":
+    if args.data_source in ["time", "pareto"]:
         if args.exclude_single:
-            print("Warning: --exclude-single ignored in time mode.")
+            print(f"Warning: --exclude-single ignored in {args.data_source} mode.")
         if args.exclude_next_day:
-            print("Warning: --exclude-next-day ignored in time mode.")
-        num_path = args.num_path or 1
-        results = k_shortest_path(
-            lines, train_dict, through_dict, city.transfers, virtual_transfers,
-            start[0], end[0],
-            start_date, (start_time, start_day),
-            k=num_path, exclude_edge=args.exclude_edge, include_express=args.include_express
-        )
+            print(f"Warning: --exclude-next-day ignored in {args.data_source} mode.")
+        if args.data_source == "pareto":
+            if args.num_path is not None:
+                print("Warning: --num-path ignored in pareto mode.")
+            results = [(result, path) for result, path, _ in pareto_journeys(
+                lines, train_dict, through_dict, city.transfers, virtual_transfers,
+                start[0], end[0], start_date, (start_time, start_day), fare_rules=city.fare_rules,
+                exclude_edge=args.exclude_edge, include_express=args.include_express
+            )]
+        else:
+            results = k_shortest_path(
+                lines, train_dict, through_dict, city.transfers, virtual_transfers,
+                start[0], end[0],
+                start_date, (start_time, start_day),
+                k=(args.num_path or 1), exclude_edge=args.exclude_edge, include_express=args.include_express,
+                engine=args.engine
+            )
         if len(results) == 0:
             print("Unreachable!")
             sys.exit(0)
@@ -196,7 +204,7 @@ def get_kth_path(
     if start_time == time.max and start_day:
         return city, start[0], end[0], results
     for i, (k_result, k_path) in enumerate(results):
-        print(f"\nShortest Path #{i + 1}:")
+        print(("\nNon-dominated" if args.data_source == "pareto" else "\nShortest") + f" Path #{i + 1}:")
         k_result.pretty_print_path(k_path, lines, city.transfers, through_dict=through_dict, fare_rules=city.fare_rules)
     return city, start[0], end[0], results
 
@@ -204,12 +212,12 @@ def get_kth_path(
 def main() -> None:
     """ Main function """
     parser = argparse.ArgumentParser()
-    parser.add_argument("-d", "--data-source", choices=["time", "station", "distance", "fare"],
+    parser.add_argument("-d", "--data-source", choices=["time", "station", "distance", "fare", "pareto"],
                         default="time", help="Shortest path criteria")
     parser.add_argument("-k", "--num-path", type=int, help="Show first k path")
     parser.add_argument("--exclude-next-day", action="store_true",
                         help="Exclude path that spans into next day")
-    shortest_path_args(parser, have_single=True)
+    shortest_path_args(parser, have_single=True, have_engine=True)
     args = parser.parse_args()
     get_kth_path(args)
 
@@ -5,14 +5,18 @@
 
 # Libraries
 import os
+from datetime import date
 from glob import glob
 from pathlib import Path
 
 import pyjson5
 
 from src.city.carriage import Carriage, parse_carriage
+from src.city.compiled_cache import CITY_FILE, city_hash, cache_dir, trains_file, load_pickle, save_pickle, \
+    remove_outdated
 from src.city.date_group import DateGroup
 from src.city.line import Line, parse_line, station_full_name
+from src.city.service_pattern import ServicePattern, service_pattern
 from src.city.through_spec import ThroughSpec, parse_through_spec
 from src.city.transfer import Transfer, parse_transfer, parse_virtual_transfer
 from src.fare.fare import Fare, parse_fare_rules
@@ -56,6 +60,10 @@ class City:
                 all_groups[date_group.name] = date_group
         return all_groups
 
+    def service_pattern(self, cur_date: date) -> ServicePattern:
+        """ Get the service pattern of a date, shared by all the dates on which the network runs the same """
+        return service_pattern(self.lines, self.transfers, self.virtual_transfers, self.fare_rules, cur_date)
+
     def station_full_name(self, station: str) -> str:
         """ Get full name for station """
         assert station in self.station_lines, (station, self.station_lines)
@@ -100,9 +108,26 @@ def get_virtual_transfer_times(city: City) -> dict[tuple[str, str], int]:
 
 
 def parse_city(city_root: str) -> City:
-    """ Parse JSON5 files in a city directory """
+    """ Parse JSON5 files in a city directory, or load the compiled city if none of them changed """
     metadata_file = os.path.join(city_root, METADATA_FILE)
     assert os.path.exists(metadata_file), city_root
+    data_hash = city_hash(city_root)
+    city_file = os.path.join(cache_dir(city_root, data_hash), CITY_FILE)
+    city = load_pickle(city_file)
+    if city is None:
+        remove_outdated(city_root, data_hash)
+        city = parse_city_files(city_root)
+        save_pickle(city_file, city)
+
+    # Trains are compiled lazily, when they are first parsed (see parse_trains())
+    for line_obj in city.lines.values():
+        line_obj.trains_cache = trains_file(city_root, data_hash, line_obj.line_file)
+    return city
+
+
+def parse_city_files(city_root: str) -> City:
+    """ Parse JSON5 files in a city directory """
+    metadata_file = os.path.join(city_root, METADATA_FILE)
 
     with open(metadata_file) as fp:
         city_dict = pyjson5.decode_io(fp)
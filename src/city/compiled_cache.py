@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" On-disk cache of parsed cities and trains, invalidated when any JSON5 file of the city changes """
+
+# Libraries
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import shutil
+from glob import glob
+from pathlib import Path
+from typing import Any
+
+# Bump this whenever the cached classes (City, Line, Train, etc.) change in an incompatible way
+CACHE_VERSION = 4
+CACHE_ROOT = os.path.join(Path(__file__).resolve().parents[2], ".cache")
+CITY_FILE = "city.pickle"
+
+
+def city_hash(city_root: str) -> str:
+    """ Hash all the JSON5 files of a city """
+    hasher = hashlib.sha256(f"{CACHE_VERSION}\0{os.path.abspath(city_root)}".encode("utf-8"))
+    for file in sorted(glob(os.path.join(city_root, "*.json5"))):
+        hasher.update(b"\0" + os.path.basename(file).encode("utf-8") + b"\0")
+        with open(file, "rb") as fp:
+            hasher.update(fp.read())
+    return hasher.hexdigest()
+
+
+def cache_dir(city_root: str, data_hash: str) -> str:
+    """ Directory holding the compiled artifacts of a city """
+    return os.path.join(CACHE_ROOT, os.path.basename(os.path.abspath(city_root)), data_hash)
+
+
+def trains_file(city_root: str, data_hash: str, line_file: str) -> str:
+    """ File holding the compiled trains of a line (see src/routing/train_store.py) """
+    return os.path.join(cache_dir(city_root, data_hash), os.path.splitext(os.path.basename(line_file))[0] + ".trains")
+
+
+def write_atomic(file: str, data: bytes) -> None:
+    """ Write data into file, so that a concurrent reader never sees a partial file """
+    temp_file = f"{file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(temp_file, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_file, file)
+    except OSError:
+        # The cache is only an optimization
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def save_pickle(file: str, obj: Any) -> None:
+    """ Pickle obj into file """
+    try:
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, RecursionError):
+        return
+    write_atomic(file, data)
+
+
+def load_pickle(file: str) -> Any | None:
+    """ Unpickle file, or None if it is missing or unreadable """
+    if not os.path.exists(file):
+        return None
+    try:
+        with open(file, "rb") as fp:
+            return pickle.load(fp)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def remove_outdated(city_root: str, data_hash: str) -> None:
+    """ Remove the compiled artifacts of all the other versions of a city """
+    parent = os.path.dirname(cache_dir(city_root, data_hash))
+    if not os.path.exists(parent):
+        return
+    for old_hash in os.listdir(parent):
+        if old_hash != data_hash:
+            shutil.rmtree(os.path.join(parent, old_hash), ignore_errors=True)
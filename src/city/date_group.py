@@ -7,7 +7,7 @@
 from datetime import date, time
 from typing import Any
 
-from src.common.common import get_time_repr, diff_time_tuple, TimeSpec, parse_time, parse_date_opt
+from src.common.common import get_time_repr, TimeSpec, parse_time, parse_date_opt, to_minutes
 
 
 class DateGroup:
@@ -84,6 +84,10 @@ class TimeInterval:
 
     def covers(self, cur_date: date | DateGroup, cur_time: time, cur_day: bool = False) -> bool:
         """ Determine if the given date and time is within this interval """
+        return self.covers_minute(cur_date, to_minutes(cur_time, cur_day))
+
+    def covers_minute(self, cur_date: date | DateGroup, cur_minute: int) -> bool:
+        """ Determine if the given date and time (in minutes from the start of the day) is within this interval """
         for date_group, start, end in self.time_intervals:
             if date_group is not None:
                 if isinstance(cur_date, date):
@@ -91,13 +95,26 @@ class TimeInterval:
                         continue
                 elif date_group != cur_date:
                     continue
-            if start is not None and diff_time_tuple((cur_time, cur_day), start) < 0:
+            if start is not None and cur_minute < to_minutes(*start):
                 continue
-            if end is not None and diff_time_tuple((cur_time, cur_day), end) > 0:
+            if end is not None and cur_minute > to_minutes(*end):
                 continue
             return True
         return False
 
+    def minute_ranges(self, cur_date: date | DateGroup) -> list[tuple[int | None, int | None]]:
+        """ Get the minute ranges (inclusive, None if unbounded) covered on the given date """
+        ranges: list[tuple[int | None, int | None]] = []
+        for date_group, start, end in self.time_intervals:
+            if date_group is not None:
+                if isinstance(cur_date, date):
+                    if not date_group.covers(cur_date):
+                        continue
+                elif date_group != cur_date:
+                    continue
+            ranges.append((None if start is None else to_minutes(*start), None if end is None else to_minutes(*end)))
+        return ranges
+
 
 def parse_date_group(name: str, spec: dict[str, Any]) -> DateGroup:
     """ Parse the date_groups field """
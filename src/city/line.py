@@ -8,6 +8,7 @@ import os
 import re
 from datetime import date
 from functools import lru_cache
+from typing import Any
 
 import pyjson5
 
@@ -15,6 +16,7 @@ from src.city.carriage import Carriage
 from src.city.date_group import DateGroup, parse_date_group
 from src.city.train_route import TrainRoute, parse_train_route, route_dist, stations_dist
 from src.common.common import distance_str, average, circular_dist
+from src.routing.train_store import TrainStore
 from src.timetable.timetable import Timetable, parse_timetable, route_stations, route_skip_stations
 
 
@@ -51,6 +53,9 @@ class Line:
         self.date_groups: dict[str, DateGroup] = {}
         self.timetable_dict: dict[str, dict[str, dict[str, dict]]] = {}
         self.timetables_processed: dict[str, dict[str, dict[str, Timetable]]] | None = None
+        self.trains_cache: str | None = None  # File of the compiled trains, see parse_trains()
+        self.train_store: TrainStore | None = None
+        self.stored_trains: list | None = None  # Trains constructed from train_store, see stored_train()
         self.loop = False
         self.loop_last_segment = 0
         self.loop_start_route: dict[str, TrainRoute] = {}
@@ -112,6 +117,12 @@ class Line:
         """ Get string representation """
         return f"<{self.full_name()}: {self.line_str()}>"
 
+    def __getstate__(self) -> dict[str, Any]:
+        """ Trains constructed from train_store are not pickled, the unpickled line constructs its own """
+        state = self.__dict__.copy()
+        state["stored_trains"] = None
+        return state
+
     def have_express(self, direction: str | None = None) -> bool:
         """ Check if this line has express service """
         return any(route.is_express() and (direction is None or route.direction == direction)
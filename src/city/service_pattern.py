@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Canonical service pattern of a date, shared by all the dates on which everything runs the same """
+
+# Libraries
+from collections.abc import Iterable
+from datetime import date
+
+from src.city.date_group import TimeInterval
+from src.city.line import Line
+from src.city.transfer import Transfer
+from src.fare.fare import Fare
+from src.routing.train import Train
+
+# Active date groups of each line: ((line, (date group, ...)), ...)
+LinePattern = tuple[tuple[str, tuple[str, ...]], ...]
+
+# Minute ranges of each date-dependent interval on the date
+IntervalPattern = tuple[tuple[tuple[int | None, int | None], ...], ...]
+
+# Lines, transfers and fare
+ServicePattern = tuple[LinePattern, IntervalPattern, IntervalPattern]
+
+_train_patterns: dict[tuple[int, date], tuple[dict[str, dict[str, dict[str, list[Train]]]], LinePattern]] = {}
+_transfer_patterns: dict[tuple[int, int, date], tuple[
+    dict[str, Transfer], dict[tuple[str, str], Transfer], IntervalPattern
+]] = {}
+_PATTERN_CACHE_SIZE = 64
+
+
+def line_pattern(lines: Iterable[Line], cur_date: date) -> LinePattern:
+    """ Get the date groups of each line covering cur_date """
+    return tuple(sorted(
+        (line.name, tuple(name for name, date_group in line.date_groups.items() if date_group.covers(cur_date)))
+        for line in lines
+    ))
+
+
+def train_pattern(train_dict: dict[str, dict[str, dict[str, list[Train]]]], cur_date: date) -> LinePattern:
+    """ Get the date groups of train_dict covering cur_date (only those with trains matter) """
+    key = (id(train_dict), cur_date)
+    if key in _train_patterns and _train_patterns[key][0] is train_dict:
+        return _train_patterns[key][1]
+    active: dict[str, set[str]] = {}
+    for line_name, line_dict in train_dict.items():
+        active[line_name] = set()
+        for direction_dict in line_dict.values():
+            for date_group, train_list in direction_dict.items():
+                if len(train_list) > 0 and train_list[0].line.date_groups[date_group].covers(cur_date):
+                    active[line_name].add(date_group)
+    pattern = tuple(sorted((line_name, tuple(sorted(groups))) for line_name, groups in active.items()))
+    if len(_train_patterns) >= _PATTERN_CACHE_SIZE:
+        del _train_patterns[next(iter(_train_patterns))]
+    _train_patterns[key] = (train_dict, pattern)
+    return pattern
+
+
+def interval_pattern(intervals: Iterable[TimeInterval], cur_date: date) -> IntervalPattern:
+    """ Get the minute ranges of each interval on cur_date """
+    return tuple(tuple(interval.minute_ranges(cur_date)) for interval in intervals)
+
+
+def transfer_pattern(
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer], cur_date: date
+) -> IntervalPattern:
+    """ Get the special transfer times in effect on cur_date """
+    key = (id(transfer_dict), id(virtual_dict), cur_date)
+    if key in _transfer_patterns:
+        cached = _transfer_patterns[key]
+        if cached[0] is transfer_dict and cached[1] is virtual_dict:
+            return cached[2]
+    pattern = interval_pattern((
+        interval for transfer in list(transfer_dict.values()) + list(virtual_dict.values())
+        for _, interval in transfer.special_time.values()
+    ), cur_date)
+    if len(_transfer_patterns) >= _PATTERN_CACHE_SIZE:
+        del _transfer_patterns[next(iter(_transfer_patterns))]
+    _transfer_patterns[key] = (transfer_dict, virtual_dict, pattern)
+    return pattern
+
+
+def fare_pattern(fare_rules: Fare | None, cur_date: date) -> IntervalPattern:
+    """ Get the time-dependent fare rules in effect on cur_date """
+    return () if fare_rules is None else fare_rules.time_pattern(cur_date)
+
+
+def service_pattern(
+    lines: dict[str, Line], transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    fare_rules: Fare | None, cur_date: date
+) -> ServicePattern:
+    """ Get the service pattern of cur_date, equal for two dates if and only if the network runs the same """
+    return (
+        line_pattern(lines.values(), cur_date),
+        transfer_pattern(transfer_dict, virtual_dict, cur_date),
+        fare_pattern(fare_rules, cur_date)
+    )
+
+
+def group_by_pattern(
+    lines: dict[str, Line], transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    fare_rules: Fare | None, dates: Iterable[date]
+) -> dict[ServicePattern, list[date]]:
+    """ Group dates by their service pattern """
+    result: dict[ServicePattern, list[date]] = {}
+    for cur_date in dates:
+        pattern = service_pattern(lines, transfer_dict, virtual_dict, fare_rules, cur_date)
+        if pattern not in result:
+            result[pattern] = []
+        result[pattern].append(cur_date)
+    return result
@@ -9,7 +9,7 @@ from typing import Any
 
 from src.city.date_group import TimeInterval, parse_time_interval, DateGroup
 from src.city.line import Line, station_full_name
-from src.common.common import suffix_s
+from src.common.common import suffix_s, to_minutes
 
 # (from_line, from_direction, to_line, to_direction)
 TransferSpec = tuple[str, str, str, str]
@@ -67,6 +67,15 @@ class Transfer:
         cur_date: date | DateGroup, cur_time: time, cur_day: bool = False
     ) -> tuple[TransferData, bool]:
         """ Retrieve transfer time (returns true if special) """
+        return self.get_transfer_time_minute(
+            from_line, from_direction, to_line, to_direction, cur_date, to_minutes(cur_time, cur_day)
+        )
+
+    def get_transfer_time_minute(
+        self, from_line: Line | str, from_direction: str, to_line: Line | str, to_direction: str,
+        cur_date: date | DateGroup, cur_minute: int
+    ) -> tuple[TransferData, bool]:
+        """ Retrieve transfer time at cur_minute since the start of the service day (returns true if special) """
         key = (from_line.name if isinstance(from_line, Line) else from_line, from_direction,
                to_line.name if isinstance(to_line, Line) else to_line, to_direction)
         if key[0] == key[2]:
@@ -75,7 +84,7 @@ class Transfer:
             return (0.0, 0, 0), False
         if key in self.special_time:
             special_time, interval = self.special_time[key]
-            if interval.covers(cur_date, cur_time, cur_day):
+            if interval.covers_minute(cur_date, cur_minute):
                 return special_time, True
         assert key in self.transfer_time, (self, key)
         return self.transfer_time[key], False
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Transfer times compiled for one date into dense arrays over integer (line, direction) ids """
+
+# Libraries
+from datetime import date
+
+from src.city.line import Line
+from src.city.service_pattern import IntervalPattern, transfer_pattern
+from src.city.transfer import Transfer, TransferData
+
+# Outgoing transfer: new station, new line, new direction, transfer data (None if missing), special
+OutgoingTransfer = tuple[str, Line, str, TransferData | None, bool]
+
+# (id of lines, transfer dict, virtual transfer dict, special times in effect) -> (lines, transfer dicts, table)
+_table_cache: dict[tuple[int, int, int, IntervalPattern], tuple[
+    dict[str, Line], dict[str, Transfer], dict[tuple[str, str], Transfer], "TransferTable"
+]] = {}
+_TABLE_CACHE_SIZE = 8
+_NO_TRANSFER: TransferData = (0.0, 0, 0)
+
+
+class TransferGrid:
+    """ Transfer times of one station (or one virtual transfer), indexed by local from/to ids """
+
+    def __init__(self, transfer: Transfer, ids: dict[tuple[str, str], int], cur_date: date) -> None:
+        """ Constructor """
+        self.from_index: dict[int, int] = {}
+        self.to_index: dict[int, int] = {}
+        for from_l, from_d, to_l, to_d in list(transfer.transfer_time.keys()) + list(transfer.special_time.keys()):
+            self.from_index.setdefault(ids[(from_l, from_d)], len(self.from_index))
+            self.to_index.setdefault(ids[(to_l, to_d)], len(self.to_index))
+        self.width = len(self.to_index)
+        size = len(self.from_index) * self.width
+        self.base: list[TransferData | None] = [None] * size
+        for (from_l, from_d, to_l, to_d), data in transfer.transfer_time.items():
+            self.base[self.cell(ids[(from_l, from_d)], ids[(to_l, to_d)])] = data
+
+        # Special times that never apply on this date are dropped, the others become minute ranges
+        self.special: dict[int, tuple[TransferData, list[tuple[int | None, int | None]]]] = {}
+        for (from_l, from_d, to_l, to_d), (data, interval) in transfer.special_time.items():
+            ranges = interval.minute_ranges(cur_date)
+            if len(ranges) > 0:
+                self.special[self.cell(ids[(from_l, from_d)], ids[(to_l, to_d)])] = (data, ranges)
+
+    def cell(self, from_id: int, to_id: int) -> int:
+        """ Position of (from, to) in the arrays, -1 if there is no transfer data at all """
+        if from_id not in self.from_index or to_id not in self.to_index:
+            return -1
+        return self.from_index[from_id] * self.width + self.to_index[to_id]
+
+    def get(self, cell: int, cur_minute: int) -> tuple[TransferData | None, bool]:
+        """ Transfer time of a cell at cur_minute (returns true if special) """
+        if cell < 0:
+            return None, False
+        if cell in self.special:
+            data, ranges = self.special[cell]
+            for start, end in ranges:
+                if (start is None or start <= cur_minute) and (end is None or cur_minute <= end):
+                    return data, True
+        return self.base[cell], False
+
+
+class TransferTable:
+    """ All the transfers of a city on one date, with the outgoing transfers of each state precomputed """
+
+    def __init__(
+        self, lines: dict[str, Line], transfer_dict: dict[str, Transfer],
+        virtual_dict: dict[tuple[str, str], Transfer], cur_date: date
+    ) -> None:
+        """ Constructor """
+        self.cur_date = cur_date
+        self.ids: dict[tuple[str, str], int] = {}
+        station_dict: dict[str, list[tuple[Line, str]]] = {}
+        for line in lines.values():
+            for direction in line.directions.keys():
+                self.ids[(line.name, direction)] = len(self.ids)
+            for station in line.stations:
+                if station not in station_dict:
+                    station_dict[station] = []
+                for direction in line.directions.keys():
+                    station_dict[station].append((line, direction))
+        virtual_station_dict: dict[str, set[str]] = {}
+        for station1, station2 in virtual_dict.keys():
+            if station1 not in virtual_station_dict:
+                virtual_station_dict[station1] = set()
+            virtual_station_dict[station1].add(station2)
+        self.grids: dict[tuple[str, str], TransferGrid] = {
+            (station, station): TransferGrid(transfer, self.ids, cur_date)
+            for station, transfer in transfer_dict.items()
+        }
+        for key, transfer in virtual_dict.items():
+            self.grids[key] = TransferGrid(transfer, self.ids, cur_date)
+
+        # (station, line, direction) -> (new station, new line, new direction, grid, cell), in the order of bfs()
+        self.candidates: dict[tuple[str, str, str], list[tuple[str, Line, str, TransferGrid | None, int]]] = {}
+        for station, line_directions in station_dict.items():
+            for line, direction in line_directions:
+                from_id = self.ids[(line.name, direction)]
+                candidates: list[tuple[str, Line, str, TransferGrid | None, int]] = []
+                grid = self.grids.get((station, station))
+                for new_line, new_direction in line_directions:
+                    if new_line.name == line.name:
+                        # For now, don't consider same-line transfers
+                        continue
+                    cell = -1 if grid is None else grid.cell(from_id, self.ids[(new_line.name, new_direction)])
+                    candidates.append((station, new_line, new_direction, grid, cell))
+                for new_station in virtual_station_dict.get(station, set()):
+                    grid = self.grids[(station, new_station)]
+                    for new_line, new_direction in station_dict[new_station]:
+                        if new_line.name == line.name:
+                            candidates.append((new_station, new_line, new_direction, None, -1))
+                            continue
+                        cell = grid.cell(from_id, self.ids[(new_line.name, new_direction)])
+                        candidates.append((new_station, new_line, new_direction, grid, cell))
+                self.candidates[(station, line.name, direction)] = candidates
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<TransferTable for {self.cur_date}: {len(self.ids)} directions, {len(self.grids)} transfers>"
+
+    def transfer_time(
+        self, station: str, new_station: str, from_line: str, from_direction: str,
+        to_line: str, to_direction: str, cur_minute: int
+    ) -> tuple[TransferData, bool]:
+        """ Same as Transfer.get_transfer_time_minute() """
+        if from_line == to_line:
+            return _NO_TRANSFER, False
+        grid = self.grids[(station, new_station)]
+        data, special = grid.get(grid.cell(self.ids[(from_line, from_direction)], self.ids[(to_line, to_direction)]),
+                                 cur_minute)
+        assert data is not None, (station, new_station, from_line, from_direction, to_line, to_direction)
+        return data, special
+
+    def outgoing(self, station: str, line_name: str, direction: str, cur_minute: int) -> list[OutgoingTransfer]:
+        """ All the in-station and virtual transfers from (station, line, direction) at cur_minute """
+        result: list[OutgoingTransfer] = []
+        candidates = self.candidates.get((station, line_name, direction), [])
+        for new_station, new_line, new_direction, grid, cell in candidates:
+            if grid is None and cell < 0 and new_station != station:
+                # Virtual transfer to the same line
+                result.append((new_station, new_line, new_direction, _NO_TRANSFER, False))
+                continue
+            data, special = (None, False) if grid is None else grid.get(cell, cur_minute)
+            result.append((new_station, new_line, new_direction, data, special))
+        return result
+
+    def smallest_time(
+        self, station: str, new_station: str, to_line: str, to_direction: str, cur_minute: int
+    ) -> tuple[str, str, str, str, TransferData, bool]:
+        """ Same as Transfer.get_smallest_time() with a target line and direction, over all the source lines """
+        grid = self.grids[(station, new_station)]
+        to_id = self.ids[(to_line, to_direction)]
+        best: tuple[str, str, str, str, TransferData, bool] | None = None
+        for (from_line, from_direction), from_id in self.ids.items():
+            cell = grid.cell(from_id, to_id)
+            if cell < 0 or grid.base[cell] is None:
+                continue
+            data, special = (_NO_TRANSFER, False) if from_line == to_line else grid.get(cell, cur_minute)
+            assert data is not None, (station, new_station, from_line, from_direction, to_line, to_direction)
+            if best is None or data < best[4]:
+                best = (from_line, from_direction, to_line, to_direction, data, special)
+        assert best is not None, (station, new_station, to_line, to_direction)
+        return best
+
+
+def get_transfer_table(
+    lines: dict[str, Line], transfer_dict: dict[str, Transfer],
+    virtual_dict: dict[tuple[str, str], Transfer], cur_date: date
+) -> TransferTable:
+    """ Get the transfer table of a city on a date, built only once for all dates with the same special times """
+    key = (id(lines), id(transfer_dict), id(virtual_dict), transfer_pattern(transfer_dict, virtual_dict, cur_date))
+    if key in _table_cache:
+        cached = _table_cache[key]
+        if cached[0] is lines and cached[1] is transfer_dict and cached[2] is virtual_dict:
+            return cached[3]
+    if len(_table_cache) >= _TABLE_CACHE_SIZE:
+        del _table_cache[next(iter(_table_cache))]
+    table = TransferTable(lines, transfer_dict, virtual_dict, cur_date)
+    _table_cache[key] = (lines, transfer_dict, virtual_dict, table)
+    return table
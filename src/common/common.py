@@ -12,6 +12,7 @@ import re
 from _ctypes import PyObj_FromPtr  # type: ignore
 from collections.abc import Iterable, Callable, Sequence, Mapping, Iterator
 from datetime import datetime, date, time, timedelta
+from functools import lru_cache
 from math import sqrt, sin, cos, radians
 from typing import TypeVar, Any
 
@@ -269,8 +270,9 @@ def to_minutes(cur_time: time, cur_day: bool = False) -> int:
     return cur_time.hour * 60 + cur_time.minute + (24 * 60 if cur_day else 0)
 
 
+@lru_cache(maxsize=None)
 def from_minutes(minutes: int) -> TimeSpec:
-    """ Convert from minutes """
+    """ Convert from minutes (there are only a few thousands of them, so the results are shared) """
     if minutes >= 24 * 60:
         next_day = True
         minutes -= 24 * 60
@@ -525,34 +527,22 @@ def try_numerical(test_str: Any) -> Any:
 def moving_average(data: Sequence[T], key: Callable[[T], int | float], moving_min: int,
                    include_edge: bool = False) -> tuple[float, float, tuple[T, T, float], tuple[T, T, float]]:
     """ Calculate moving average, return avg & min/max interval """
-    assert len(data) > 0, data
-    cur_min: float | None = None
-    cur_min_beg: T | None = None
-    cur_min_end: T | None = None
-    cur_max: float | None = None
-    cur_max_beg: T | None = None
-    cur_max_end: T | None = None
-    cur_sum: list[float] = []
-    total_length = max(1, len(data) - (0 if include_edge else moving_min))
-    for i in range(1 - moving_min if include_edge else 0, total_length):
-        cur_slice = [key(x) for x in data[max(0, i):i + moving_min]]
-        moving_avg = average(cur_slice)
-        if cur_min is None or cur_min > moving_avg:
-            cur_min = moving_avg
-            cur_min_beg, cur_min_end = data[max(0, i)], data[min(len(data), i + moving_min) - 1]
-        if cur_max is None or cur_max < moving_avg:
-            cur_max = moving_avg
-            cur_max_beg, cur_max_end = data[max(0, i)], data[min(len(data), i + moving_min) - 1]
-        cur_sum.append(moving_avg)
-    assert cur_min and cur_min_beg and cur_min_end and cur_max and cur_max_beg and cur_max_end, \
-        {x: key(x) for x in data}
-    return average(cur_sum), stddev(cur_sum), (cur_min_beg, cur_min_end, cur_min), (cur_max_beg, cur_max_end, cur_max)
-
-
-def moving_average_dict(data: Mapping[T, int | float], moving_min: int,
-                        include_edge: bool = False) -> tuple[float, float, tuple[T, T, float], tuple[T, T, float]]:
-    """ Calculate moving average on a dictionary, return avg & min/max interval """
-    return moving_average(list(data.keys()), lambda x: data[x], moving_min, include_edge)
+    return moving_average_batch([data], key, moving_min, include_edge)[0]
+
+
+def moving_average_batch(
+    data_list: Sequence[Sequence[T]], key: Callable[[T], int | float], moving_min: int, include_edge: bool = False
+) -> list[tuple[float, float, tuple[T, T, float], tuple[T, T, float]]]:
+    """ Calculate moving average of many sequences at once """
+    # Imported here so that modules using only the helpers above do not need numpy
+    from src.common.windowed import WindowStats
+    assert all(len(data) > 0 for data in data_list), data_list
+    stats = WindowStats([[key(x) for x in data] for data in data_list], moving_min, include_edge=include_edge)
+    return [
+        (avg, dev, (data[min_beg], data[min_end], min_value), (data[max_beg], data[max_end], max_value))
+        for data, (avg, dev, (min_beg, min_end, min_value), (max_beg, max_end, max_value))
+        in zip(data_list, stats.summary())
+    ]
 
 
 def zero_div(a: float, b: float) -> float:
@@ -564,11 +554,6 @@ def zero_div(a: float, b: float) -> float:
     return a / b
 
 
-def arg_minmax(data: Mapping[T, int | float]) -> tuple[T, T]:
-    """ Calculate argmin & argmax """
-    return min(data.keys(), key=lambda x: data[x]), max(data.keys(), key=lambda x: data[x])
-
-
 def shift_max(orig: int, clamp: int, n: int) -> int:
     """ Turn 0...N into clamp...N + 0...clamp - 1 """
     assert 0 <= orig < n and 0 <= clamp < n, (orig, clamp, n)
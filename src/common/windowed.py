@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Sliding-window statistics of many series at once, in linear time with prefix sums """
+
+# Libraries
+from collections.abc import Sequence
+
+import numpy as np
+
+# Grouped stats: average, stddev, index of the first minimum and first maximum of each group
+GroupedStats = tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def grouped_stats(values: np.ndarray, groups: np.ndarray, group_count: int) -> GroupedStats:
+    """ Average, sample stddev and first argmin/argmax of the values in each group (every group must be non-empty) """
+    counts = np.bincount(groups, minlength=group_count)
+    assert (counts > 0).all(), counts
+    avg = np.bincount(groups, weights=values, minlength=group_count) / counts
+    squares = np.bincount(groups, weights=(values - avg[groups]) ** 2, minlength=group_count)
+    stddev = np.sqrt(np.divide(squares, counts - 1, out=np.zeros(group_count), where=(counts > 1)))
+
+    # After sorting by (group, value, index), the first entry of each group is its first minimum
+    index = np.arange(len(values))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    argmin = np.lexsort((index, values, groups))[starts]
+    argmax = np.lexsort((index, -values, groups))[starts]
+    return avg, stddev, argmin, argmax
+
+
+class WindowStats:
+    """ Moving averages of many series, with the average, stddev and extremes of the windows of each series """
+
+    def __init__(
+        self, series: Sequence[Sequence[int | float]], window: int, *,
+        include_edge: bool = False, at_least_one: bool = True
+    ) -> None:
+        """ Constructor """
+        assert window > 0, window
+        self.window = window
+        lengths = np.array([len(values) for values in series], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+        values = np.concatenate([np.asarray(values) for values in series]) if len(series) > 0 else np.zeros(0)
+
+        # Windows start at 0 ... n - window - 1 (or one window for short series), and with include_edge, also cover
+        # the partial windows hanging over both edges
+        if include_edge:
+            window_counts = lengths + window - 1
+        else:
+            window_counts = np.maximum(lengths - window, 1 if at_least_one else 0)
+        window_counts[lengths == 0] = 0
+        self.series = np.repeat(np.arange(len(series)), window_counts)
+        first_window = np.concatenate(([0], np.cumsum(window_counts)[:-1]))
+        local = np.arange(len(self.series)) - first_window[self.series] - (window - 1 if include_edge else 0)
+        self.starts = np.maximum(local, 0)
+        self.ends = np.minimum(local + window, lengths[self.series])
+
+        # Integer series keep exact prefix sums, so each mean is the same as sum(window) / len(window)
+        prefix = np.concatenate(([0], np.cumsum(values)))
+        base = self.offsets[self.series]
+        self.means = (prefix[base + self.ends] - prefix[base + self.starts]) / (self.ends - self.starts)
+        self.window_offsets = np.concatenate(([0], np.cumsum(window_counts)))
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<WindowStats: {len(self.offsets) - 1} series, {len(self.means)} windows of {self.window}>"
+
+    def series_means(self, index: int) -> np.ndarray:
+        """ Moving averages of one series """
+        return self.means[self.window_offsets[index]:self.window_offsets[index + 1]]
+
+    def series_starts(self, index: int) -> np.ndarray:
+        """ Start index of each window of one series """
+        return self.starts[self.window_offsets[index]:self.window_offsets[index + 1]]
+
+    def summary(self) -> list[tuple[float, float, tuple[int, int, float], tuple[int, int, float]]]:
+        """ Average, stddev, (first, last index, value) of the min and max moving average for each series """
+        avg, stddev, argmin, argmax = grouped_stats(self.means, self.series, len(self.offsets) - 1)
+        return [(
+            float(avg[i]), float(stddev[i]),
+            (int(self.starts[argmin[i]]), int(self.ends[argmin[i]]) - 1, float(self.means[argmin[i]])),
+            (int(self.starts[argmax[i]]), int(self.ends[argmax[i]]) - 1, float(self.means[argmax[i]]))
+        ) for i in range(len(self.offsets) - 1)]
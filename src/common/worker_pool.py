@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" A long-lived process pool whose workers receive the (large) shared network only once """
+
+# Libraries
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Objects shared with the workers of the current pool, filled by the initializer in each worker
+_shared: tuple[Any, ...] = ()
+_pool: WorkerPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+class SharedRef:
+    """ Reference to the i-th shared object, resolved inside the worker """
+
+    def __init__(self, index: int) -> None:
+        """ Constructor """
+        self.index = index
+
+    def __repr__(self) -> str:
+        """ Get string representation """
+        return f"<SharedRef {self.index}>"
+
+
+def init_worker(shared: tuple[Any, ...]) -> None:
+    """ Worker initializer: remember the shared objects (inherited when forking, pickled once otherwise) """
+    global _shared
+    _shared = shared
+
+
+def resolve(value: Any) -> Any:
+    """ Replace a shared reference by the object itself """
+    return _shared[value.index] if isinstance(value, SharedRef) else value
+
+
+def run_chunk(func: Callable[..., T], args: tuple[Any, ...], kwargs: dict[str, Any], chunk: list[Any]) -> list[T]:
+    """ Run func on each item of a chunk inside the worker """
+    args = tuple(resolve(arg) for arg in args)
+    kwargs = {key: resolve(value) for key, value in kwargs.items()}
+    return [func(*args, item, **kwargs) for item in chunk]
+
+
+class WorkerPool:
+    """ Process pool initialized once with the shared objects, accepting small task descriptors """
+
+    def __init__(self, shared: tuple[Any, ...], max_workers: int | None = None) -> None:
+        """ Constructor """
+        self.shared = shared
+        self.use_process = mp.parent_process() is None
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor: Executor | None = None
+        self.pending: set[Future] = set()
+        self.lock = threading.Lock()
+
+        # Number of imap() iterators still running, and whether to stop the workers once there are none
+        self.active = 0
+        self.retired = False
+
+    def __repr__(self) -> str:
+        """ Get string representation """
+        return f"<WorkerPool ({'process' if self.use_process else 'thread'}, {len(self.shared)} shared objects, " + \
+            f"{self.active} active)>"
+
+    def start(self) -> Executor:
+        """ Start the workers if they are not running (must hold the lock) """
+        if self.executor is None:
+            if self.use_process:
+                self.executor = ProcessPoolExecutor(
+                    self.max_workers, initializer=init_worker, initargs=(self.shared,)
+                )
+            else:
+                # Already inside a worker process, fall back to threads
+                self.executor = ThreadPoolExecutor(self.max_workers)
+        return self.executor
+
+    def holds(self, shared: tuple[Any, ...]) -> bool:
+        """ Determine if the workers already have exactly these shared objects """
+        return len(shared) == len(self.shared) and all(x is y for x, y in zip(shared, self.shared))
+
+    def to_ref(self, value: Any) -> Any:
+        """ Replace a shared object by its reference """
+        if not self.use_process:
+            return value
+        for i, obj in enumerate(self.shared):
+            if value is obj:
+                return SharedRef(i)
+        return value
+
+    def imap(self, func: Callable[..., T], items: Iterable[Any], *args: Any,
+             chunksize: int = 50, **kwargs: Any) -> Iterator[T]:
+        """ Stream func(*args, item, **kwargs) for each item in order, shared objects in args are not sent """
+        # Only 2 chunks per worker are in flight, so results wait for the consumer in bounded memory
+        args = tuple(self.to_ref(arg) for arg in args)
+        kwargs = {key: self.to_ref(value) for key, value in kwargs.items()}
+        item_iter = iter(items)
+        futures: deque[Future] = deque()
+        with self.lock:
+            executor = self.start()
+            self.active += 1
+
+        def submit_next() -> bool:
+            """ Submit the next chunk, returns False if there are no more items """
+            chunk = list(islice(item_iter, chunksize))
+            if len(chunk) == 0:
+                return False
+            future = executor.submit(run_chunk, func, args, kwargs, chunk)
+            with self.lock:
+                self.pending.add(future)
+            futures.append(future)
+            return True
+
+        try:
+            while len(futures) < 2 * self.max_workers and submit_next():
+                pass
+            while len(futures) > 0:
+                future = futures.popleft()
+                results = future.result()
+                with self.lock:
+                    self.pending.discard(future)
+                submit_next()
+                yield from results
+        finally:
+            # Consumer stopped early (break, exception or cancel())
+            for future in futures:
+                future.cancel()
+            with self.lock:
+                self.pending.difference_update(futures)
+                self.active -= 1
+                if self.retired and self.active == 0:
+                    self.stop()
+
+    def cancel(self) -> None:
+        """ Cancel all tasks not yet started """
+        with self.lock:
+            for future in self.pending:
+                future.cancel()
+            self.pending.clear()
+
+    def stop(self) -> None:
+        """ Stop the workers, they are started again if the pool is used later (must hold the lock) """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def retire(self) -> None:
+        """ Stop the workers once no iterator uses them any more """
+        with self.lock:
+            self.retired = True
+            if self.active == 0:
+                self.stop()
+
+    def shutdown(self) -> None:
+        """ Stop all the workers, even if some iterator still uses them """
+        self.cancel()
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_pool(*shared: Any) -> WorkerPool:
+    """ Get the pool of this process, replacing it only if the shared objects changed """
+    # The replaced pool keeps running until the iterators of other callers are done with it
+    global _pool
+    with _POOL_LOCK:
+        if _pool is None or not _pool.holds(shared):
+            if _pool is not None:
+                _pool.retire()
+            _pool = WorkerPool(shared)
+        return _pool
+
+
+def existing_pool(*shared: Any) -> WorkerPool | None:
+    """ Get the pool of this process only if it already holds these shared objects (never starts one) """
+    with _POOL_LOCK:
+        return _pool if _pool is not None and _pool.holds(shared) else None
+
+
+def shutdown_pool() -> None:
+    """ Stop the pool of this process, if any """
+    global _pool
+    with _POOL_LOCK:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -4,11 +4,8 @@
 """ A class for adapting city/line to normal graph """
 
 # Libraries
-import multiprocessing as mp
 from collections.abc import Callable
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, time, timedelta
-from functools import partial
 from math import floor, ceil
 
 from tqdm import tqdm
@@ -19,11 +16,17 @@ from src.bfs.common import AbstractPath, Path as BFSPath
 from src.city.city import City
 from src.city.line import Line
 from src.city.transfer import Transfer
-from src.common.common import add_min_tuple, get_time_str, diff_time_tuple, from_minutes, get_time_repr
+from src.common.common import add_min_tuple, get_time_str, diff_time_tuple, from_minutes, get_time_repr, to_minutes
+from src.common.worker_pool import get_pool
+from src.dist_graph.graph_view import get_graph_view
 from src.dist_graph.shortest_path import Graph, Path, shortest_path
 from src.routing.train import Train
 
 
+# Graph last handed to the worker pool, reused while equal so that rebuilt graphs keep the pool
+_pool_graph: Graph | None = None
+
+
 def add_edge(graph: Graph, from_station: str, to_station: str, dist: int, line: Line | None) -> None:
     """ Add an edge to the graph """
     if from_station not in graph:
@@ -66,45 +69,10 @@ def get_dist_graph(
     include_virtual: bool = True, include_circle: bool = True, ignore_dists: bool = False
 ) -> Graph:
     """ Get the distance graph for a city """
-    lines = city.lines
-    graph: Graph = {}
-    if isinstance(include_lines, str):
-        include_lines = {x.strip() for x in include_lines.split(",")}
-    if isinstance(exclude_lines, str):
-        exclude_lines = {x.strip() for x in exclude_lines.split(",")}
-    for line_name, line in lines.items():
-        if include_lines is not None and line_name not in include_lines:
-            continue
-        if exclude_lines is not None and line_name in exclude_lines:
-            continue
-        for direction in line.directions.keys():
-            stations = line.direction_stations(direction)
-            dists = line.direction_dists(direction)
-            if line.end_circle_start is not None and not include_circle and line.end_circle_start in stations:
-                index = stations.index(line.end_circle_start)
-                if stations == line.stations:
-                    stations = stations[index:]
-                    dists = dists[index:]
-                else:
-                    # Assume reverse
-                    index = len(stations) - index - 1
-                    stations = stations[:-index]
-                    dists = dists[:-index]
-            for i, dist in enumerate(dists):
-                if i == len(stations) - 1:
-                    assert line.loop, (line, stations, dists)
-                    end = 0
-                else:
-                    end = i + 1
-                add_edge(graph, stations[i], stations[end], 1 if ignore_dists else dist, line)
-                
-    # Add transfers
-    if include_virtual:
-        for from_station, to_station in city.virtual_transfers.keys():
-            if from_station not in graph or to_station not in graph:
-                continue
-            add_edge(graph, from_station, to_station, 0, None)
-    return graph
+    return get_graph_view(
+        city, include_lines=include_lines, exclude_lines=exclude_lines,
+        include_virtual=include_virtual, include_circle=include_circle, ignore_dists=ignore_dists
+    ).to_graph()
 
 
 def simplify_path(path: Path, end_station: str) -> AbstractPath:
@@ -208,8 +176,7 @@ def to_trains(
         cur_tuple = add_min_tuple(cur_tuple, (floor if exclude_edge else ceil)(transfer_time[0]))
 
     return BFSResult(
-        end_station, start_date, start_tuple[0], start_tuple[1], cur_tuple[0], cur_tuple[1],
-        force_next_day=force_next_day
+        end_station, start_date, to_minutes(*start_tuple), to_minutes(*cur_tuple), force_next_day=force_next_day
     ), final_new_path
 
 
@@ -240,18 +207,20 @@ def all_bfs_path(
 ) -> dict[str, dict[str, tuple[Path, BFSResult, BFSPath]]]:
     """ Get BFS paths between all pairs of stations """
     with tqdm(desc="Calculating Paths", total=len(list(graph.keys()))) as bar:
-        executor_cls = ProcessPoolExecutor if mp.parent_process() is None else ThreadPoolExecutor
-        with executor_cls() as executor:
-            processed_dict: dict[str, dict[str, tuple[Path, BFSResult, BFSPath]]] = {}
-            work = partial(
-                single_station_bfs, city, graph, train_dict,
-                start_date, start_time, start_day, data_source=data_source, fare_mode=fare_mode
-            )
-            iterator = executor.map(work, list(graph.keys()), chunksize=50)
-            for start_station, result in iterator:
-                bar.set_description("Calculating " + city.station_full_name(start_station))
-                bar.update()
-                processed_dict[start_station] = result
+        processed_dict: dict[str, dict[str, tuple[Path, BFSResult, BFSPath]]] = {}
+        global _pool_graph
+        if _pool_graph is None or _pool_graph != graph:
+            _pool_graph = graph
+        graph = _pool_graph
+        pool = get_pool(city, graph, train_dict)
+        iterator = pool.imap(
+            single_station_bfs, list(graph.keys()), city, graph, train_dict,
+            start_date, start_time, start_day, data_source=data_source, fare_mode=fare_mode
+        )
+        for start_station, result in iterator:
+            bar.set_description("Calculating " + city.station_full_name(start_station))
+            bar.update()
+            processed_dict[start_station] = result
     return processed_dict
 
 
@@ -288,21 +257,19 @@ def all_time_path(
         ))
     )
     with tqdm(desc=(prefix + "Calculating " + city.station_full_name(start_station)), total=len(all_list)) as bar:
-        executor_cls = ProcessPoolExecutor if mp.parent_process() is None else ThreadPoolExecutor
-        with executor_cls() as executor:
-            work = partial(
-                to_trains_wrap, city.lines, train_dict, city.transfers, city.virtual_transfers,
-                path, end_station, start_date,
-                exclude_edge=exclude_edge
-            )
-            iterator = executor.map(work, all_list, chunksize=50)
-            for start_time, start_day, (bfs_result, bfs_path) in iterator:
-                bar.set_description(prefix + "Calculating " + city.station_full_name(start_station) +
-                                    " at " + get_time_repr(start_time, start_day))
-                bar.update()
-                if exclude_next_day and bfs_result.force_next_day:
-                    continue
-                results.append((bfs_result.total_duration(), bfs_path, bfs_result))
+        pool = get_pool(city.lines, train_dict, city.transfers, city.virtual_transfers)
+        iterator = pool.imap(
+            to_trains_wrap, all_list, city.lines, train_dict, city.transfers, city.virtual_transfers,
+            path, end_station, start_date,
+            exclude_edge=exclude_edge
+        )
+        for start_time, start_day, (bfs_result, bfs_path) in iterator:
+            bar.set_description(prefix + "Calculating " + city.station_full_name(start_station) +
+                                " at " + get_time_repr(start_time, start_day))
+            bar.update()
+            if exclude_next_day and bfs_result.force_next_day:
+                continue
+            results.append((bfs_result.total_duration(), bfs_path, bfs_result))
     return reconstruct_paths(results)
 
 
@@ -341,22 +308,20 @@ def all_time_paths(
         ))
     )]
     with tqdm(desc="Calculating", total=len(all_list)) as bar:
-        executor_cls = ProcessPoolExecutor if mp.parent_process() is None else ThreadPoolExecutor
-        with executor_cls() as executor:
-            work = partial(
-                to_trains_wrap_multi, paths, city.lines, train_dict, city.transfers, city.virtual_transfers,
-                start_date, exclude_edge=exclude_edge
-            )
-            iterator = executor.map(work, all_list, chunksize=50)
-            for index, start_time, start_day, (bfs_result, bfs_path) in iterator:
-                prefix_str = "" if prefix is None else prefix(index, paths[index][0], paths[index][1])
-                bar.set_description(prefix_str + "Calculating " + city.station_full_name(paths[index][0][0][0]) +
-                                    " at " + get_time_repr(start_time, start_day))
-                if bar.update() and progress_callback is not None:
-                    progress_callback(bar.n, len(all_list))
-                if exclude_next_day and bfs_result.force_next_day:
-                    continue
-                results[index].append((bfs_result.total_duration(), bfs_path, bfs_result))
+        pool = get_pool(city.lines, train_dict, city.transfers, city.virtual_transfers)
+        iterator = pool.imap(
+            to_trains_wrap_multi, all_list, paths, city.lines, train_dict, city.transfers, city.virtual_transfers,
+            start_date, exclude_edge=exclude_edge
+        )
+        for index, start_time, start_day, (bfs_result, bfs_path) in iterator:
+            prefix_str = "" if prefix is None else prefix(index, paths[index][0], paths[index][1])
+            bar.set_description(prefix_str + "Calculating " + city.station_full_name(paths[index][0][0][0]) +
+                                " at " + get_time_repr(start_time, start_day))
+            if bar.update() and progress_callback is not None:
+                progress_callback(bar.n, len(all_list))
+            if exclude_next_day and bfs_result.force_next_day:
+                continue
+            results[index].append((bfs_result.total_duration(), bfs_path, bfs_result))
     if progress_callback is not None:
         progress_callback(len(all_list), len(all_list))
     return {index: reconstruct_paths(inner_dict) for index, inner_dict in results.items()}
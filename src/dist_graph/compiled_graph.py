@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Dist graph compiled into CSR arrays, for vectorized all-pairs shortest paths """
+
+# Libraries
+import numpy as np
+from scipy.sparse import csr_matrix  # type: ignore
+from scipy.sparse.csgraph import dijkstra  # type: ignore
+
+from src.city.line import Line
+from src.dist_graph.graph_view import GraphView
+from src.dist_graph.shortest_path import Graph, Path
+
+# Edge weight is length * HOP_SCALE + 1: among paths of equal length the one with fewer edges wins,
+# and zero-length virtual transfers are still stored as edges
+HOP_SCALE = 1 << 12
+
+# (view, ignore_dists) -> compiled graph
+_compiled_cache: dict[tuple[GraphView, bool], "CompiledGraph"] = {}
+_COMPILED_CACHE_SIZE = 32
+
+
+class CompiledGraph:
+    """ Dist graph with integer station ids, CSR edge arrays and per-edge line ids """
+
+    def __init__(self, graph: Graph | GraphView, *, ignore_dists: bool = False) -> None:
+        """ Constructor """
+        adjacent: dict[str, list[tuple[str, Line | None, int]]] = {}
+        if isinstance(graph, GraphView):
+            for i in graph.edge_ids():
+                from_station, to_station, line = graph.base.edges[i]
+                adjacent.setdefault(from_station, []).append((to_station, line, graph.base.lengths[i]))
+        else:
+            for from_station, edges in graph.items():
+                adjacent[from_station] = [
+                    (to_station, line, edge_dist) for (to_station, line), edge_dist in edges.items()
+                ]
+        self.stations: list[str] = list(adjacent.keys())
+        for edge_list in adjacent.values():
+            for to_station, _, _ in edge_list:
+                if to_station not in adjacent and to_station not in self.stations:
+                    self.stations.append(to_station)
+        self.ids = {station: i for i, station in enumerate(self.stations)}
+        self.lines: list[Line] = []
+        line_ids: dict[str, int] = {}
+        self.line_of: dict[tuple[int, int], Line | None] = {}
+
+        # Keep the shortest of parallel edges (the first one on ties, same as shortest_path())
+        indptr = [0]
+        indices: list[int] = []
+        lengths: list[int] = []
+        edge_lines: list[int] = []
+        for station in self.stations:
+            best: dict[int, tuple[int, Line | None]] = {}
+            for to_station, line, edge_dist in adjacent.get(station, []):
+                length = 1 if ignore_dists else edge_dist
+                to_id = self.ids[to_station]
+                if to_id not in best or length < best[to_id][0]:
+                    best[to_id] = (length, line)
+            for to_id, (length, line) in sorted(best.items()):
+                if line is not None and line.name not in line_ids:
+                    line_ids[line.name] = len(self.lines)
+                    self.lines.append(line)
+                indices.append(to_id)
+                lengths.append(length)
+                edge_lines.append(-1 if line is None else line_ids[line.name])
+                self.line_of[(self.ids[station], to_id)] = line
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int32)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.edge_lines = np.array(edge_lines, dtype=np.int32)
+        self.matrix = csr_matrix(
+            ((self.lengths * HOP_SCALE + 1).astype(np.float64), self.indices, self.indptr),
+            shape=(len(self.stations), len(self.stations))
+        )
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<CompiledGraph: {len(self.stations)} stations, {len(self.indices)} edges>"
+
+    def shortest_paths(self, sources: list[str] | None = None) -> "ShortestPaths":
+        """ Shortest paths from each source (default to all stations) to every station """
+        source_ids = list(range(len(self.stations))) if sources is None else [self.ids[s] for s in sources]
+        weights, predecessors = dijkstra(self.matrix, directed=True, indices=source_ids, return_predecessors=True)
+        totals = np.where(np.isinf(weights), -1, np.rint(np.nan_to_num(weights, posinf=0))).astype(np.int64)
+        return ShortestPaths(self, source_ids, totals, predecessors)
+
+
+class ShortestPaths:
+    """ Distance, hop count and predecessor matrices of a multi-source shortest path search """
+
+    def __init__(self, graph: CompiledGraph, source_ids: list[int], totals: np.ndarray,
+                 predecessors: np.ndarray) -> None:
+        """ Constructor """
+        self.graph = graph
+        self.rows = {source_id: i for i, source_id in enumerate(source_ids)}
+        reachable = totals >= 0
+        self.dists = np.where(reachable, totals // HOP_SCALE, -1)  # -1 = unreachable
+        self.hops = np.where(reachable, totals % HOP_SCALE, -1)
+        self.predecessors = predecessors
+
+    def dist(self, source: str, target: str) -> int:
+        """ Shortest distance from source to target, -1 if unreachable """
+        return int(self.dists[self.rows[self.graph.ids[source]], self.graph.ids[target]])
+
+    def path(self, source: str, target: str) -> Path:
+        """ Shortest path from source to target, same shape as in shortest_path() """
+        row = self.rows[self.graph.ids[source]]
+        cur_id = self.graph.ids[target]
+        path: Path = []
+        while True:
+            prev_id = int(self.predecessors[row, cur_id])
+            if prev_id < 0:
+                return list(reversed(path))
+            path.append((self.graph.stations[prev_id], self.graph.line_of[(prev_id, cur_id)]))
+            cur_id = prev_id
+
+    def dist_dict(self, source: str) -> dict[str, int]:
+        """ Distances from source to every reachable station (except itself) """
+        row = self.dists[self.rows[self.graph.ids[source]]]
+        return {
+            self.graph.stations[i]: int(row[i]) for i in np.flatnonzero(row >= 0) if self.graph.stations[i] != source
+        }
+
+    def path_dict(self, source: str) -> dict[str, tuple[int, Path]]:
+        """ Same as shortest_path(graph, source) """
+        row = self.rows[self.graph.ids[source]]
+        source_id = self.graph.ids[source]
+        predecessors = self.predecessors[row].tolist()
+        dists = self.dists[row].tolist()
+        paths: dict[int, Path] = {source_id: []}
+        result: dict[str, tuple[int, Path]] = {}
+
+        # Extend the path of each predecessor, which always has fewer edges
+        for cur_id in np.argsort(self.hops[row], kind="stable").tolist():
+            prev_id = predecessors[cur_id]
+            if prev_id < 0:
+                continue
+            paths[cur_id] = paths[prev_id] + [(self.graph.stations[prev_id], self.graph.line_of[(prev_id, cur_id)])]
+            result[self.graph.stations[cur_id]] = (dists[cur_id], paths[cur_id])
+        return {station: result[station] for station in self.graph.stations if station in result}
+
+
+def get_compiled_graph(graph: Graph | GraphView, *, ignore_dists: bool = False) -> CompiledGraph:
+    """ Get the compiled graph, built only once for each view """
+    if not isinstance(graph, GraphView):
+        return CompiledGraph(graph, ignore_dists=ignore_dists)
+    key = (graph, ignore_dists)
+    if key not in _compiled_cache:
+        if len(_compiled_cache) >= _COMPILED_CACHE_SIZE:
+            del _compiled_cache[next(iter(_compiled_cache))]
+        _compiled_cache[key] = CompiledGraph(graph, ignore_dists=ignore_dists)
+    return _compiled_cache[key]
+
+
+def all_shortest(graph: Graph | GraphView, *, data_source: str = "station") -> dict[str, dict[str, tuple[int, Path]]]:
+    """ Get all station's shortest path dict """
+    paths = get_compiled_graph(graph, ignore_dists=(data_source == "station")).shortest_paths()
+    return {station: paths.path_dict(station) for station in paths.graph.stations}
+
+
+def all_shortest_dists(graph: Graph | GraphView, *, data_source: str = "station") -> dict[str, dict[str, int]]:
+    """ Get all station's shortest distance dict, skipping the paths """
+    paths = get_compiled_graph(graph, ignore_dists=(data_source == "station")).shortest_paths()
+    return {station: paths.dist_dict(station) for station in paths.graph.stations}
@@ -5,41 +5,40 @@
 
 # Libraries
 import argparse
-import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections.abc import Iterator
 from datetime import date, time
-from functools import partial
 from typing import Literal
 
 from tqdm import tqdm
 
-from src.bfs.avg_shortest_time import PathInfo, path_shorthand
-from src.bfs.bfs import total_transfer, expand_path, single_bfs, get_result
+from src.bfs.avg_shortest_time import PathInfo, NO_VIRTUAL, path_shorthand, parse_city_trains
+from src.bfs.bfs import total_transfer, expand_path
 from src.bfs.common import Path
+from src.bfs.lean_result import sweep_lean_bfs, from_lean
 from src.city.ask_for_city import ask_for_date, ask_for_time
 from src.city.city import City
 from src.city.line import Line, station_full_name
 from src.city.through_spec import ThroughSpec
 from src.city.transfer import Transfer
 from src.common.common import diff_time, suffix_s, format_duration, distance_str, to_pinyin, parse_comma_list, to_list, \
-    get_time_repr, to_minutes, TimeSpec
+    get_time_repr, to_minutes, from_minutes, TimeSpec
+from src.common.worker_pool import get_pool
 from src.dist_graph.adaptor import get_dist_graph, all_bfs_path
 from src.dist_graph.shortest_path import Graph
 from src.fare.fare import Fare, to_abstract
-from src.routing.through_train import ThroughTrain, parse_through_train
-from src.routing.train import parse_all_trains, Train
+from src.routing.through_train import ThroughTrain
+from src.routing.train import Train
 from src.stats.common import parse_args, display_first
 
 
-def all_station_bfs(
+def station_paths(
     city: City, stations: set[str],
     train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
     transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
     start_date: date, time_set: set[TimeSpec],
     *, data_source: str = "time", exclude_edge: bool = False, include_express: bool = False, graph: Graph | None = None
-) -> dict[str, dict[str, dict[int, PathInfo]]]:
-    """ Run BFS through all stations with a specific starting time """
-    results: dict[str, dict[str, dict[int, PathInfo]]] = {}
+) -> Iterator[tuple[str, str, int, PathInfo]]:
+    """ Stream (from, to, starting minute, path) through all stations, without keeping the paths """
     if data_source != "time":
         assert data_source in ["station", "distance", "fare"], data_source
         assert graph is not None, graph
@@ -49,50 +48,48 @@ def all_station_bfs(
                 data_source=data_source, fare_mode=(data_source == "fare")
             )
             for fr, to_dict in bfs_dict.items():
-                if fr not in results:
-                    results[fr] = {}
                 for to, (_, single_result, path) in to_dict.items():
-                    if to not in results[fr]:
-                        results[fr][to] = {}
-                    results[fr][to][to_minutes(start_time, start_day)] = (diff_time(
+                    yield fr, to, to_minutes(start_time, start_day), (diff_time(
                         single_result.arrival_time, start_time,
                         single_result.arrival_day or single_result.force_next_day, start_day
                     ), path, single_result)
-        return results
+        return
 
-    data_set = [(station, start_time, start_day) for station in stations for start_time, start_day in time_set]
+    data_set = [
+        (station, to_minutes(start_time, start_day)) for station in stations for start_time, start_day in time_set
+    ]
     with tqdm(desc="Calculating Paths", total=len(data_set)) as bar:
-        executor_cls = ProcessPoolExecutor if mp.parent_process() is None else ThreadPoolExecutor
-        with executor_cls() as executor:
-            work = partial(
-                single_bfs, city.lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
-                exclude_edge=exclude_edge, include_express=include_express
-            )
-            iterator = executor.map(work, data_set, chunksize=50)
-            multi_result = []
-            for elem in iterator:
-                bar.set_description("Calculating " + station_full_name(elem[0][0], city.lines) +
-                                    " at " + get_time_repr(elem[0][1], elem[0][2]))
-                bar.update()
-                multi_result.append(elem)
+        pool = get_pool(city.lines, train_dict, through_dict, transfer_dict, virtual_dict)
+        iterator = sweep_lean_bfs(
+            pool, data_set, city.lines, train_dict, through_dict, transfer_dict, virtual_dict, start_date,
+            destinations=stations, exclude_edge=exclude_edge, include_express=include_express
+        )
+        for (cur_station, minute), lean_results in iterator:
+            bar.set_description("Calculating " + station_full_name(cur_station, city.lines) +
+                                " at " + get_time_repr(*from_minutes(minute)))
+            bar.update()
+            for station, lean_result in lean_results.items():
+                yield cur_station, station, minute, from_lean(train_dict, start_date, lean_result)
 
-    for (cur_station, start_time, start_day), bfs_result in multi_result:
-        bfs_stations = {x[0] for x in bfs_result.keys()}
-        for station in bfs_stations:
-            if station not in stations:
-                continue
-            result = get_result(bfs_result, station, transfer_dict, through_dict)
-            if result is None:
-                continue
-            single_result = result[1]
-            if cur_station not in results:
-                results[cur_station] = {}
-            if station not in results[cur_station]:
-                results[cur_station][station] = {}
-            results[cur_station][station][to_minutes(start_time, start_day)] = (diff_time(
-                single_result.arrival_time, start_time,
-                single_result.arrival_day or single_result.force_next_day, start_day
-            ), single_result.shortest_path(bfs_result), single_result)
+
+def all_station_bfs(
+    city: City, stations: set[str],
+    train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+    transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer],
+    start_date: date, time_set: set[TimeSpec],
+    *, data_source: str = "time", exclude_edge: bool = False, include_express: bool = False, graph: Graph | None = None
+) -> dict[str, dict[str, dict[int, PathInfo]]]:
+    """ Run BFS through all stations with a specific starting time """
+    results: dict[str, dict[str, dict[int, PathInfo]]] = {}
+    for from_station, to_station, minute, path_info in station_paths(
+        city, stations, train_dict, through_dict, transfer_dict, virtual_dict, start_date, time_set,
+        data_source=data_source, exclude_edge=exclude_edge, include_express=include_express, graph=graph
+    ):
+        if from_station not in results:
+            results[from_station] = {}
+        if to_station not in results[from_station]:
+            results[from_station][to_station] = {}
+        results[from_station][to_station][minute] = path_info
     return results
 
 
@@ -107,7 +104,7 @@ def all_path(
     if data_source == "time":
         inner_result = all_station_bfs(
             city, stations, train_dict, through_dict, city.transfers,
-            {} if exclude_virtual else city.virtual_transfers,
+            NO_VIRTUAL if exclude_virtual else city.virtual_transfers,
             start_date, {(start_time, start_day)}, exclude_edge=exclude_edge, include_express=include_express
         )
         result_dict: dict[str, dict[str, PathInfo]] = {}
@@ -262,10 +259,9 @@ def main() -> None:
         include_virtual=(args.exclude_virtual in ["none", "compare"]),
         include_circle=(not args.exclude_single)
     )
-    train_dict = parse_all_trains(
-        list(city.lines.values()), include_lines=args.include_lines, exclude_lines=args.exclude_lines
+    train_dict, through_dict = parse_city_trains(
+        city, include_lines=args.include_lines, exclude_lines=args.exclude_lines
     )
-    _, through_dict = parse_through_train(train_dict, city.through_specs)
     stations = set(graph.keys())
     paths_basis = all_path(
         city, stations, graph, train_dict, through_dict, start_date, start_time, start_day,
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Immutable dist graph of a city, with cheap masked views for each graph variant """
+
+# Libraries
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from src.city.city import City
+from src.city.line import Line
+
+# Edge: from station, to station, line (None = virtual transfer)
+Edge = tuple[str, str, Line | None]
+
+# (id of city, ignore_dists) -> (city, base graph)
+_base_cache: dict[tuple[int, bool], tuple[City, "BaseGraph"]] = {}
+_BASE_CACHE_SIZE = 8
+
+
+def line_edges(line: Line, direction: str, include_circle: bool = True) -> list[tuple[str, str, int]]:
+    """ Get the edges of one direction of a line as (from, to, dist) """
+    stations = line.direction_stations(direction)
+    dists = line.direction_dists(direction)
+    if line.end_circle_start is not None and not include_circle and line.end_circle_start in stations:
+        index = stations.index(line.end_circle_start)
+        if stations == line.stations:
+            stations = stations[index:]
+            dists = dists[index:]
+        else:
+            # Assume reverse
+            index = len(stations) - index - 1
+            stations = stations[:-index]
+            dists = dists[:-index]
+    edges: list[tuple[str, str, int]] = []
+    for i, dist in enumerate(dists):
+        if i == len(stations) - 1:
+            assert line.loop, (line, stations, dists)
+            end = 0
+        else:
+            end = i + 1
+        edges.append((stations[i], stations[end], dist))
+    return edges
+
+
+class BaseGraph:
+    """ All the edges of a city's dist graph, with the edge masks of each line, station and option """
+
+    def __init__(self, city: City, *, ignore_dists: bool = False) -> None:
+        """ Constructor """
+        self.ignore_dists = ignore_dists
+        self.edges: list[Edge] = []
+        self.lengths: list[int] = []
+        positions: dict[tuple[str, str, str | None], int] = {}
+        non_circle: set[tuple[str, str, str | None]] = set()
+
+        def add(from_station: str, to_station: str, dist: int, line: Line | None) -> None:
+            """ Add an edge, a repeated edge keeps its position and takes the new length """
+            key = (from_station, to_station, None if line is None else line.name)
+            if key in positions:
+                self.lengths[positions[key]] = dist
+                return
+            positions[key] = len(self.edges)
+            self.edges.append((from_station, to_station, line))
+            self.lengths.append(dist)
+
+        for line in city.lines.values():
+            for direction in line.directions.keys():
+                for from_station, to_station, dist in line_edges(line, direction):
+                    add(from_station, to_station, 1 if ignore_dists else dist, line)
+                for from_station, to_station, _ in line_edges(line, direction, include_circle=False):
+                    non_circle.add((from_station, to_station, line.name))
+        for from_station, to_station in city.virtual_transfers.keys():
+            add(from_station, to_station, 0, None)
+
+        # Masks are ints with bit i set for edge i
+        self.full_mask = (1 << len(self.edges)) - 1
+        self.line_masks: dict[str, int] = {}
+        self.station_masks: dict[str, int] = {}
+        self.out_masks: dict[str, int] = {}
+        self.virtual_mask = 0
+        self.circle_mask = 0
+        self.reverse: list[int] = []
+        for i, (from_station, to_station, line) in enumerate(self.edges):
+            bit = 1 << i
+            if line is None:
+                self.virtual_mask |= bit
+            else:
+                self.line_masks[line.name] = self.line_masks.get(line.name, 0) | bit
+                if (from_station, to_station, line.name) not in non_circle:
+                    self.circle_mask |= bit
+            self.station_masks[from_station] = self.station_masks.get(from_station, 0) | bit
+            self.station_masks[to_station] = self.station_masks.get(to_station, 0) | bit
+            self.out_masks[from_station] = self.out_masks.get(from_station, 0) | bit
+            self.reverse.append(positions.get((to_station, from_station, None if line is None else line.name), -1))
+        self.positions = positions
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<BaseGraph: {len(self.station_masks)} stations, {len(self.edges)} edges>"
+
+    def edge_mask(self, edges: Iterable[Edge], *, double: bool = True) -> int:
+        """ Get the mask of some edges (and their reverse if double is set) """
+        mask = 0
+        for from_station, to_station, line in edges:
+            i = self.positions[(from_station, to_station, None if line is None else line.name)]
+            mask |= 1 << i
+            if double and self.reverse[i] >= 0:
+                mask |= 1 << self.reverse[i]
+        return mask
+
+
+class GraphView:
+    """ Immutable subgraph of a base graph, selected by an edge mask """
+
+    def __init__(self, base: BaseGraph, mask: int | None = None) -> None:
+        """ Constructor """
+        self.base = base
+        self.mask = base.full_mask if mask is None else mask
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<GraphView: {self.mask.bit_count()} of {len(self.base.edges)} edges>"
+
+    def __hash__(self) -> int:
+        """ Hash value """
+        return hash((id(self.base), self.mask))
+
+    def __eq__(self, other: object) -> bool:
+        """ Determine equality """
+        return isinstance(other, GraphView) and self.base is other.base and self.mask == other.mask
+
+    def __and__(self, other: GraphView) -> GraphView:
+        """ Edges present in both views """
+        assert self.base is other.base, (self, other)
+        return GraphView(self.base, self.mask & other.mask)
+
+    def __contains__(self, edge: Edge) -> bool:
+        """ Determine if an edge is in the view """
+        return self.mask & self.base.edge_mask([edge], double=False) != 0
+
+    def restrict(self, mask: int) -> GraphView:
+        """ Keep only the edges in mask """
+        return GraphView(self.base, self.mask & mask)
+
+    def remove(self, mask: int) -> GraphView:
+        """ Remove the edges in mask """
+        return GraphView(self.base, self.mask & ~mask)
+
+    def include_lines(self, line_names: Iterable[str]) -> GraphView:
+        """ Keep only the edges of these lines (and virtual transfers) """
+        mask = self.base.virtual_mask
+        for line_name in line_names:
+            mask |= self.base.line_masks.get(line_name, 0)
+        return self.restrict(mask)
+
+    def exclude_lines(self, line_names: Iterable[str]) -> GraphView:
+        """ Remove the edges of these lines """
+        mask = 0
+        for line_name in line_names:
+            mask |= self.base.line_masks.get(line_name, 0)
+        return self.remove(mask)
+
+    def exclude_virtual(self) -> GraphView:
+        """ Remove all the virtual transfers """
+        return self.remove(self.base.virtual_mask)
+
+    def exclude_circle(self) -> GraphView:
+        """ Remove the edges of the single-direction circles at the end of lines """
+        return self.remove(self.base.circle_mask)
+
+    def exclude_stations(self, stations: Iterable[str]) -> GraphView:
+        """ Remove all the edges from or to these stations """
+        mask = 0
+        for station in stations:
+            mask |= self.base.station_masks.get(station, 0)
+        return self.remove(mask)
+
+    def exclude_edges(self, edges: Iterable[Edge], *, double: bool = True) -> GraphView:
+        """ Remove some edges (and their reverse if double is set) """
+        return self.remove(self.base.edge_mask(edges, double=double))
+
+    def edge_ids(self) -> list[int]:
+        """ Indexes of the edges in the view, in base order """
+        return [i for i, bit in enumerate(reversed(bin(self.mask)[2:])) if bit == "1"]
+
+    def degree(self, station: str) -> int:
+        """ Number of edges going out of station """
+        return (self.mask & self.base.out_masks.get(station, 0)).bit_count()
+
+    def edges_from(self, station: str) -> list[int]:
+        """ Indexes of the edges going out of station """
+        return GraphView(self.base, self.mask & self.base.out_masks.get(station, 0)).edge_ids()
+
+    def stations(self) -> list[str]:
+        """ Stations with outgoing edges, in the same order as the keys of to_graph() """
+        return list(dict.fromkeys(self.base.edges[i][0] for i in self.edge_ids()))
+
+    def to_graph(self) -> dict[str, dict[tuple[str, Line | None], int]]:
+        """ Materialize a new dict graph, as returned by get_dist_graph() """
+        graph: dict[str, dict[tuple[str, Line | None], int]] = {}
+        for i in self.edge_ids():
+            from_station, to_station, line = self.base.edges[i]
+            if from_station not in graph:
+                graph[from_station] = {}
+            graph[from_station][(to_station, line)] = self.base.lengths[i]
+        return graph
+
+
+def get_base_graph(city: City, *, ignore_dists: bool = False) -> BaseGraph:
+    """ Get the base graph of a city, built only once """
+    key = (id(city), ignore_dists)
+    if key in _base_cache and _base_cache[key][0] is city:
+        return _base_cache[key][1]
+    if len(_base_cache) >= _BASE_CACHE_SIZE:
+        del _base_cache[next(iter(_base_cache))]
+    base = BaseGraph(city, ignore_dists=ignore_dists)
+    _base_cache[key] = (city, base)
+    return base
+
+
+def get_graph_view(
+    city: City, *,
+    include_lines: set[str] | str | None = None, exclude_lines: set[str] | str | None = None,
+    include_virtual: bool = True, include_circle: bool = True, ignore_dists: bool = False
+) -> GraphView:
+    """ Get the view of the distance graph with the same options as get_dist_graph() """
+    view = GraphView(get_base_graph(city, ignore_dists=ignore_dists))
+    if isinstance(include_lines, str):
+        include_lines = {x.strip() for x in include_lines.split(",")}
+    if isinstance(exclude_lines, str):
+        exclude_lines = {x.strip() for x in exclude_lines.split(",")}
+    if include_lines is not None:
+        view = view.include_lines(include_lines)
+    if exclude_lines is not None:
+        view = view.exclude_lines(exclude_lines)
+    if not include_circle:
+        view = view.exclude_circle()
+    if not include_virtual:
+        return view.exclude_virtual()
+
+    # Virtual transfers are only kept between stations that have other edges
+    line_view = view.exclude_virtual()
+    virtual_mask = 0
+    for i in GraphView(view.base, view.mask & view.base.virtual_mask).edge_ids():
+        from_station, to_station, _ = view.base.edges[i]
+        if line_view.degree(from_station) == 0 or line_view.degree(to_station) == 0:
+            virtual_mask |= 1 << i
+    return view.remove(virtual_mask)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" On-disk store of Graphillion path families, so that long non-repeating path searches can be resumed """
+
+# Libraries
+import hashlib
+import os
+from collections.abc import Callable
+from typing import Any
+
+from graphillion import GraphSet  # type: ignore
+
+from src.city.compiled_cache import CACHE_ROOT, write_atomic, load_pickle, save_pickle
+
+# Graphillion universe: (station, station, weight)
+Universe = list[tuple[str, str, int]]
+
+_current_universe: Universe | None = None
+
+
+def use_universe(universe: Universe) -> None:
+    """ Set the Graphillion universe of this process, unless it is already set """
+    global _current_universe
+    if _current_universe != universe:
+        GraphSet.set_universe(universe)
+        _current_universe = universe
+
+
+class GraphSetStore:
+    """ Directory of GraphSets over one universe, keyed by the steps that produced them """
+
+    def __init__(self, universe: Universe, root: str | None = None) -> None:
+        """ Constructor """
+        self.universe = universe
+        self.weights: dict[tuple[str, str], int] = {}
+        for station1, station2, weight in universe:
+            self.weights[(station1, station2)] = weight
+            self.weights[(station2, station1)] = weight
+        universe_hash = hashlib.sha256(repr(universe).encode("utf-8")).hexdigest()
+        self.root = os.path.join(root or os.path.join(CACHE_ROOT, "graphillion"), universe_hash[:16])
+        if not os.path.exists(os.path.join(self.root, "universe.pickle")):
+            save_pickle(os.path.join(self.root, "universe.pickle"), universe)
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<GraphSetStore at {self.root}: {len(self.universe)} edges>"
+
+    def file(self, key: str, extension: str) -> str:
+        """ File holding the object of key """
+        return os.path.join(self.root, hashlib.sha256(key.encode("utf-8")).hexdigest()[:24] + extension)
+
+    def load(self, key: str) -> GraphSet | None:
+        """ Load the GraphSet of key, or None if it was never saved """
+        file = self.file(key, ".zdd")
+        if not os.path.exists(file):
+            return None
+        use_universe(self.universe)
+        try:
+            with open(file, encoding="utf-8") as fp:
+                return GraphSet.load(fp)
+        except (OSError, ValueError, RuntimeError):
+            return None
+
+    def save(self, key: str, graphs: GraphSet) -> None:
+        """ Save the GraphSet of key """
+        write_atomic(self.file(key, ".zdd"), graphs.dumps().encode("utf-8"))
+
+    def cached(self, key: str, compute: Callable[[], GraphSet]) -> tuple[GraphSet, bool]:
+        """ Load the GraphSet of key or compute and save it (returns true if loaded) """
+        graphs = self.load(key)
+        if graphs is not None:
+            return graphs, True
+        use_universe(self.universe)
+        graphs = compute()
+        self.save(key, graphs)
+        return graphs, False
+
+    def load_result(self, key: str) -> Any | None:
+        """ Load a small result of key, or None if it was never saved """
+        return load_pickle(self.file(key, ".pickle"))
+
+    def save_result(self, key: str, result: Any) -> None:
+        """ Save a small result of key """
+        save_pickle(self.file(key, ".pickle"), result)
+
+    def weight(self, graph: list[tuple[str, str]]) -> int:
+        """ Total weight of a graph """
+        return sum(self.weights[edge] for edge in graph)
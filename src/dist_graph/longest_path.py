@@ -5,6 +5,7 @@
 
 # Libraries
 import argparse
+import os
 import sys
 from collections.abc import Generator
 from datetime import time
@@ -19,31 +20,40 @@ from src.city.ask_for_city import ask_for_city, ask_for_date, ask_for_time, ask_
 from src.city.city import City, parse_station_lines
 from src.city.line import Line
 from src.common.common import suffix_s
+from src.common.worker_pool import get_pool
 from src.dist_graph.adaptor import copy_graph, remove_double_edge, get_dist_graph, to_trains, all_time_path, \
     to_universe, path_from_pairs, to_line_graph, to_transfer_graph
-from src.dist_graph.shortest_path import Graph, Path, shortest_path
+from src.dist_graph.compiled_graph import get_compiled_graph
+from src.dist_graph.graph_view import GraphView, get_graph_view
+from src.dist_graph.graphset_store import GraphSetStore, Universe, use_universe
+from src.dist_graph.shortest_path import Graph, Path
 from src.routing.through_train import parse_through_train
 from src.routing.train import parse_all_trains
 from src.stats.common import get_virtual_dict
 
+# Filtering step: name (also its key in the store), kind, argument
+FilterStep = tuple[str, str, str]
 
-def simplify_graph(graph: Graph, start_station: str | None, end_station: str | None) -> Graph:
+
+def simplify_graph(graph: GraphView, start_station: str | None, end_station: str | None) -> GraphView:
     """ Simplify graph w/r start/end station """
     if start_station is None:
         assert end_station is None, (start_station, end_station)
     elif start_station == end_station:
         start_station = end_station = None
-    result = copy_graph(graph)
-    queue: list[str] = [station for station, edges in result.items() if len(edges) == 1
+    mask = graph.mask
+    base = graph.base
+    queue: list[str] = [station for station in graph.stations() if graph.degree(station) == 1
                         and station not in [start_station, end_station]]
     while len(queue) > 0:
         start, queue = queue[0], queue[1:]
-        assert len(result[start]) == 1, (start, result)
-        other = list(result[start].keys())[0]
-        remove_double_edge(result, start, other[0], other[1])
-        if len(result[other[0]]) == 1 and other[0] not in [start_station, end_station]:
-            queue.append(other[0])
-    return result
+        edges = GraphView(base, mask & base.out_masks[start]).edge_ids()
+        assert len(edges) == 1, (start, edges)
+        other = base.edges[edges[0]][1]
+        mask &= ~base.edge_mask([base.edges[edges[0]]])
+        if (mask & base.out_masks[other]).bit_count() == 1 and other not in [start_station, end_station]:
+            queue.append(other)
+    return GraphView(base, mask)
 
 
 def get_best_matching(dist_dict: dict[tuple[str, str], int], verbose: bool = True) -> list[tuple[str, str]]:
@@ -115,7 +125,7 @@ def euler_route(graph: Graph, start_station: str | None, end_station: str | None
 
 
 def get_longest_route(
-    graph: Graph, city: City, start_station: str | None, end_station: str | None, verbose: bool = True
+    graph: GraphView, city: City, start_station: str | None, end_station: str | None, verbose: bool = True
 ) -> tuple[int, Path]:
     """ Get the longest route in a dist graph """
     if start_station is None:
@@ -123,25 +133,25 @@ def get_longest_route(
     small_graph = simplify_graph(graph, start_station, end_station)
 
     # Find all the odd nodes
-    odd_nodes = [station for station, edges in small_graph.items() if len(edges) % 2 == 1
+    odd_nodes = [station for station in small_graph.stations() if small_graph.degree(station) % 2 == 1
                  and (start_station == end_station or station not in [start_station, end_station])]
     if verbose:
         print("Odd nodes in simplified graph:")
         for station in odd_nodes:
-            print(f"{city.station_full_name(station)} ({len(small_graph[station])})")
+            print(f"{city.station_full_name(station)} ({small_graph.degree(station)})")
 
     # Do the single-source shortest path for each pair of odd nodes
     dist_dict: dict[tuple[str, str], int] = {}
     path_record: dict[tuple[str, str], Path] = {}
     if verbose:
         print("Calculating shortest paths...", end="", flush=True)
+    paths = get_compiled_graph(small_graph).shortest_paths(odd_nodes)
     for station in odd_nodes:
-        path_dict = shortest_path(small_graph, station)
         for station2 in odd_nodes:
-            if station2 != station and station2 in path_dict:
-                path = path_dict[station2][1]
+            if station2 != station and paths.dist(station, station2) >= 0:
+                path = paths.path(station, station2)
                 residual = len([l for s, l in path if l is None])
-                dist_dict[(station, station2)] = path_dict[station2][0] + residual
+                dist_dict[(station, station2)] = paths.dist(station, station2) + residual
                 path_record[(station, station2)] = path
     if verbose:
         print(" Done!")
@@ -152,12 +162,13 @@ def get_longest_route(
     # Remove all matched edges
     for station1, station2 in sorted(match_list, key=lambda x: dist_dict[x]):
         path = path_record[(station1, station2)]
-        for i, (cur_station, cur_line) in enumerate(path[:-1]):
-            remove_double_edge(small_graph, cur_station, path[i + 1][0], cur_line)
-        remove_double_edge(small_graph, path[-1][0], station2, path[-1][1])
+        small_graph = small_graph.exclude_edges(
+            (cur_station, path[i + 1][0] if i + 1 < len(path) else station2, cur_line)
+            for i, (cur_station, cur_line) in enumerate(path)
+        )
 
     # Calculate euler route
-    return euler_route(small_graph, start_station, end_station)
+    return euler_route(small_graph.to_graph(), start_station, end_station)
 
 
 def get_segments(
@@ -183,55 +194,153 @@ def get_segments(
     return stations, result
 
 
-def filter_line_once(
-    bar: tqdm, paths: GraphSet, path_len: int, stations: list[str], segments: list[tuple[int, str, str]], line: Line
-) -> list[GraphSet]:
-    """ Filter line such that it is included exactly once """
-    bad_list: list[GraphSet] = []
-    for start, start_station, end_station in segments:
-        bar_desc = f"Line {line.full_name()} [{line.station_full_name(start_station)} - {line.station_full_name(end_station)}]"
-        bar.set_description(bar_desc)
-        preserve_segments: list[list[tuple[str, str]]] = [line.two_station_intervals(start_station, end_station)]
-        discard_segments: list[list[tuple[str, str]]] = []
-        indexes = list(range(start + 1, len(stations) - (2 if line.loop and start == 1 else 1)))
-        if line.loop:
-            indexes += list(range(0, start - 2))
-        for start2 in indexes:
-            start_station2 = stations[start2]
-            end_station2 = stations[start2 + 1]
-            discard_segments.append(
-                line.two_station_intervals(stations[start - 1], start_station) +
-                line.two_station_intervals(start_station2, end_station2)
-            )
-        bad_paths = paths.supergraphs(GraphSet(discard_segments)).non_supergraphs(GraphSet(preserve_segments))
-        if line.loop:
-            additional = paths.supergraphs(GraphSet([
-                line.two_station_intervals(stations[start + 1], stations[start - 1])
-            ]))
-            bad_paths = bad_paths - additional
-        bad_len = bad_paths.len()
-        percentage = bad_len / path_len * 100
-        bar.update()
-        tqdm.write(f"{bar_desc}: Bad length = {bad_len} ({percentage:.2f}%)")
-        if bad_len != 0:
-            bad_list.append(bad_paths)
-    return bad_list
-
-
-def exclude_subgraphs(
-    path_len: int, paths: GraphSet, subgraphs: list[tuple[str, str | GraphSet]]
-) -> tuple[int, GraphSet]:
-    """ Filter a list of subgraphs """
-    for name, subgraph in subgraphs:
-        if isinstance(subgraph, str):
-            paths = paths.excluding(subgraph)
+def line_once_filter(line: Line, stations: list[str], start: int, start_station: str, end_station: str) -> GraphSet:
+    """ All graphs that leave line after the segment start_station - end_station and then come back to it """
+    # Independent of the paths, so it can be built once for the universe and reused by every search
+    preserve_segments: list[list[tuple[str, str]]] = [line.two_station_intervals(start_station, end_station)]
+    discard_segments: list[list[tuple[str, str]]] = []
+    indexes = list(range(start + 1, len(stations) - (2 if line.loop and start == 1 else 1)))
+    if line.loop:
+        indexes += list(range(0, start - 2))
+    for start2 in indexes:
+        start_station2 = stations[start2]
+        end_station2 = stations[start2 + 1]
+        discard_segments.append(
+            line.two_station_intervals(stations[start - 1], start_station) +
+            line.two_station_intervals(start_station2, end_station2)
+        )
+    all_graphs = GraphSet({})
+    bad_graphs = all_graphs.supergraphs(GraphSet(discard_segments)).non_supergraphs(GraphSet(preserve_segments))
+    if line.loop:
+        bad_graphs = bad_graphs - all_graphs.supergraphs(GraphSet([
+            line.two_station_intervals(stations[start + 1], stations[start - 1])
+        ]))
+    return bad_graphs
+
+
+def line_once_filters(
+    store: GraphSetStore, city: City, lines: dict[str, Line], exclude_virtual: bool
+) -> list[tuple[str, str]]:
+    """ Create (or load) the filters such that each line is included at most once, returns (name, key) """
+    station_lines = parse_station_lines(lines)
+    virtual_dict = {} if exclude_virtual else get_virtual_dict(city, lines)
+    segment_list: list[tuple[str, list[str], list[tuple[int, str, str]]]] = []
+    for line_name in sorted(lines.keys(), key=lambda x: lines[x].index):
+        segment_list.append((line_name,) + get_segments(station_lines, virtual_dict, lines[line_name]))
+    filters: list[tuple[str, str]] = []
+    with tqdm(desc="Creating Filters", total=sum(len(x[2]) for x in segment_list)) as bar:
+        for line_name, stations, segments in segment_list:
+            line = lines[line_name]
+            for start, start_station, end_station in segments:
+                name = f"Line {line.full_name()} [{line.station_full_name(start_station)} - " + \
+                       f"{line.station_full_name(end_station)}]"
+                bar.set_description(name)
+                key = f"line once {line_name} {start} {','.join(stations)}"
+                store.cached(key, lambda: line_once_filter(line, stations, start, start_station, end_station))
+                filters.append((name, key))
+                bar.update()
+    return filters
+
+
+def filter_steps(
+    city: City, lines: dict[str, Line], args: argparse.Namespace, filters: list[tuple[str, str]]
+) -> list[FilterStep]:
+    """ Get the exclusions and line requirements of args as a list of filtering steps """
+    steps: list[FilterStep] = []
+    if args.exclude_lines is not None:
+        for line_name in sorted({x.strip() for x in args.exclude_lines.split(",")}):
+            steps.append((f"Filtering {city.lines[line_name].full_name()}", "exclude_line", line_name))
+    if args.exclude_stations is not None:
+        for station in sorted({x.strip() for x in args.exclude_stations.split(",")}):
+            steps.append((f"Filtering {city.station_full_name(station)}", "exclude_station", station))
+    if args.exclude_transfers is not None:
+        for station in sorted({x.strip() for x in args.exclude_transfers.split(",")}):
+            steps.append((f"Filtering {city.station_full_name(station)} transfers", "exclude_transfer", station))
+    if args.exclude_virtual:
+        steps.append(("Filtering virtual transfers", "exclude_virtual", ""))
+    for name, key in filters:
+        steps.append((f"Filtering {name}", "filter", key))
+    if args.line_requirements not in ["none", "most_once"]:
+        for line_name, line in sorted(lines.items(), key=lambda x: x[1].index):
+            steps.append((f"Including {line.full_name()}", "include_line", line_name))
+    return steps
+
+
+def apply_step(store: GraphSetStore, city: City, step: FilterStep, paths: GraphSet) -> GraphSet:
+    """ Apply one filtering step """
+    _, kind, argument = step
+    if kind == "exclude_line":
+        return paths.non_supergraphs(GraphSet(to_line_graph(city.lines[argument])))
+    if kind == "exclude_station":
+        return paths.excluding(argument)
+    if kind == "exclude_transfer":
+        return paths.non_supergraphs(GraphSet(to_transfer_graph(argument, list(city.station_lines[argument]))))
+    if kind == "exclude_virtual":
+        return paths.non_supergraphs(GraphSet([[(s1, s2)] for s1, s2 in city.virtual_transfers.keys()]))
+    if kind == "filter":
+        bad_graphs = store.load(argument)
+        assert bad_graphs is not None, step
+        return paths - bad_graphs
+    assert kind == "include_line", step
+    new_paths = paths.supergraphs(GraphSet(to_line_graph(city.lines[argument])))
+    return paths if new_paths.len() == 0 else new_paths
+
+
+def filter_paths(
+    store: GraphSetStore, city: City, key: str, paths: GraphSet, steps: list[FilterStep], *, verbose: bool = True
+) -> tuple[str, GraphSet]:
+    """ Apply all the filtering steps, resuming from the last step saved in store """
+    keys: list[str] = []
+    for name, _, _ in steps:
+        key = f"{key} | {name}"
+        keys.append(key)
+    resumed = next((i for i in range(len(steps) - 1, -1, -1) if os.path.exists(store.file(keys[i], ".zdd"))), -1)
+    if resumed >= 0:
+        loaded = store.load(keys[resumed])
+        if loaded is None:
+            resumed = -1
         else:
-            paths = paths.non_supergraphs(subgraph)
+            paths = loaded
+            if verbose:
+                print(f"Resumed after {steps[resumed][0]}, path length = {paths.len()}")
+    path_len = paths.len()
+    for i in range(resumed + 1, len(steps)):
+        paths = apply_step(store, city, steps[i], paths)
+        store.save(keys[i], paths)
         new_len = paths.len()
-        percentage = new_len / path_len * 100
-        print(f"Filtering {name}... New length = {new_len} ({percentage:.2f}%)")
+        if verbose:
+            percentage = new_len / path_len * 100 if path_len > 0 else 0
+            print(f"{steps[i][0]}... New length = {new_len} ({percentage:.2f}%)")
         path_len = new_len
-    return path_len, paths
+    return key, paths
+
+
+def best_graph(
+    store: GraphSetStore, key: str, paths: GraphSet, path_mode: str
+) -> tuple[int, list[tuple[str, str]]] | None:
+    """ Get the longest (or shortest) path of paths with its weight, saved in store """
+    result_key = f"{key} | {path_mode}"
+    result = store.load_result(result_key)
+    if result is None:
+        if paths.len() == 0:
+            return None
+        best_path = next(paths.max_iter()) if path_mode == "max" else next(paths.min_iter())
+        result = (store.weight(best_path), best_path)
+        store.save_result(result_key, result)
+    return result
+
+
+def pair_best_graph(
+    city: City, args: argparse.Namespace, line_names: list[str], filters: list[tuple[str, str]], universe: Universe,
+    pair: tuple[str, str]
+) -> tuple[tuple[str, str], tuple[int, list[tuple[str, str]]] | None]:
+    """ Get the best path between a pair of ending stations (run in a worker process) """
+    store = GraphSetStore(universe)
+    steps = filter_steps(city, {line_name: city.lines[line_name] for line_name in line_names}, args, filters)
+    key = f"paths {pair[0]} {pair[1]}"
+    paths, _ = store.cached(key, lambda: GraphSet.paths(pair[0], pair[1]))
+    key, paths = filter_paths(store, city, key, paths, steps, verbose=False)
+    return pair, best_graph(store, key, paths, args.path_mode)
 
 
 def find_longest(args: argparse.Namespace, *, existing_city: City | None = None) -> tuple[City, Path, str]:
@@ -273,90 +382,64 @@ def find_longest(args: argparse.Namespace, *, existing_city: City | None = None)
         graph = get_dist_graph(
             city, include_lines=args.include_lines, include_circle=False, ignore_dists=args.ignore_dists
         )
-        GraphSet.set_universe(to_universe(graph))
+        store = GraphSetStore(to_universe(graph))
+        use_universe(store.universe)
+        print(f"Graph creation done. Intermediate results are saved in {store.root}")
+        line_names = [line_name for line_name in lines.keys() if line_name in train_dict.keys()]
+        filters: list[tuple[str, str]] = []
+        if args.line_requirements in ["each_once", "most_once"]:
+            print("Creating line-based filters...")
+            filters = line_once_filters(
+                store, city, {line_name: lines[line_name] for line_name in line_names}, args.exclude_virtual
+            )
 
-        print("Graph creation done. The calculation for set of all paths will now begin, please wait patiently...",
-              flush=True, end="")
         if args.all:
-            # FIXME: This took way too long to calculate
-            # paths = GraphSet.paths()
-            print("Unsupported!")
-            sys.exit(0)
-        elif args.circuit:
-            paths = GraphSet.cycles()
-            if start is not None:
-                paths = paths.including(start[0])
+            # Every pair of ending stations is searched in a worker process, and saved once done
+            ending_points = [v for v, edges in graph.items() if len(edges) == 1]
+            pairs = [(point, point2) for i, point in enumerate(ending_points) for point2 in ending_points[i + 1:]]
+            best_result: tuple[int, list[tuple[str, str]]] | None = None
+            with tqdm(desc="Calculating Pairs", total=len(pairs)) as bar:
+                for (station1, station2), result in get_pool(city).imap(
+                    pair_best_graph, pairs, city, args, line_names, filters, store.universe, chunksize=1
+                ):
+                    bar.set_description(f"Calculating {city.station_full_name(station1)} " +
+                                        f"<-> {city.station_full_name(station2)}")
+                    bar.update()
+                    if result is not None and (best_result is None or (
+                        result[0] > best_result[0] if args.path_mode == "max" else result[0] < best_result[0]
+                    )):
+                        best_result = result
+            if best_result is None:
+                print("No such route possible!")
+                sys.exit(-1)
+            best_path = best_result[1]
         else:
-            assert start is not None and end is not None, (start, end)
-            paths = GraphSet.paths(start[0], end[0])
-        print(" Done!")
-
-        # Filter exclude_lines/stations/transfers & virtual transfer
-        path_len = paths.len()
-        print("Original path length:", path_len)
-        if args.exclude_lines is not None:
-            exclude_lines = {x.strip() for x in args.exclude_lines.split(",")}
-            path_len, paths = exclude_subgraphs(path_len, paths, [
-                (lines[line_name].full_name(), GraphSet(to_line_graph(lines[line_name])))
-                for line_name in exclude_lines
-            ])
-        if args.exclude_stations is not None:
-            exclude_stations = {x.strip() for x in args.exclude_stations.split(",")}
-            path_len, paths = exclude_subgraphs(path_len, paths, [
-                (city.station_full_name(station), station) for station in exclude_stations
-            ])
-        if args.exclude_transfers is not None:
-            exclude_stations = {x.strip() for x in args.exclude_transfers.split(",")}
-            path_len, paths = exclude_subgraphs(path_len, paths, [
-                (city.station_full_name(station) + " transfers",
-                 GraphSet(to_transfer_graph(station, list(city.station_lines[station]))))
-                for station in exclude_stations
-            ])
-        if args.exclude_virtual:
-            virtual_graph = GraphSet([[(s1, s2)] for s1, s2 in city.virtual_transfers.keys()])
-            paths = paths.non_supergraphs(virtual_graph)
-            new_len = paths.len()
-            percentage = new_len / path_len * 100
-            print(f"Filtering virtual transfers... New length = {new_len} ({percentage:.2f}%)")
-            path_len = new_len
-            
+            print("The calculation for set of all paths will now begin, please wait patiently...",
+                  flush=True, end="")
+            if args.circuit:
+                key = "cycles" if start is None else f"cycles including {start[0]}"
+                paths, _ = store.cached(key, lambda: GraphSet.cycles() if start is None else
+                                        GraphSet.cycles().including(start[0]))
+            else:
+                assert start is not None and end is not None, (start, end)
+                key = f"paths {start[0]} {end[0]}"
+                paths, _ = store.cached(key, lambda: GraphSet.paths(start[0], end[0]))
+            print(" Done!")
+
+            # Filter exclude_lines/stations/transfers & virtual transfer, then apply line requirements
+            print("Original path length:", paths.len())
+            steps = filter_steps(city, {line_name: lines[line_name] for line_name in line_names}, args, filters)
+            key, paths = filter_paths(store, city, key, paths, steps)
+            print("Calculating " + (
+                "longest" if args.path_mode == "max" else "shortest"
+            ) + " path from all " + suffix_s("path", paths.len()) + "...", end="", flush=True)
+            result = best_graph(store, key, paths, args.path_mode)
+            print(" Done!")
+            if result is None:
+                print("No such route possible!")
+                sys.exit(-1)
+            best_path = result[1]
         lines = {k: v for k, v in lines.items() if k in train_dict.keys()}
-        if args.line_requirements in ["each_once", "most_once"]:
-            station_lines = parse_station_lines(lines)
-            virtual_dict = {} if args.exclude_virtual else get_virtual_dict(city, lines)
-            bad_list: list[GraphSet] = []
-            print("Creating line-based filters...")
-            segment_list: list[tuple[str, list[str], list[tuple[int, str, str]]]] = []
-            for line_name in sorted(lines.keys(), key=lambda x: lines[x].index):
-                segment_list.append((line_name,) + get_segments(station_lines, virtual_dict, lines[line_name]))
-            with tqdm(desc="Creating Filters", total=sum(len(x[2]) for x in segment_list)) as bar:
-                for line_name, stations, segments in segment_list:
-                    bad_list += filter_line_once(bar, paths, path_len, stations, segments, lines[line_name])
-            print(f"Applying {len(bad_list)} filters...")
-            for bad_paths in tqdm(bad_list):
-                paths = paths - bad_paths
-            new_len = paths.len()
-            percentage = new_len / path_len * 100
-            print(f"After filtering, path length is {new_len} ({percentage:.2f}%)")
-            path_len = new_len
-        if args.line_requirements not in ["none", "most_once"]:
-            for line_name, line in sorted(lines.items(), key=lambda x: x[1].index):
-                line_graph = GraphSet(to_line_graph(line))
-                new_paths = paths.supergraphs(line_graph)
-                new_len = new_paths.len()
-                if new_len == 0:
-                    print(f"Including {line.full_name()}... Empty! Skipping.")
-                    continue
-                percentage = new_len / path_len * 100
-                print(f"Including {line.full_name()}... New length = {new_len} ({percentage:.2f}%)")
-                paths = new_paths
-                path_len = new_len
-
-        print("Calculating " + (
-            "longest" if args.path_mode == "max" else "shortest"
-        ) + " path from all " + suffix_s("path", path_len) + "...", end="", flush=True)
-        best_path = next(paths.max_iter()) if args.path_mode == "max" else next(paths.min_iter())
-        print(" Done!")
         all_stations = {x[0] for x in best_path} | {x[1] for x in best_path}
         if args.all:
             candidates = [s for s in all_stations if len([x for x in best_path if s in x]) != 2]
@@ -374,7 +457,7 @@ def find_longest(args: argparse.Namespace, *, existing_city: City | None = None)
             print("Warning: --exclude-stations is not supported in repeating mode")
         if vars(args).get("exclude_transfers") is not None:
             print("Warning: --exclude-transfers is not supported in repeating mode")
-        graph = get_dist_graph(
+        view = get_graph_view(
             city, include_lines=args.include_lines, exclude_lines=args.exclude_lines,
             include_virtual=(not args.exclude_virtual), include_circle=False, ignore_dists=args.ignore_dists
         )
@@ -386,7 +469,7 @@ def find_longest(args: argparse.Namespace, *, existing_city: City | None = None)
             possible_pairs.append((None, None))
         else:
             # Get all possible ending points
-            ending_points = [v for v, edges in graph.items() if len(edges) == 1]
+            ending_points = [v for v in view.stations() if view.degree(v) == 1]
             for i, point in enumerate(ending_points):
                 for j in range(i + 1, len(ending_points)):
                     possible_pairs.append((point, ending_points[j]))
@@ -397,7 +480,7 @@ def find_longest(args: argparse.Namespace, *, existing_city: City | None = None)
                 if start_station_inner is not None and end_station_inner is not None:
                     bar.set_description(f"Calculating {city.station_full_name(start_station_inner)} " +
                                         f"<-> {city.station_full_name(end_station_inner)}")
-                dist, route = get_longest_route(graph, city, start_station_inner, end_station_inner, not args.all)
+                dist, route = get_longest_route(view, city, start_station_inner, end_station_inner, not args.all)
                 bar.update()
                 if small_tuple is None or small_tuple[0] < dist:
                     small_tuple = (dist, route, end_station_inner or route[0][0])
@@ -431,7 +514,7 @@ def find_longest(args: argparse.Namespace, *, existing_city: City | None = None)
 def longest_args(parser: argparse.ArgumentParser) -> None:
     """ Add the longest path arguments """
     parser.add_argument("-n", "--non-repeating", action="store_true", help="Finding non-repeating paths")
-    shortest_path_args(parser, have_express=False)
+    shortest_path_args(parser, have_express=False, have_engine=True)
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-a", "--all", action="store_true", help="Calculate all pairs of ending stations")
     group.add_argument("-c", "--circuit", action="store_true", help="Calculate euler circuit")
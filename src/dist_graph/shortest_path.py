@@ -6,10 +6,8 @@
 # Libraries
 from heapq import heapify, heappush, heappop
 
-from tqdm import tqdm
-
-from src.city.city import City
 from src.city.line import Line
+from src.dist_graph.graph_view import GraphView
 
 Graph = dict[str, dict[tuple[str, Line | None], int]]  # (to, line), None = virtual transfer (length = 0)
 Path = list[tuple[str, Line | None]]
@@ -51,10 +49,13 @@ def path_index(path: Path) -> tuple[int, int]:
 
 
 def shortest_path(
-    graph: Graph, from_station: str, *,
+    graph: Graph | GraphView, from_station: str, *,
     ignore_dists: bool = False, fare_mode: bool = False, include_express: bool = True, target_station: str | None = None
 ) -> dict[str, tuple[int, Path]]:
     """ Dijkstra's algorithm for the single-source shortest paths """
+    if isinstance(graph, GraphView):
+        graph = graph.to_graph()
+
     # Initialize arrays
     distances = {station: -1 for station in graph.keys()}
     parents: dict[str, tuple[str, Line | None] | None] = dict.fromkeys(graph.keys())
@@ -180,11 +181,3 @@ def shortest_path(
                 paths[to_station] = (new_dist, get_path(parents, cur_tuple[0]) + [cur_tuple])
     return paths
 
-
-def all_shortest(city: City, graph: Graph, *, data_source: str = "station") -> dict[str, dict[str, tuple[int, Path]]]:
-    """ Get all station's shortest path dict """
-    path_dict: dict[str, dict[str, tuple[int, Path]]] = {}
-    for start_station in (bar := tqdm(list(graph.keys()))):
-        bar.set_description(f"Calculating {city.station_full_name(start_station)}")
-        path_dict[start_station] = shortest_path(graph, start_station, ignore_dists=(data_source == "station"))
-    return path_dict
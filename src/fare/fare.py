@@ -9,13 +9,15 @@ from __future__ import annotations
 import os
 from copy import deepcopy
 from datetime import date, time
+from typing import Any
 
 import pyjson5
 
 from src.bfs.common import AbstractPath, Path
 from src.city.date_group import TimeInterval, DateGroup, parse_time_interval
 from src.city.line import Line
-from src.common.common import suffix_s, distance_str, get_time_str
+from src.common.common import suffix_s, distance_str
+from src.fare.fare_table import FareTable
 from src.routing.train import Train
 
 
@@ -133,11 +135,37 @@ class Fare:
         self.rule_groups = rule_groups
         for rule in self.rule_groups:
             rule.parent = self
+        self.tables: dict[DateGroup | tuple, FareTable] = {}
+        self.time_patterns: dict[date, tuple] = {}
 
     def __repr__(self) -> str:
         """ String representation """
         return "<Fare: " + suffix_s("rule", len(self.rule_groups)) + ">"
 
+    def __getstate__(self) -> dict[str, Any]:
+        """ Compiled tables and time patterns are rebuilt on demand """
+        state = self.__dict__.copy()
+        state["tables"] = {}
+        state["time_patterns"] = {}
+        return state
+
+    def time_pattern(self, cur_date: date) -> tuple:
+        """ Get the minute ranges of every time-dependent rule on cur_date """
+        if cur_date not in self.time_patterns:
+            self.time_patterns[cur_date] = tuple(
+                tuple(rule.apply_time.minute_ranges(cur_date))
+                for group in self.rule_groups for rule in group.rules if rule.apply_time is not None
+            )
+        return self.time_patterns[cur_date]
+
+    def get_table(self, lines: dict[str, Line], cur_date: date | DateGroup) -> FareTable:
+        """ Get the rules compiled for a date (shared by all the dates where the same time-dependent rules apply) """
+        key = cur_date if isinstance(cur_date, DateGroup) else self.time_pattern(cur_date)
+        table = self.tables.get(key)
+        if table is None or table.lines is not lines:
+            table = self.tables[key] = FareTable(self, lines, cur_date)
+        return table
+
     def currency_str(self, fare: float) -> str:
         """ Determine the string representation of fare """
         return self.currency + f"{fare:.2f}"
@@ -157,6 +185,7 @@ class Fare:
         assert len(self.rule_groups) > 0, self
         if len(path) == 0:
             return []
+        table = self.get_table(lines, cur_date)
         cur_candidates: list[FareRule] = self.rule_groups[:]
         splits: list[tuple[str, str, str, str, str | None, float]] = []
         last_index = 0
@@ -195,9 +224,9 @@ class Fare:
                 last_train = path[last_index][1]
                 assert isinstance(last_train, Train), (path, last_index, i)
                 splits.append((path[last_index][0], last_train.line.name, last_train.direction, station,
-                               None if train is None else train.line.name, get_fare_single(
-                    cur_candidates, lines, to_abstract(path[last_index:fetch_index + 1]), end_station,
-                    cur_date, last_time, last_day, end_time, end_day
+                               None if train is None else train.line.name, table.get_fare_single(
+                    to_abstract(path[last_index:fetch_index + 1]), end_station,
+                    last_time, last_day, end_time, end_day
                 )))
                 last_index = orig_delta + i
                 if train is not None:
@@ -216,55 +245,6 @@ def to_abstract(path: Path) -> AbstractPath:
             for station, train in path]
 
 
-def get_fare_single(
-    rule_groups: list[FareRule], lines: dict[str, Line],
-    path: AbstractPath, end_station: str,
-    cur_date: date | DateGroup,
-    start_time: time, start_day: bool,
-    end_time: time, end_day: bool
-) -> float:
-    """ Get fare for a single, continuous region """
-    start_station = path[0][0]
-    candidate_group: list[tuple[FareRule, int, int]] = []
-    path_lines = [x[1][0] for x in path if x[1] is not None]
-    for rule in rule_groups:
-        if any(line not in rule.lines for line in path_lines):
-            continue
-        if start_station in rule.starting or len(rule.starting) == 0:
-            if end_station in rule.ending or len(rule.ending) == 0:
-                if rule.get_fare(0, 0, start_station, end_station,
-                                 cur_date, start_time, start_day, end_time, end_day) is None:
-                    continue
-                candidate_group.append((rule, len(rule.starting), len(rule.ending)))
-    assert len(candidate_group) > 0, (path, rule_groups)
-    candidate_group = sorted(candidate_group, key=lambda x: (x[1] == 0, x[2] == 0, x[1], x[2]))
-    candidate = candidate_group[0][0]
-
-    # Calculate distance and station count
-    distance = 0
-    station_cnt = 0
-    for i, (station, ld) in enumerate(path):
-        if ld is None:
-            continue
-        line, direction = lines[ld[0]], ld[1]
-        next_station = path[i + 1][0] if i + 1 < len(path) else end_station
-        distance += line.two_station_dist(direction, station, next_station)
-        direction_stations = line.direction_stations(direction)
-        if not line.loop:
-            assert direction_stations.index(next_station) > direction_stations.index(station), (
-                station, next_station, direction_stations
-            )
-        delta = direction_stations.index(next_station) - direction_stations.index(station)
-        if delta < 0:
-            delta += len(direction_stations)
-        station_cnt += delta
-    result = candidate.get_fare(distance, station_cnt, start_station, end_station,
-                                cur_date, start_time, start_day, end_time, end_day)
-    assert result is not None, (
-        candidate, cur_date, get_time_str(start_time, start_day), get_time_str(end_time, end_day))
-    return result
-
-
 def parse_fare_rules(fare_file: str, lines: dict[str, Line], date_groups: dict[str, DateGroup]) -> Fare:
     """ Pare fare rule file """
     assert os.path.exists(fare_file), fare_file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Fare rules compiled for one date, so that the fare of a path is a sum of table lookups """
+
+# Libraries
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date, time
+from typing import TYPE_CHECKING
+
+from src.bfs.common import AbstractPath
+from src.city.date_group import DateGroup
+from src.city.line import Line
+from src.common.common import to_minutes
+
+if TYPE_CHECKING:
+    from src.fare.fare import Fare, FareRule
+
+# Compiled rule group: first applicable fare for single, (bounds, fares) for distance/station, dict for manual
+CompiledGroup = float | None | tuple[list[int], list[float | None]] | dict[tuple[str, str], float]
+
+
+class DirectionTable:
+    """ Station positions and cumulative distances along one direction of a line """
+
+    def __init__(self, line: Line, direction: str) -> None:
+        """ Constructor """
+        self.line = line
+        stations = line.direction_stations(direction)
+        dists = line.direction_dists(direction)
+        self.count = len(stations)
+        self.loop_dist = len(dists) == len(stations)
+        self.positions: dict[str, int] = {}
+        for i, station in enumerate(stations):
+            # Same as stations.index(), the first occurrence wins
+            self.positions.setdefault(station, i)
+        self.prefix = [0]
+        for dist in dists:
+            self.prefix.append(self.prefix[-1] + dist)
+
+    def leg(self, start_station: str, end_station: str) -> tuple[int, int]:
+        """ Distance and station count from start_station to end_station """
+        index1, index2 = self.positions[start_station], self.positions[end_station]
+        if not self.line.loop:
+            assert index2 > index1, (self.line, start_station, end_station)
+        if self.loop_dist:
+            if index1 < index2:
+                distance = self.prefix[index2] - self.prefix[index1]
+            else:
+                distance = self.prefix[-1] - self.prefix[index1] + self.prefix[index2]
+        else:
+            distance = abs(self.prefix[index2] - self.prefix[index1])
+        delta = index2 - index1
+        if delta < 0:
+            delta += self.count
+        return distance, delta
+
+
+class FareTable:
+    """ All the fare rules of a city resolved for one date """
+
+    def __init__(self, fare: Fare, lines: dict[str, Line], cur_date: date | DateGroup) -> None:
+        """ Constructor """
+        self.fare = fare
+        self.lines = lines
+        self.cur_date = cur_date
+        self.directions: dict[tuple[str, str], DirectionTable] = {}
+
+        # The day is cut into segments where every time-dependent rule is either on or off
+        bounds: set[int] = set()
+        for group in fare.rule_groups:
+            for rule in group.rules:
+                if rule.apply_time is None:
+                    continue
+                for start, end in rule.apply_time.minute_ranges(cur_date):
+                    if start is not None:
+                        bounds.add(start)
+                    if end is not None:
+                        bounds.add(end + 1)
+        self.bounds = sorted(bounds)
+        self.samples = [(self.bounds[0] - 1) if len(self.bounds) > 0 else 0] + self.bounds
+        self.compiled: dict[tuple[int, int, int], CompiledGroup] = {}
+        self.candidates: dict[tuple[frozenset[str], str, str, int, int], int] = {}
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<FareTable for {self.cur_date}: {len(self.samples)} time segments>"
+
+    def segment(self, cur_time: time, cur_day: bool) -> int:
+        """ Index of the time segment containing the given time """
+        return bisect_right(self.bounds, to_minutes(cur_time, cur_day))
+
+    def direction(self, line_name: str, direction: str) -> DirectionTable:
+        """ Get the table of a line direction """
+        key = (line_name, direction)
+        if key not in self.directions:
+            self.directions[key] = DirectionTable(self.lines[line_name], direction)
+        return self.directions[key]
+
+    def compile_group(self, index: int, entry: int, exit_: int) -> CompiledGroup:
+        """ Resolve the rules of a group that apply to the given entry and exit time segments """
+        key = (index, entry, exit_)
+        if key in self.compiled:
+            return self.compiled[key]
+        group = self.fare.rule_groups[index]
+        active: list[FareRule.Rule] = []
+        for rule in group.rules:
+            if rule.apply_time is not None:
+                sample = self.samples[exit_ if rule.basis == "exit" else entry]
+                if not rule.apply_time.covers_minute(self.cur_date, sample):
+                    continue
+            active.append(rule)
+        compiled: CompiledGroup
+        if group.basis == "single":
+            compiled = active[0].fare if len(active) > 0 else None
+        elif group.basis == "manual":
+            compiled = {}
+            for rule in active:
+                assert isinstance(rule.start, str) and isinstance(rule.end, str), rule
+                compiled.setdefault((rule.start, rule.end), rule.fare)
+        else:
+            # Step function of distance (or station count), first applicable rule wins
+            points = sorted({0} | {rule.start for rule in active if isinstance(rule.start, int)} | {
+                rule.end + 1 for rule in active if isinstance(rule.end, int)
+            })
+            fares: list[float | None] = []
+            for point in points:
+                fares.append(next((
+                    rule.fare for rule in active
+                    if isinstance(rule.start, int) and rule.start <= point and (
+                        rule.end is None or (isinstance(rule.end, int) and point <= rule.end)
+                    )
+                ), None))
+            compiled = (points, fares)
+        self.compiled[key] = compiled
+        return compiled
+
+    def lookup(self, index: int, entry: int, exit_: int, distance: int, station_cnt: int,
+               start_station: str, end_station: str) -> float | None:
+        """ Fare of a rule group, same as FareRule.get_fare() """
+        compiled = self.compile_group(index, entry, exit_)
+        if compiled is None or isinstance(compiled, float):
+            return compiled
+        if isinstance(compiled, dict):
+            return compiled.get((start_station, end_station))
+        points, fares = compiled
+        value = distance if self.fare.rule_groups[index].basis == "distance" else station_cnt
+        position = bisect_right(points, value) - 1
+        return fares[position] if position >= 0 else None
+
+    def select_group(self, path_lines: frozenset[str], start_station: str, end_station: str,
+                     entry: int, exit_: int) -> int:
+        """ Index of the rule group used for a continuous region (most specific stations first) """
+        key = (path_lines, start_station, end_station, entry, exit_)
+        if key in self.candidates:
+            return self.candidates[key]
+        candidate_group: list[tuple[int, int, int]] = []
+        for index, rule in enumerate(self.fare.rule_groups):
+            if any(line not in rule.lines for line in path_lines):
+                continue
+            if len(rule.starting) > 0 and start_station not in rule.starting:
+                continue
+            if len(rule.ending) > 0 and end_station not in rule.ending:
+                continue
+            if self.lookup(index, entry, exit_, 0, 0, start_station, end_station) is None:
+                continue
+            candidate_group.append((index, len(rule.starting), len(rule.ending)))
+        assert len(candidate_group) > 0, (path_lines, start_station, end_station)
+        candidate_group = sorted(candidate_group, key=lambda x: (x[1] == 0, x[2] == 0, x[1], x[2]))
+        self.candidates[key] = candidate_group[0][0]
+        return self.candidates[key]
+
+    def get_fare_single(
+        self, path: AbstractPath, end_station: str,
+        start_time: time, start_day: bool,
+        end_time: time, end_day: bool
+    ) -> float:
+        """ Get fare for a single, continuous region """
+        start_station = path[0][0]
+        distance = 0
+        station_cnt = 0
+        path_lines: set[str] = set()
+        for i, (station, ld) in enumerate(path):
+            if ld is None:
+                continue
+            path_lines.add(ld[0])
+            next_station = path[i + 1][0] if i + 1 < len(path) else end_station
+            leg_dist, leg_cnt = self.direction(*ld).leg(station, next_station)
+            distance += leg_dist
+            station_cnt += leg_cnt
+        entry = self.segment(start_time, start_day)
+        exit_ = self.segment(end_time, end_day)
+        index = self.select_group(frozenset(path_lines), start_station, end_station, entry, exit_)
+        result = self.lookup(index, entry, exit_, distance, station_cnt, start_station, end_station)
+        assert result is not None, (self.fare.rule_groups[index], self.cur_date, start_time, end_time)
+        return result
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Capacity-constrained assignment: split the flow of each pair among alternative paths by crowding on trains """
+
+# Libraries
+from datetime import date
+
+import numpy as np
+from tqdm import tqdm
+
+from src.bfs.avg_shortest_time import PathInfo
+from src.bfs.common import Path
+from src.bfs.k_shortest_path import k_shortest_path, equivalent_path
+from src.city.line import Line
+from src.city.through_spec import ThroughSpec
+from src.city.transfer import Transfer
+from src.common.common import from_minutes
+from src.graph.congestion_stats import LoadCounter, CongestionAccumulator
+from src.routing.through_train import ThroughTrain
+from src.routing.train import Train
+
+# Hop: train, from stop, to stop
+HopKey = tuple[Train, str, str]
+
+EPS = 1e-9
+
+
+def path_hops(path: Path, end_station: str) -> list[tuple[HopKey, int]]:
+    """ Hops between consecutive stops ridden by a path, with their minutes in the train """
+    hops: list[tuple[HopKey, int]] = []
+    for i, (station, train) in enumerate(path):
+        if not isinstance(train, Train):
+            continue
+        next_station = end_station if i == len(path) - 1 else path[i + 1][0]
+        prev_station, prev_minute = station, None
+        for stop, minute in train.minutes_virtual(station):
+            if prev_minute is not None:
+                hops.append(((train, prev_station, stop), minute - prev_minute))
+            if prev_minute is not None and stop == next_station:
+                break
+            prev_station, prev_minute = stop, minute
+    return hops
+
+
+class CapacityAssignment:
+    """ Flows of (from, to, minute) pairs among candidate paths, shifted away from trains loaded over capacity """
+
+    def __init__(
+        self, lines: dict[str, Line],
+        train_dict: dict[str, dict[str, dict[str, list[Train]]]], through_dict: dict[ThroughSpec, list[ThroughTrain]],
+        transfer_dict: dict[str, Transfer], virtual_dict: dict[tuple[str, str], Transfer], start_date: date,
+        load_factor: dict[tuple[str, str], float] | None = None, *,
+        alternatives: int = 3, penalty: float = 1.0, power: float = 4.0,
+        exclude_edge: bool = False, include_express: bool = False
+    ) -> None:
+        """ Constructor """
+        self.lines = lines
+        self.train_dict = train_dict
+        self.through_dict = through_dict
+        self.transfer_dict = transfer_dict
+        self.virtual_dict = virtual_dict
+        self.start_date = start_date
+        self.load_factor = load_factor
+        self.alternatives = alternatives
+        self.penalty = penalty
+        self.power = power
+        self.exclude_edge = exclude_edge
+        self.include_express = include_express
+
+        # Pairs: (from, to, starting minute), demand and whether alternatives are already searched
+        self.pairs: list[tuple[str, str, int]] = []
+        self.demand: list[float] = []
+        self.searched: list[bool] = []
+
+        # Candidate paths: pair id, duration, path and flow
+        self.paths: list[Path] = []
+        self.path_pair: list[int] = []
+        self.durations: list[int] = []
+        self.flows = np.zeros(0, dtype=np.float64)
+        self.pending_flows: list[float] = []
+
+        # Hops of all candidates, flattened with the candidate id of each hop
+        self.hops = LoadCounter()
+        self.capacity: list[float] = []
+        self.hop_path: list[int] = []
+        self.hop_ids: list[int] = []
+        self.hop_minutes: list[int] = []
+        self.hop_arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self.iterations = 0
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<CapacityAssignment: {len(self.pairs)} pairs, {len(self.paths)} paths, " + \
+            f"{len(self.hops.keys)} hops, {self.iterations} iterations>"
+
+    def add_candidate(self, pair_id: int, duration: int, path: Path, flow: float = 0.0) -> None:
+        """ Add a candidate path of a pair """
+        to_station = self.pairs[pair_id][1]
+        path_id = len(self.paths)
+        for hop, minutes in path_hops(path, to_station):
+            hop_id = self.hops.id(hop)
+            if hop_id == len(self.capacity):
+                self.capacity.append(float(hop[0].train_capacity()))
+            self.hop_path.append(path_id)
+            self.hop_ids.append(hop_id)
+            self.hop_minutes.append(minutes)
+        self.paths.append(path)
+        self.path_pair.append(pair_id)
+        self.durations.append(duration)
+        self.pending_flows.append(flow)
+        self.hop_arrays = None
+
+    def flush(self) -> None:
+        """ Move the flows of new candidates into the flow array """
+        if len(self.pending_flows) > 0:
+            self.flows = np.concatenate((self.flows, np.array(self.pending_flows, dtype=np.float64)))
+            self.pending_flows.clear()
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Candidate id, hop id and minutes of every hop, converted only after new candidates """
+        if self.hop_arrays is None:
+            self.hop_arrays = (
+                np.array(self.hop_path, dtype=np.int64), np.array(self.hop_ids, dtype=np.int64),
+                np.array(self.hop_minutes, dtype=np.float64)
+            )
+        return self.hop_arrays
+
+    def add_pair(self, from_station: str, to_station: str, start_minute: int, path_info: PathInfo) -> None:
+        """ Add a pair with its shortest path, which first takes the whole demand """
+        pair_id = len(self.pairs)
+        self.pairs.append((from_station, to_station, start_minute))
+        demand = 1.0 if self.load_factor is None else self.load_factor.get((from_station, to_station), 1.0)
+        self.demand.append(demand)
+        self.searched.append(False)
+        self.add_candidate(pair_id, path_info[0], path_info[1], demand)
+
+    def search_alternatives(self, pair_ids: list[int]) -> None:
+        """ Add the k-shortest paths of each pair as new candidates """
+        candidates: dict[int, list[Path]] = {}
+        for path_id, pair_id in enumerate(self.path_pair):
+            candidates.setdefault(pair_id, []).append(self.paths[path_id])
+        for pair_id in tqdm(pair_ids, desc="Searching alternatives"):
+            from_station, to_station, start_minute = self.pairs[pair_id]
+            self.searched[pair_id] = True
+            for result, path in k_shortest_path(
+                self.lines, self.train_dict, self.through_dict, self.transfer_dict, self.virtual_dict,
+                from_station, to_station, self.start_date, from_minutes(start_minute), self.alternatives,
+                exclude_edge=self.exclude_edge, include_express=self.include_express, verbose=False
+            ):
+                if any(equivalent_path(path, other) for other in candidates[pair_id]):
+                    continue
+                candidates[pair_id].append(path)
+                self.add_candidate(pair_id, result.total_duration(), path)
+        self.flush()
+
+    def hop_ratios(self) -> np.ndarray:
+        """ Load over capacity of each hop """
+        self.flush()
+        hop_path, hop_ids, _ = self.arrays()
+        loads = np.bincount(hop_ids, weights=self.flows[hop_path], minlength=len(self.capacity))
+        return loads / np.array(self.capacity, dtype=np.float64)
+
+    def path_costs(self, ratios: np.ndarray) -> np.ndarray:
+        """ Duration of each candidate, plus the crowding penalty of the minutes spent in each hop """
+        hop_path, hop_ids, hop_minutes = self.arrays()
+        crowding = hop_minutes * self.penalty * ratios[hop_ids] ** self.power
+        return np.array(self.durations, dtype=np.float64) + np.bincount(
+            hop_path, weights=crowding, minlength=len(self.paths)
+        )
+
+    def iterate(self) -> tuple[float, int, int]:
+        """ One round of re-routing (returns relative gap, overloaded hops and re-routed pairs) """
+        self.iterations += 1
+        path_pair = np.array(self.path_pair, dtype=np.int64)
+        demand = np.array(self.demand, dtype=np.float64)
+
+        # Only pairs riding an overloaded hop need alternatives
+        ratios = self.hop_ratios()
+        overloaded = ratios > 1.0
+        hop_path, hop_ids, _ = self.arrays()
+        path_over = np.bincount(hop_path, weights=overloaded[hop_ids], minlength=len(self.paths)) > 0
+        pair_over = np.zeros(len(self.pairs), dtype=bool)
+        pair_over[path_pair[path_over & (self.flows > EPS)]] = True
+        pending = [int(pair_id) for pair_id in np.flatnonzero(pair_over) if not self.searched[pair_id]]
+        if len(pending) > 0:
+            self.search_alternatives(pending)
+            path_pair = np.array(self.path_pair, dtype=np.int64)
+            ratios = self.hop_ratios()
+
+        # Best candidate of each pair under the current crowding
+        costs = self.path_costs(ratios)
+        min_cost = np.full(len(self.pairs), np.inf)
+        np.minimum.at(min_cost, path_pair, costs)
+        best_order = np.flatnonzero(costs <= min_cost[path_pair] + EPS)
+        _, first = np.unique(path_pair[best_order], return_index=True)
+        best = best_order[first]
+        total_cost = float((self.flows * costs).sum())
+        gap = total_cost - float((demand * min_cost).sum())
+
+        # Method of successive averages, only for pairs with flow on a worse candidate
+        worse = np.zeros(len(self.pairs), dtype=bool)
+        worse[path_pair[(self.flows > EPS) & (costs > min_cost[path_pair] + EPS)]] = True
+        step = 1.0 / (self.iterations + 1)
+        target = np.zeros(len(self.paths), dtype=np.float64)
+        target[best] = demand[path_pair[best]]
+        moving = worse[path_pair]
+        self.flows[moving] = (1 - step) * self.flows[moving] + step * target[moving]
+        return (gap / total_cost if total_cost > 0 else 0.0), int(overloaded.sum()), int(worse.sum())
+
+    def assign(self, iterations: int, tolerance: float = 1e-3) -> None:
+        """ Re-route until the relative gap is under tolerance, or no pair can be improved """
+        for i in range(iterations):
+            gap, overloaded, rerouted = self.iterate()
+            print(f"Iteration #{i + 1}: relative gap {gap:.6f}, {overloaded} overloaded hops, " +
+                  f"{rerouted} pairs re-routed")
+            if gap < tolerance or rerouted == 0:
+                break
+
+    def max_ratio(self) -> float:
+        """ Highest load over capacity among all hops """
+        return float(self.hop_ratios().max(initial=0.0))
+
+    def accumulate(self, stats: CongestionAccumulator) -> None:
+        """ Add every candidate with flow into the congestion statistics """
+        self.flush()
+        for path_id in np.flatnonzero(self.flows > EPS).tolist():
+            pair_id = self.path_pair[path_id]
+            from_station, to_station, start_minute = self.pairs[pair_id]
+            stats.add_path(
+                from_station, to_station, start_minute, self.paths[path_id],
+                share=float(self.flows[path_id]) / self.demand[pair_id]
+            )
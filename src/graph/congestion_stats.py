@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Streaming congestion statistics, accumulated into arrays over integer ids as paths arrive """
+
+# Libraries
+from collections.abc import Hashable, Iterable
+from math import ceil
+from typing import Any
+
+import numpy as np
+
+from src.bfs.bfs import expand_path
+from src.bfs.common import Path, VTSpec
+from src.city.line import Line
+from src.city.transfer import TransferSpec
+from src.common.common import TimeSpec, from_minutes, to_minutes
+from src.routing.train import Train
+
+LoadTuple = tuple[float, float, float, float]
+VTSpec2 = tuple[tuple[str, str] | None, tuple[str, str] | None]
+StationPassingStats = tuple[dict[str, float], dict[str, dict[tuple[str, str], float]]]
+
+# Segment: from station, to station, line name (None = virtual transfer, or undirected)
+SegmentKey = tuple[str, str, str | None]
+LoadDict = dict[SegmentKey, tuple[float, set[TimeSpec], set[Train | VTSpec]]]
+CongestionStats = tuple[
+    dict[str, LoadTuple], LoadTuple, LoadDict,
+    dict[str, tuple[float, dict[VTSpec2, float]]],
+    dict[tuple[str, str], tuple[float, dict[TransferSpec, float]]], set[Train]
+]
+
+_FLUSH_SIZE = 1 << 16
+_DAY_MINUTES = 48 * 60
+
+
+class LoadCounter:
+    """ Loads of keys interned into integer ids, added in batches into a (columns, ids) array """
+
+    def __init__(self, columns: int = 1, keys: Iterable[Hashable] = ()) -> None:
+        """ Constructor """
+        self.columns = columns
+        self.ids: dict[Any, int] = {}
+        self.keys: list[Any] = []
+        self.loads = np.zeros((columns, 0), dtype=np.float64)
+        self.pending_ids: list[int] = []
+        self.pending_columns: list[int] = []
+        self.pending_loads: list[float] = []
+        for key in keys:
+            self.id(key)
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<LoadCounter: {len(self.keys)} keys, {self.columns} columns>"
+
+    def id(self, key: Any) -> int:
+        """ Get the id of a key, allocating a new one if needed """
+        index = self.ids.get(key)
+        if index is None:
+            index = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return index
+
+    def add(self, key: Any, load: float, column: int = 0) -> int:
+        """ Add load to a key (returns its id) """
+        index = self.id(key)
+        self.pending_ids.append(index)
+        self.pending_columns.append(column)
+        self.pending_loads.append(load)
+        if len(self.pending_ids) >= _FLUSH_SIZE:
+            self.flush()
+        return index
+
+    def flush(self) -> None:
+        """ Add all the pending loads into the array """
+        size = len(self.keys)
+        if self.loads.shape[1] < size:
+            self.loads = np.pad(self.loads, ((0, 0), (0, size - self.loads.shape[1])))
+        if len(self.pending_ids) == 0:
+            return
+        flat = np.array(self.pending_columns, dtype=np.int64) * size + np.array(self.pending_ids, dtype=np.int64)
+        self.loads += np.bincount(
+            flat, weights=np.array(self.pending_loads, dtype=np.float64), minlength=self.columns * size
+        ).reshape((self.columns, size))
+        self.pending_ids.clear()
+        self.pending_columns.clear()
+        self.pending_loads.clear()
+
+    def array(self) -> np.ndarray:
+        """ Loads of shape (columns, ids) """
+        self.flush()
+        return self.loads
+
+    def totals(self) -> np.ndarray:
+        """ Total load of each id """
+        return self.array().sum(axis=0)
+
+
+class CongestionAccumulator:
+    """ Congestion statistics of paths, consumed one at a time so that the paths need not be kept """
+
+    def __init__(
+        self, lines: dict[str, Line], load_factor: dict[tuple[str, str], float] | None = None, *,
+        passing: bool = False, bucket_size: int | None = None
+    ) -> None:
+        """ Constructor """
+        self.lines = lines
+        self.load_factor = load_factor
+        self.passing = passing
+        self.bucket_size = bucket_size
+        self.path_count: float = 0
+        self.train_set: set[Train] = set()
+
+        # Line columns: total, entry, exit, transfer
+        self.line_loads = LoadCounter(4, lines.keys())
+
+        # Segment columns: time buckets of the arrival at the segment (only one if there are no buckets)
+        self.segment_loads = LoadCounter(1 if bucket_size is None else ceil(_DAY_MINUTES / bucket_size))
+        self.segment_times: list[set[TimeSpec]] = []
+        self.segment_trains: list[set[Train | VTSpec]] = []
+
+        # (station, (from line, direction), (to line, direction)) and (station1, station2, transfer spec)
+        self.transfer_loads = LoadCounter()
+        self.virtual_loads = LoadCounter()
+
+        # Station and (station, (line, direction)) passing counts, only if passing is set
+        self.station_loads = LoadCounter()
+        self.station_line_loads = LoadCounter()
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<CongestionAccumulator: {self.path_count:g} paths, {len(self.segment_loads.keys)} segments>"
+
+    def get_load(self, from_station: str, to_station: str) -> float:
+        """ Load of one path """
+        if self.load_factor is None:
+            return 1.0
+        return self.load_factor.get((from_station, to_station), 1.0)
+
+    def bucket(self, minute: int) -> int:
+        """ Time bucket of a minute """
+        if self.bucket_size is None:
+            return 0
+        return min(max(minute, 0) // self.bucket_size, self.segment_loads.columns - 1)
+
+    def add_segment(self, key: SegmentKey, load: float, column: int) -> int:
+        """ Add load to a segment (returns its id) """
+        index = self.segment_loads.add(key, load, column)
+        if index == len(self.segment_times):
+            self.segment_times.append(set())
+            self.segment_trains.append(set())
+        return index
+
+    def add_path(
+        self, from_station: str, to_station: str, start_minute: int, path: Path, share: float = 1.0
+    ) -> None:
+        """ Add one path starting at start_minute, taking a share of the load of its pair """
+        load = self.get_load(from_station, to_station) * share
+        self.path_count += share
+        for i, (path_station, path_train) in enumerate(path):
+            next_station = to_station if i == len(path) - 1 else path[i + 1][0]
+            if i < len(path) - 1:
+                next_train = path[i + 1][1]
+                key = (
+                    (path_train.line.name, path_train.direction) if isinstance(path_train, Train) else None,
+                    (next_train.line.name, next_train.direction) if isinstance(next_train, Train) else None
+                )
+                assert key[0] is not None or key[1] is not None, (path_train, path_station, next_train)
+                self.transfer_loads.add((next_station, key), load)
+            if not isinstance(path_train, Train):
+                self.virtual_loads.add((path_station, next_station, path_train[2]), load)
+                continue
+            prev_virtual = (i == 0 or not isinstance(path[i - 1][1], Train))
+            next_virtual = (i == len(path) - 1 or not isinstance(path[i + 1][1], Train))
+            line_name = path_train.line.name
+            self.line_loads.add(line_name, load, 0)
+            if prev_virtual:
+                self.line_loads.add(line_name, load, 1)
+            if next_virtual:
+                self.line_loads.add(line_name, load, 2)
+            if not prev_virtual and not next_virtual:
+                self.line_loads.add(line_name, load, 3)
+            self.train_set.add(path_train)
+
+        expanded = expand_path(path, to_station, expand_all=True)
+        column = self.bucket(start_minute)
+        for i, (path_station, path_train) in enumerate(expanded):
+            next_station = to_station if i == len(expanded) - 1 else expanded[i + 1][0]
+            segment_key = (path_station, next_station, path_train.line.name if isinstance(path_train, Train) else None)
+            arrival: TimeSpec | None = None
+            if isinstance(path_train, Train):
+                if path_station not in path_train.skip_stations:
+                    if path_station not in path_train.arrival_time:
+                        assert path_train.loop_next is not None and \
+                               path_station in path_train.loop_next.arrival_time, (expanded, path_station, path_train)
+                        path_train = path_train.loop_next
+                    arrival = path_train.arrival_time[path_station]
+            elif i == 0:
+                arrival = from_minutes(start_minute)
+            else:
+                index = i - 1
+                prev_train = expanded[index][1]
+                while index >= 0 and isinstance(prev_train, Train) and expanded[index][0] in prev_train.skip_stations:
+                    index -= 1
+                    prev_train = expanded[index][1]
+                assert index >= 0 and isinstance(prev_train, Train), (expanded, index, i, prev_train)
+                arrival = prev_train.arrival_time_virtual(expanded[index][0])[path_station]
+            if arrival is not None:
+                column = self.bucket(to_minutes(*arrival))
+            segment_id = self.add_segment(segment_key, load, column)
+            if arrival is not None:
+                self.segment_times[segment_id].add(arrival)
+                self.segment_trains[segment_id].add(path_train)
+
+        if self.passing:
+            self.add_passing(from_station, to_station, path, expanded, load)
+
+    def add_passing(self, from_station: str, to_station: str, path: Path, expanded: Path, load: float) -> None:
+        """ Add the stations passed by one path """
+        stations = {station for station, _ in expanded}
+        stations.update((from_station, to_station))
+        for station in stations:
+            self.station_loads.add(station, load)
+        station_lines: set[tuple[str, tuple[str, str]]] = set()
+        transfer_stations = {path[i + 1][0] for i in range(len(path) - 1)}
+        for i, (station, train) in enumerate(path):
+            if not isinstance(train, Train):
+                continue
+            next_station = to_station if i == len(path) - 1 else path[i + 1][0]
+            for line_station in train.two_station_interval(station, next_station, expand_all=True):
+                if line_station not in transfer_stations:
+                    station_lines.add((line_station, (train.line.name, train.direction)))
+            if next_station not in transfer_stations:
+                station_lines.add((next_station, (train.line.name, train.direction)))
+        for station_line in station_lines:
+            self.station_line_loads.add(station_line, load)
+
+    def add_paths(self, paths: dict[str, dict[str, dict[int, Any]]]) -> None:
+        """ Add all paths of a from -> to -> minute -> (duration, path, result) dict """
+        for from_station, to_dict in paths.items():
+            for to_station, inner_dict in to_dict.items():
+                for start_minute, (_, path, _) in inner_dict.items():
+                    self.add_path(from_station, to_station, start_minute, path)
+
+    def segment_array(self, *, have_direction: bool = True) -> tuple[list[SegmentKey], list[int], np.ndarray]:
+        """ Segment keys, the merged id of each segment and the (buckets, segments) load array """
+        loads = self.segment_loads.array()
+        if have_direction:
+            return self.segment_loads.keys, list(range(len(self.segment_loads.keys))), loads
+
+        # Both directions are merged into whichever was seen first
+        keys: list[SegmentKey] = []
+        key_ids: dict[SegmentKey, int] = {}
+        merged_ids: list[int] = []
+        for from_station, to_station, _ in self.segment_loads.keys:
+            key = (from_station, to_station, None)
+            if (to_station, from_station, None) in key_ids:
+                key = (to_station, from_station, None)
+            if key not in key_ids:
+                key_ids[key] = len(keys)
+                keys.append(key)
+            merged_ids.append(key_ids[key])
+        merged = np.zeros((loads.shape[0], len(keys)), dtype=np.float64)
+        np.add.at(merged.T, np.array(merged_ids, dtype=np.int64), loads.T)
+        return keys, merged_ids, merged
+
+    def load_dict(self, *, have_direction: bool = True) -> LoadDict:
+        """ (from, to, line) -> (people, arrival times, trains) """
+        keys, merged_ids, loads = self.segment_array(have_direction=have_direction)
+        totals = loads.sum(axis=0).tolist()
+        result: LoadDict = {key: (totals[i], set(), set()) for i, key in enumerate(keys)}
+        for segment_id, merged_id in enumerate(merged_ids):
+            result[keys[merged_id]][1].update(self.segment_times[segment_id])
+            result[keys[merged_id]][2].update(self.segment_trains[segment_id])
+        return result
+
+    def line_stats(self) -> dict[str, LoadTuple]:
+        """ Line name -> (total, entry, exit, transfer) """
+        loads = self.line_loads.array().T.tolist()
+        return {name: (loads[i][0], loads[i][1], loads[i][2], loads[i][3]) for i, name in enumerate(self.lines.keys())}
+
+    def all_stats(self) -> LoadTuple:
+        """ (total, entry, exit, transfer) of all lines """
+        total, entry, exit_people, transfer = self.line_loads.array().sum(axis=1).tolist()
+        return total, entry, exit_people, transfer
+
+    def transfer_stats(self) -> dict[str, tuple[float, dict[VTSpec2, float]]]:
+        """ Station -> (people, (from line, direction), (to line, direction) -> people) """
+        inner: dict[str, dict[VTSpec2, float]] = {}
+        for (station, key), people in zip(self.transfer_loads.keys, self.transfer_loads.totals().tolist()):
+            inner.setdefault(station, {})[key] = people
+        return {station: (sum(inner_dict.values()), inner_dict) for station, inner_dict in inner.items()}
+
+    def virtual_stats(self) -> dict[tuple[str, str], tuple[float, dict[TransferSpec, float]]]:
+        """ (station1, station2) -> (people, transfer spec -> people) """
+        inner: dict[tuple[str, str], dict[TransferSpec, float]] = {}
+        for (station1, station2, spec), people in zip(self.virtual_loads.keys, self.virtual_loads.totals().tolist()):
+            inner.setdefault((station1, station2), {})[spec] = people
+        return {key: (sum(inner_dict.values()), inner_dict) for key, inner_dict in inner.items()}
+
+    def congestion_stats(self, *, have_direction: bool = True) -> CongestionStats:
+        """ Same as get_congestion_stats() """
+        return (
+            self.line_stats(), self.all_stats(), self.load_dict(have_direction=have_direction),
+            self.transfer_stats(), self.virtual_stats(), self.train_set
+        )
+
+    def passing_stats(self) -> StationPassingStats:
+        """ Same as get_station_passing_stats() """
+        assert self.passing, self
+        station_stats = dict(zip(self.station_loads.keys, self.station_loads.totals().tolist()))
+        station_line_stats: dict[str, dict[tuple[str, str], float]] = {}
+        for (station, line_direction), people in zip(
+            self.station_line_loads.keys, self.station_line_loads.totals().tolist()
+        ):
+            station_line_stats.setdefault(station, {})[line_direction] = people
+        return station_stats, station_line_stats
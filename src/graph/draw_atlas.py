@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Draw an atlas of equ-time maps, for many origins or for every departure time of one origin """
+
+# Libraries
+import argparse
+import os
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image, ImageDraw
+from matplotlib.colors import Colormap
+from tqdm import tqdm
+
+from src.bfs.avg_shortest_time import NO_VIRTUAL, CityTrains, parse_city_trains, get_minute_list
+from src.bfs.lean_result import sweep_lean_bfs
+from src.city.ask_for_city import ask_for_city, ask_for_station, ask_for_date, ask_for_map
+from src.city.city import City
+from src.common.common import parse_comma, parse_time_opt, from_minutes, get_time_repr
+from src.common.worker_pool import get_pool
+from src.graph.draw_map import map_args, get_colormap, get_levels_from_source, get_map_data, draw_all_station, \
+    draw_contour_wrap
+from src.graph.map import Map
+
+# reset max pixel
+Image.MAX_IMAGE_PIXELS = 500000000
+
+# Frame: file name, title, value of each station
+Frame = tuple[str, str, dict[str, float]]
+
+
+def origin_frames(
+    args: argparse.Namespace, city: City, origins: list[str], start_date: date, trains: CityTrains
+) -> Iterator[Frame]:
+    """ Average travel time from each origin, all searches sharing the same trains and worker pool """
+    for i, origin in enumerate(origins):
+        _, _, result_dict = get_map_data(args, (city, origin, start_date), trains=trains)
+        result_dict[origin] = 0.0
+        yield f"{i:04}_{origin}", origin, result_dict
+
+
+def time_frames(
+    args: argparse.Namespace, city: City, origin: str, start_date: date, trains: CityTrains
+) -> Iterator[Frame]:
+    """ Travel time from one origin at every interval of the day, in one sweep over all the departure times """
+    train_dict, through_dict = trains
+    limit_start = parse_time_opt(args.limit_start)
+    limit_end = parse_time_opt(args.limit_end)
+    minute_list = get_minute_list(
+        city.lines, train_dict, start_date, origin,
+        limit_start=(None if limit_start is None else limit_start[0]),
+        limit_start_day=(False if limit_start is None else limit_start[1]),
+        limit_end=(None if limit_end is None else limit_end[0]),
+        limit_end_day=(False if limit_end is None else limit_end[1])
+    )
+    assert len(minute_list) > 0, f"No trains at {origin} in the specified time range!"
+    virtual_dict = city.virtual_transfers if not args.exclude_virtual else NO_VIRTUAL
+    pool = get_pool(city.lines, train_dict, through_dict, city.transfers, virtual_dict)
+    for (_, minute), lean_results in sweep_lean_bfs(
+        pool, [(origin, minute) for minute in range(min(minute_list), max(minute_list) + 1, args.interval)],
+        city.lines, train_dict, through_dict, city.transfers, virtual_dict, start_date,
+        exclude_edge=args.exclude_edge, include_express=args.include_express
+    ):
+        time_str = get_time_repr(*from_minutes(minute))
+        result_dict = {station: float(lean_result[1]) for station, lean_result in lean_results.items()}
+        result_dict[origin] = 0.0
+        yield f"{minute:04}_{time_str[:5].replace(':', '')}", f"{origin} {time_str}", result_dict
+
+
+def render_frame(
+    base_img: Image.Image, args: argparse.Namespace, cmap: Colormap, map_obj: Map,
+    title: str, result_dict: dict[str, float], levels: list[int]
+) -> Image.Image:
+    """ Draw stations and contours of one frame on a copy of the map """
+    # Same station order in every frame, so that frames reaching the same stations share interpolation weights
+    result_dict = {
+        station: result_dict[station] for station in map_obj.coordinates.keys() if station in result_dict
+    } | {station: value for station, value in result_dict.items() if station not in map_obj.coordinates}
+    img = base_img.copy()
+    draw = ImageDraw.Draw(img)
+    draw_all_station(draw, (0.0, 0.0, 0.0), map_obj, result_dict)
+    draw.text((img.size[0] * 0.02, img.size[1] * 0.02), title, fill=(0, 0, 0), font_size=img.size[1] // 40)
+
+    fig = draw_contour_wrap(img, args, cmap, map_obj, result_dict, levels=levels, save=False)
+    fig.set_dpi(args.dpi * args.frame_scale)
+    fig.canvas.draw()
+    frame = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).convert("RGB")  # type: ignore
+    plt.close(fig)
+    return frame
+
+
+class FrameWriter:
+    """ Encode frames into files on background threads, keeping small copies for the animation """
+
+    def __init__(self, output_dir: str, workers: int, animation_width: int | None = None) -> None:
+        """ Constructor """
+        self.output_dir = output_dir
+        self.animation_width = animation_width
+        self.executor = ThreadPoolExecutor(workers)
+        self.max_pending = 2 * workers
+        self.pending: list[Future] = []
+        self.thumbnails: list[Image.Image] = []
+        os.makedirs(output_dir, exist_ok=True)
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<FrameWriter to {self.output_dir}: {len(self.pending)} pending>"
+
+    def encode(self, frame: Image.Image, name: str) -> Image.Image | None:
+        """ Save one frame, and return its animation copy if needed """
+        frame.save(os.path.join(self.output_dir, name + ".png"))
+        if self.animation_width is None:
+            return None
+        height = max(1, round(frame.size[1] * self.animation_width / frame.size[0]))
+        return frame.resize((self.animation_width, height), Image.Resampling.LANCZOS)
+
+    def wait_one(self) -> None:
+        """ Wait for the oldest frame to be encoded """
+        thumbnail = self.pending.pop(0).result()
+        if thumbnail is not None:
+            self.thumbnails.append(thumbnail)
+
+    def submit(self, frame: Image.Image, name: str) -> None:
+        """ Encode a frame, blocking only when too many frames are held in memory """
+        while len(self.pending) >= self.max_pending:
+            self.wait_one()
+        self.pending.append(self.executor.submit(self.encode, frame, name))
+
+    def close(self) -> list[Image.Image]:
+        """ Wait for all frames, and return the animation copies in order """
+        while len(self.pending) > 0:
+            self.wait_one()
+        self.executor.shutdown()
+        return self.thumbnails
+
+
+def save_animation(path: str, frames: list[Image.Image], duration: int) -> None:
+    """ Stitch frames into an animation (format decided by the extension) """
+    assert len(frames) > 0, path
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+
+
+def main() -> None:
+    """ Main function """
+    def append_arg(parser: argparse.ArgumentParser) -> None:
+        """ Append more arguments """
+        parser.add_argument("--mode", choices=["origin", "time"], default="origin",
+                            help="Draw one frame for each origin, or for each departure time of one origin")
+        parser.add_argument("--origins", help="Origin stations (default to all stations in origin mode)")
+        parser.add_argument("--interval", type=int, default=10, help="Minutes between frames in time mode")
+        parser.add_argument("--frame-scale", type=float, default=1.0, help="Scale of the frames relative to the map")
+        parser.add_argument("--output-dir", default="../atlas", help="Output directory of the frames")
+        parser.add_argument("--animation", help="Also stitch the frames into this animation file (.gif/.webp)")
+        parser.add_argument("--frame-duration", type=int, default=500, help="Duration of each animation frame (ms)")
+        parser.add_argument("--animation-width", type=int, default=1000, help="Width of the animation")
+        parser.add_argument("--encode-workers", type=int, default=4, help="Number of threads encoding frames")
+
+    args = map_args(append_arg, have_output=False, have_engine=True)
+    assert args.interval > 0 and args.frame_scale > 0, (args.interval, args.frame_scale)
+    if args.mode == "time" and args.data_source != "time":
+        print("Error: only -d time is supported in time mode!")
+        return
+    if args.mode == "time" and args.engine != "bfs":
+        print("Error: only --engine bfs is supported in time mode!")
+        return
+    cmap = get_colormap(args.color_map)
+    levels = get_levels_from_source(args)
+
+    city = ask_for_city()
+    trains = parse_city_trains(city, include_lines=args.include_lines, exclude_lines=args.exclude_lines)
+    if args.origins is not None:
+        origins = [city.station_full_name(x) for x in parse_comma(args.origins)]
+    elif args.mode == "origin":
+        origins = [station for station in city.station_lines.keys() if any(
+            line.name in trains[0] for line in city.station_lines[station]
+        )]
+    else:
+        origins = [ask_for_station(city)[0]]
+    if args.mode == "time":
+        assert len(origins) == 1, "Time mode needs exactly one origin!"
+    start_date = ask_for_date()
+    map_obj = ask_for_map(city)
+    base_img = Image.open(map_obj.path)
+    base_img.load()
+
+    writer = FrameWriter(args.output_dir, args.encode_workers, None if args.animation is None else args.animation_width)
+    frames = origin_frames(args, city, origins, start_date, trains) if args.mode == "origin" else time_frames(
+        args, city, origins[0], start_date, trains
+    )
+    count = 0
+    for name, title, result_dict in tqdm(frames, desc="Drawing frames"):
+        writer.submit(render_frame(base_img, args, cmap, map_obj, title, result_dict, levels), name)
+        count += 1
+    thumbnails = writer.close()
+    print(f"Drawing done! {count} frames saved to {args.output_dir}")
+    if args.animation is not None:
+        save_animation(args.animation, thumbnails, args.frame_duration)
+        print(f"Animation saved to {args.animation}")
+
+
+# Call main
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,7 @@ def main() -> None:
         parser.add_argument("--strategy", choices=["avg", "min", "max"], default="avg",
                             help="Strategy for combining station data")
 
-    args = map_args(append_arg)
+    args = map_args(append_arg, have_engine=True)
     cmap = get_colormap(args.color_map)
     levels = get_levels_from_source(args)
 
@@ -33,7 +33,7 @@ def main() -> None:
         args.limit_start, args.limit_end,
         include_lines=args.include_lines, exclude_lines=args.exclude_lines,
         exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express,
-        strategy=args.strategy
+        engine=args.engine, strategy=args.strategy
     )
     data_index = data_criteria.index(args.data_source)
     result_dict: dict[str, float] = {station: cast(float, x[data_index]) / (
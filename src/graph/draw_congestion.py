@@ -16,15 +16,16 @@ from matplotlib.colors import Colormap
 from scipy.interpolate import griddata  # type: ignore
 
 from src.bfs.avg_shortest_time import PathInfo
-from src.bfs.bfs import expand_path
 from src.bfs.common import VTSpec
 from src.city.ask_for_city import ask_for_city, ask_for_date, ask_for_time_seq, ask_for_map
 from src.city.city import City
 from src.city.line import Line, station_full_name
-from src.city.transfer import TransferSpec
-from src.common.common import suffix_s, TimeSpec, from_minutes, get_time_seq_repr, to_pinyin, percentage_str
+from src.common.common import suffix_s, TimeSpec, from_minutes, get_time_seq_repr, get_time_repr, to_pinyin, \
+    percentage_str
 from src.dist_graph.adaptor import get_dist_graph
-from src.dist_graph.exotic_path import all_station_bfs
+from src.dist_graph.exotic_path import station_paths
+from src.graph.capacity_assignment import CapacityAssignment
+from src.graph.congestion_stats import CongestionAccumulator, CongestionStats, LoadTuple, VTSpec2, StationPassingStats
 from src.graph.draw_map import draw_station, map_args, get_colormap
 from src.graph.draw_path import get_edge_wide, draw_path
 from src.routing.through_train import parse_through_train
@@ -33,21 +34,12 @@ from src.stats.common import display_first
 
 # reset max pixel
 Image.MAX_IMAGE_PIXELS = 500000000
-LoadTuple = tuple[float, float, float, float]
-VTSpec2 = tuple[tuple[str, str] | None, tuple[str, str] | None]
 EPS = 1e-5
 LineMetric = Literal[
     "total_passenger", "entry_passenger", "exit_passenger", "transfer_passenger", "density_distance", "density_station"
 ]
 LoadMetric = Literal["passenger", "congestion"]
 TransferSource = Literal["passing", "transfer", "line", "station_line"]
-StationPassingStats = tuple[dict[str, float], dict[str, dict[tuple[str, str], float]]]
-
-
-def add_tuple(tuple1: LoadTuple, tuple2: tuple[float, ...]) -> LoadTuple:
-    """ Add two tuples """
-    assert len(tuple1) == len(tuple2), (tuple1, tuple2)
-    return tuple1[0] + tuple2[0], tuple1[1] + tuple2[1], tuple1[2] + tuple2[2], tuple1[3] + tuple2[3]
 
 
 def line_metric_func(lines: dict[str, Line], line_name: str, data: LoadTuple, *,
@@ -133,108 +125,11 @@ def get_congestion_stats(
     paths: dict[str, dict[str, dict[int, PathInfo]]], lines: dict[str, Line],
     load_factor: dict[tuple[str, str], float] | None = None,
     *, have_direction: bool = True
-) -> tuple[
-    dict[str, LoadTuple], LoadTuple,
-    dict[tuple[str, str, str | None], tuple[float, set[TimeSpec], set[Train | VTSpec]]],
-    dict[str, tuple[float, dict[VTSpec2, float]]],
-    dict[tuple[str, str], tuple[float, dict[TransferSpec, float]]], set[Train]
-]:
+) -> CongestionStats:
     """ Get congestion stats from paths """
-    # For each line, name -> (total, entry, exit, transfer)
-    line_stats: dict[str, LoadTuple] = {
-        name: (0.0, 0.0, 0.0, 0.0) for name in lines.keys()
-    }
-    all_stats: LoadTuple = (0.0, 0.0, 0.0, 0.0)
-    
-    # Load dict: (start, end, line) -> (people, duration, trains)
-    load_dict: dict[tuple[str, str, str | None], tuple[float, set[TimeSpec], set[Train | VTSpec]]] = {}
-
-    # Transfer stats: (station1, station2) -> (people, direction -> people)
-    transfer_stats: dict[str, tuple[float, dict[VTSpec2, float]]] = {}
-    virtual_stats: dict[tuple[str, str], tuple[float, dict[TransferSpec, float]]] = {}
-    
-    train_set: set[Train] = set()
-    for from_station, to_dict in paths.items():
-        for to_station, inner_dict in to_dict.items():
-            if load_factor is None or (from_station, to_station) not in load_factor:
-                load = 1.0
-            else:
-                load = load_factor[(from_station, to_station)]
-            for start_minute, (_, path, _) in inner_dict.items():
-                start_time, start_day = from_minutes(start_minute)
-                for i, (path_station, path_train) in enumerate(path):
-                    next_station = to_station if i == len(path) - 1 else path[i + 1][0]
-                    if i < len(path) - 1:
-                        next_train = path[i + 1][1]
-                        key = (
-                            (path_train.line.name, path_train.direction) if isinstance(path_train, Train) else None,
-                            (next_train.line.name, next_train.direction) if isinstance(next_train, Train) else None
-                        )
-                        assert key[0] is not None or key[1] is not None, (path_train, path_station, next_train)
-                        if next_station not in transfer_stats:
-                            transfer_stats[next_station] = (0, {})
-                        transfer_stats[next_station] = (
-                            transfer_stats[next_station][0] + load, transfer_stats[next_station][1]
-                        )
-                        if key not in transfer_stats[next_station][1]:
-                            transfer_stats[next_station][1][key] = 0
-                        transfer_stats[next_station][1][key] += load
-                    if not isinstance(path_train, Train):
-                        virtual_key = (path_station, next_station)
-                        if virtual_key not in virtual_stats:
-                            virtual_stats[virtual_key] = (0, {})
-                        virtual_stats[virtual_key] = (
-                            virtual_stats[virtual_key][0] + load, virtual_stats[virtual_key][1]
-                        )
-                        if path_train[2] not in virtual_stats[virtual_key][1]:
-                            virtual_stats[virtual_key][1][path_train[2]] = 0
-                        virtual_stats[virtual_key][1][path_train[2]] += load
-                        continue
-                    prev_virtual = (i == 0 or not isinstance(path[i - 1][1], Train))
-                    next_virtual = (i == len(path) - 1 or not isinstance(path[i + 1][1], Train))
-                    delta = (load, int(prev_virtual) * load, int(next_virtual) * load,
-                             int(not prev_virtual and not next_virtual) * load)
-                    line_stats[path_train.line.name] = add_tuple(line_stats[path_train.line.name], delta)
-                    all_stats = add_tuple(all_stats, delta)
-                    train_set.add(path_train)
-                    
-                expanded = expand_path(path, to_station, expand_all=True)
-                for i, (path_station, path_train) in enumerate(expanded):
-                    next_station = to_station if i == len(expanded) - 1 else expanded[i + 1][0]
-                    if have_direction:
-                        load_key = (
-                            path_station, next_station, path_train.line.name if isinstance(path_train, Train) else None
-                        )
-                    else:
-                        load_key = (path_station, next_station, None)
-                        rev_load_key = (next_station, path_station, None)
-                        if rev_load_key in load_dict:
-                            load_key = rev_load_key
-                    if load_key not in load_dict:
-                        load_dict[load_key] = (0, set(), set())
-                    load_dict[load_key] = (load_dict[load_key][0] + load, load_dict[load_key][1], load_dict[load_key][2])
-                    if isinstance(path_train, Train):
-                        if path_station in path_train.skip_stations:
-                            continue
-                        if path_station not in path_train.arrival_time:
-                            assert path_train.loop_next is not None and\
-                                   path_station in path_train.loop_next.arrival_time, (expanded, path_station, path_train)
-                            path_train = path_train.loop_next
-                        load_dict[load_key][1].add(path_train.arrival_time[path_station])
-                    elif i == 0:
-                        load_dict[load_key][1].add((start_time, start_day))
-                    else:
-                        index = i - 1
-                        prev_train = expanded[index][1]
-                        while index >= 0 and isinstance(
-                            prev_train, Train
-                        ) and expanded[index][0] in prev_train.skip_stations:
-                            index -= 1
-                            prev_train = expanded[index][1]
-                        assert index >= 0 and isinstance(prev_train, Train), (expanded, index, i, prev_train)
-                        load_dict[load_key][1].add(prev_train.arrival_time_virtual(expanded[index][0])[path_station])
-                    load_dict[load_key][2].add(path_train)
-    return line_stats, all_stats, load_dict, transfer_stats, virtual_stats, train_set
+    stats = CongestionAccumulator(lines, load_factor)
+    stats.add_paths(paths)
+    return stats.congestion_stats(have_direction=have_direction)
 
 
 def get_path_count(paths: dict[str, dict[str, dict[int, PathInfo]]]) -> int:
@@ -247,52 +142,27 @@ def get_station_passing_stats(
     load_factor: dict[tuple[str, str], float] | None = None
 ) -> StationPassingStats:
     """ Get total and per-line passenger counts for stations used by paths """
-    station_stats: dict[str, float] = {}
-    station_line_stats: dict[str, dict[tuple[str, str], float]] = {}
-    for from_station, to_dict in paths.items():
-        for to_station, time_dict in to_dict.items():
-            load = 1.0 if load_factor is None else load_factor.get((from_station, to_station), 1.0)
-            for _, path, _ in time_dict.values():
-                stations = {station for station, _ in expand_path(path, to_station, expand_all=True)}
-                stations.update((from_station, to_station))
-                for station in stations:
-                    station_stats[station] = station_stats.get(station, 0.0) + load
-                station_lines: set[tuple[str, tuple[str, str]]] = set()
-                transfer_stations = {path[i + 1][0] for i in range(len(path) - 1)}
-                for i, (station, train) in enumerate(path):
-                    if not isinstance(train, Train):
-                        continue
-                    next_station = to_station if i == len(path) - 1 else path[i + 1][0]
-                    for line_station in train.two_station_interval(station, next_station, expand_all=True):
-                        if line_station not in transfer_stations:
-                            station_lines.add((line_station, (train.line.name, train.direction)))
-                    if next_station not in transfer_stations:
-                        station_lines.add((next_station, (train.line.name, train.direction)))
-                for station, line_direction in station_lines:
-                    if station not in station_line_stats:
-                        station_line_stats[station] = {}
-                    station_line_stats[station][line_direction] = \
-                        station_line_stats[station].get(line_direction, 0.0) + load
-    return station_stats, station_line_stats
+    stats = CongestionAccumulator({}, load_factor, passing=True)
+    stats.add_paths(paths)
+    return stats.passing_stats()
 
 
 def print_congestion(
-    paths: dict[str, dict[str, dict[int, PathInfo]]], lines: dict[str, Line],
-    load_factor: dict[tuple[str, str], float] | None = None,
+    stats: CongestionAccumulator,
     *, limit_num: int = 5, have_direction: bool = True,
     line_metric: LineMetric = "total_passenger", load_metric: LoadMetric = "passenger",
-    transfer_source: TransferSource = "transfer", use_percentage: bool = False,
-    passing_stats: StationPassingStats | None = None
+    transfer_source: TransferSource = "transfer", use_percentage: bool = False
 ) -> None:
     """ Print congestion stats """
-    line_stats, all_stats, load_dict, transfer_stats, virtual_stats, train_set = get_congestion_stats(
-        paths, lines, load_factor, have_direction=have_direction
+    lines = stats.lines
+    line_stats, all_stats, load_dict, transfer_stats, virtual_stats, train_set = stats.congestion_stats(
+        have_direction=have_direction
     )
-    if load_factor is None:
+    if stats.load_factor is None:
         format_func = lambda x: str(int(x))
     else:
         format_func = lambda x: f"{x:.1f}"
-    path_count = get_path_count(paths)
+    path_count = stats.path_count
 
     def people_label(target: float, divisor: float) -> str:
         """ Format a passenger count, optionally including its percentage """
@@ -359,8 +229,7 @@ def print_congestion(
     print("\n=====> " + ("Station" if transfer_source == "passing" else "Transfer") + " Stats <=====")
     transfer_data: list[tuple[float, str]] = []
     if transfer_source in ["passing", "transfer"]:
-        if transfer_source == "passing" and passing_stats is None:
-            passing_stats = get_station_passing_stats(paths, load_factor)
+        passing_stats = stats.passing_stats() if transfer_source == "passing" else None
         all_station_stats = {} if passing_stats is None else passing_stats[0]
         station_line_stats = {} if passing_stats is None else passing_stats[1]
         station_names = all_station_stats.keys() if transfer_source == "passing" else transfer_stats.keys()
@@ -466,7 +335,7 @@ def draw_congestion(
     load_dict: dict[tuple[str, str, str | None], tuple[float, set[TimeSpec], set[Train | VTSpec]]],
     city: City, cmap: Colormap,
     *, output: str, dpi: int = 100, baseline: str | None = None, baseline_threshold: float = 0.01,
-    use_percentage: bool = False, path_count: int = 0,
+    use_percentage: bool = False, path_count: float = 0,
     fill_station: bool = False, station_stats: dict[str, float] | None = None
 ) -> None:
     """ Draw congestion on a given map """
@@ -575,6 +444,21 @@ def save_congestion_data(
             writer.writerow([from_station, to_station, people])
 
 
+def save_bucket_data(stats: CongestionAccumulator, bucket_output: str) -> None:
+    """ Export the congestion data of each time bucket to a given file """
+    assert stats.bucket_size is not None, stats
+    print(f"Writing congestion data by time to {bucket_output}...")
+    keys, _, loads = stats.segment_array(have_direction=False)
+    with open(bucket_output, "w") as fp:
+        writer = csv.writer(fp)
+        for bucket, segment_id in zip(*loads.nonzero()):
+            from_station, to_station, _ = keys[segment_id]
+            writer.writerow([
+                from_station, to_station, get_time_repr(*from_minutes(int(bucket) * stats.bucket_size)),
+                float(loads[bucket, segment_id])
+            ])
+
+
 def main() -> None:
     """ Main function """
     def append_arg(parser: argparse.ArgumentParser) -> None:
@@ -594,6 +478,14 @@ def main() -> None:
         parser.add_argument("--transfer-source", choices=["passing", "transfer", "line", "station_line"],
                             default="transfer", help="Specify station or transfer stats source")
         parser.add_argument("--data-output", help="Data output path")
+        parser.add_argument("--bucket-output", help="Data output path of the loads in each time bucket")
+        parser.add_argument("--bucket-size", type=int, default=60, help="Minutes in each time bucket")
+        parser.add_argument("--capacity-iterations", type=int, default=0,
+                            help="Re-route passengers away from overloaded trains for at most this many iterations")
+        parser.add_argument("--alternatives", type=int, default=3,
+                            help="Number of alternative paths for passengers on overloaded trains")
+        parser.add_argument("--crowding-penalty", type=float, default=1.0,
+                            help="Extra minutes per minute on a train loaded at full capacity")
         parser.add_argument("--baseline", help="Comparison baseline")
         parser.add_argument("--baseline-threshold", help="Baseline threshold", type=float, default=0.01)
         parser.add_argument("--use-percentage", action="store_true",
@@ -602,6 +494,9 @@ def main() -> None:
                             help="Fill stations with passing counts in passing mode, otherwise transfer counts")
 
     args = map_args(append_arg, contour_args=False, multi_source=False, include_limits=False, have_single=True)
+    if args.capacity_iterations > 0 and args.data_source != "time":
+        print("Error: only -d time is supported with --capacity-iterations!")
+        return
     city = ask_for_city()
     load_factor = parse_load_factor(set(city.station_lines.keys()), args.load_factor)
     start_date = ask_for_date()
@@ -616,37 +511,52 @@ def main() -> None:
     )
     _, through_dict = parse_through_train(train_dict, city.through_specs)
     stations = set(graph.keys())
-    paths = all_station_bfs(
-        city, stations, train_dict, through_dict, city.transfers,
-        {} if args.exclude_virtual else city.virtual_transfers, start_date, time_set,
-        data_source=args.data_source, exclude_edge=args.exclude_edge, include_express=args.include_express, graph=graph
+    virtual_dict = {} if args.exclude_virtual else city.virtual_transfers
+
+    # Paths are consumed as they are computed, so they are never kept all at once (unless re-routed later)
+    stats = CongestionAccumulator(
+        city.lines, load_factor, passing=(args.transfer_source == "passing"),
+        bucket_size=(None if args.bucket_output is None else args.bucket_size)
     )
-    passing_stats = None
-    if args.transfer_source == "passing":
-        passing_stats = get_station_passing_stats(paths, load_factor)
-    print_congestion(paths, city.lines, load_factor,
+    assignment = CapacityAssignment(
+        city.lines, train_dict, through_dict, city.transfers, virtual_dict, start_date, load_factor,
+        alternatives=args.alternatives, penalty=args.crowding_penalty,
+        exclude_edge=args.exclude_edge, include_express=args.include_express
+    ) if args.capacity_iterations > 0 else None
+    for from_station, to_station, start_minute, path_info in station_paths(
+        city, stations, train_dict, through_dict, city.transfers, virtual_dict, start_date, time_set,
+        data_source=args.data_source, exclude_edge=args.exclude_edge, include_express=args.include_express, graph=graph
+    ):
+        if assignment is None:
+            stats.add_path(from_station, to_station, start_minute, path_info[1])
+        else:
+            assignment.add_pair(from_station, to_station, start_minute, path_info)
+    if assignment is not None:
+        print(f"Maximum load before re-routing: {percentage_str(assignment.max_ratio())}")
+        assignment.assign(args.capacity_iterations)
+        print(f"Maximum load after re-routing: {percentage_str(assignment.max_ratio())}")
+        assignment.accumulate(stats)
+    print_congestion(stats,
                      limit_num=args.limit_num, have_direction=args.all_direction,
                      line_metric=args.line_metric, load_metric=args.load_metric,
-                     transfer_source=args.transfer_source, use_percentage=args.use_percentage,
-                     passing_stats=passing_stats)
+                     transfer_source=args.transfer_source, use_percentage=args.use_percentage)
     print()
     cmap = get_colormap(args.color_map)
 
-    _, _, load_dict, transfer_stats, _, _ = get_congestion_stats(
-        paths, city.lines, load_factor, have_direction=False
-    )
+    load_dict = stats.load_dict(have_direction=False)
     station_stats = None
     if args.fill_station and args.transfer_source == "passing":
-        assert passing_stats is not None
-        station_stats = passing_stats[0]
+        station_stats = stats.passing_stats()[0]
     elif args.fill_station:
-        station_stats = {station: stats[0] for station, stats in transfer_stats.items()}
+        station_stats = {station: data[0] for station, data in stats.transfer_stats().items()}
     draw_congestion(load_dict, city, cmap, output=args.output, dpi=args.dpi,
                     baseline=args.baseline, baseline_threshold=args.baseline_threshold,
-                    use_percentage=args.use_percentage, path_count=get_path_count(paths),
+                    use_percentage=args.use_percentage, path_count=stats.path_count,
                     fill_station=args.fill_station, station_stats=station_stats)
     if args.data_output is not None:
         save_congestion_data(load_dict, args.data_output)
+    if args.bucket_output is not None:
+        save_bucket_data(stats, args.bucket_output)
 
 
 # Call main
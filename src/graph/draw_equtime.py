@@ -19,7 +19,7 @@ Image.MAX_IMAGE_PIXELS = 500000000
 
 def main() -> None:
     """ Main function """
-    args = map_args()
+    args = map_args(have_engine=True)
     if args.color_map is None:
         cmap: Colormap = LinearSegmentedColormap("RB", {
             'red': ((0.0, 1.0, 1.0),
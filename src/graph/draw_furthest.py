@@ -11,7 +11,7 @@ from scipy.interpolate import griddata  # type: ignore
 
 from src.city.ask_for_city import ask_for_city, ask_for_map
 from src.dist_graph.adaptor import get_dist_graph
-from src.dist_graph.shortest_path import all_shortest
+from src.dist_graph.compiled_graph import all_shortest_dists
 from src.graph.draw_map import draw_all_station, map_args, draw_contour_wrap, get_levels_from_source, get_colormap
 
 # reset max pixel
@@ -34,9 +34,9 @@ def main() -> None:
         city, include_lines=args.include_lines, exclude_lines=args.exclude_lines,
         include_virtual=(not args.exclude_virtual), include_circle=(not args.exclude_single)
     )
-    path_dict = all_shortest(city, graph, data_source=args.data_source)
+    path_dict = all_shortest_dists(graph, data_source=args.data_source)
     result_dict = {
-        station: sum(x[0] for x in v.values()) / len(list(path_dict.keys())) for station, v in path_dict.items()
+        station: sum(v.values()) / len(list(path_dict.keys())) for station, v in path_dict.items()
     }
     if args.data_source == "distance":
         for station, dist in result_dict.items():
@@ -12,15 +12,15 @@ from typing import cast, Any
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-import numpy as np
 from PIL import Image, ImageDraw
 from matplotlib.colors import LinearSegmentedColormap, Colormap, LogNorm, SymLogNorm
-from scipy.interpolate import griddata  # type: ignore
+from matplotlib.figure import Figure
 
-from src.bfs.avg_shortest_time import shortest_in_city, shortest_path_args, data_criteria
+from src.bfs.avg_shortest_time import CityTrains, shortest_in_city, shortest_path_args, data_criteria
 from src.city.ask_for_city import ask_for_map
 from src.city.city import City
 from src.common.common import parse_comma
+from src.graph.interpolation import DEFAULT_RESOLUTION, get_interpolator
 from src.graph.map import Map
 
 # reset max pixel
@@ -30,7 +30,8 @@ Color = tuple[float, float, float] | tuple[float, float, float, float]
 
 def map_args(
     more_args: Callable[[argparse.ArgumentParser], Any] | None = None,
-    *, contour_args: bool = True, multi_source: bool = True, include_limits: bool = True, **kwargs: Any
+    *, contour_args: bool = True, multi_source: bool = True, include_limits: bool = True, have_output: bool = True,
+    **kwargs: Any
 ) -> argparse.Namespace:
     """ Parse arguments """
     parser = argparse.ArgumentParser()
@@ -38,7 +39,8 @@ def map_args(
         parser.add_argument("-s", "--limit-start", help="Limit start time of the search")
         parser.add_argument("-e", "--limit-end", help="Limit end time of the search")
     parser.add_argument("-c", "--color-map", help="Override default colormap")
-    parser.add_argument("-o", "--output", help="Output path", default="../processed.png")
+    if have_output:
+        parser.add_argument("-o", "--output", help="Output path", default="../processed.png")
     if multi_source:
         parser.add_argument("-d", "--data-source", choices=data_criteria,
                             default="time", help="Graph data source")
@@ -53,6 +55,8 @@ def map_args(
             "-n", "--label-num", type=int, help="Override # of label for each contour", default=1)
         parser.add_argument(
             "-w", "--line-width", type=int, help="Override contour line width", default=5)
+        parser.add_argument("--grid-resolution", type=int, default=DEFAULT_RESOLUTION,
+                            help="Number of interpolation points along each side of the map")
     shortest_path_args(parser, **kwargs)
     if more_args is not None:
         more_args(parser)
@@ -149,12 +153,11 @@ def draw_contours(
     *, levels: int | list[int] | None = None,
     label_num: int = 1, focus_contour: int | set[int] | None = None,
     contour_styles: dict[int, str] | None = None,
-    line_width: list[int] | None = None
+    line_width: list[int] | None = None, resolution: int = DEFAULT_RESOLUTION
 ) -> None:
     """ Draw contours on the whole map """
-    # Construct x, y, z
-    x: list[float] = []
-    y: list[float] = []
+    # Construct points, z
+    points: dict[str, tuple[float, float]] = {}
     z: list[float] = []
     for station, shortest in avg_shortest.items():
         if station not in map_obj.coordinates:
@@ -163,15 +166,13 @@ def draw_contours(
         station_shape = map_obj.coordinates[station]
         if station_shape is None:
             continue
-        center_x, center_y = station_shape.center_point()
-        x.append(center_x)
-        y.append(center_y)
+        points[station] = station_shape.center_point()
         z.append(shortest)
 
     # interpolate the data to a regular field
-    X = np.linspace(0, img_size[0], 1000)
-    Y = np.linspace(0, img_size[1], 1000)
-    Z = griddata((x, y), z, (X[None, :], Y[:, None]))
+    interpolator = get_interpolator(map_obj, points, img_size, resolution)
+    X, Y = interpolator.X, interpolator.Y
+    Z = interpolator(z)
 
     regularize_focus: set[int] = set()
     if focus_contour is not None:
@@ -268,13 +269,12 @@ def parse_contour_spec(spec: list[list] | None = None) -> dict[int, str]:
 def draw_contour_wrap(
     img: Image.Image, cmd_args: argparse.Namespace, *args: Any,
     default_contours: set[int] | None = None,
-    levels: int | list[int] | None = None
-) -> None:
-    """ Draw contour in the current figure """
+    levels: int | list[int] | None = None, save: bool = True
+) -> Figure:
+    """ Draw contour in a new figure, and save it unless asked not to """
     dpi = cmd_args.dpi
-    output = cmd_args.output
     fig = plt.figure(
-        figsize=(img.size[0] / dpi, img.size[1] / dpi), frameon=False)
+        figsize=(img.size[0] / dpi, img.size[1] / dpi), dpi=dpi, frameon=False)
     ax = plt.Axes(fig, (0., 0., 1., 1.))
     ax.set_axis_off()
     fig.add_axes(ax)
@@ -282,12 +282,15 @@ def draw_contour_wrap(
     draw_contours(
         ax, img.size, *args,
         label_num=cmd_args.label_num, line_width=cmd_args.line_width, levels=levels,
+        resolution=cmd_args.grid_resolution,
         focus_contour=(
             {int(x) for x in parse_comma(cmd_args.focus)} if cmd_args.focus is not None else default_contours
         ), contour_styles=parse_contour_spec(cmd_args.style_spec)
     )
-    print(f"Drawing contours done! Saving to {output}...")
-    fig.savefig(output, dpi=dpi)
+    if save:
+        print(f"Drawing contours done! Saving to {cmd_args.output}...")
+        fig.savefig(cmd_args.output, dpi=dpi)
+    return fig
 
 
 def get_colormap(color_map: str | None = None) -> Colormap:
@@ -322,13 +325,15 @@ def get_levels_from_source(args: argparse.Namespace, have_minus: bool = False) -
 
 
 def get_map_data(
-    args: argparse.Namespace, city_station: tuple[City, str, date] | None = None
+    args: argparse.Namespace, city_station: tuple[City, str, date] | None = None, *,
+    trains: CityTrains | None = None
 ) -> tuple[City, str, dict]:
-    """ Get data necessary for drawing a map """
+    """ Get data necessary for drawing a map (trains can be parsed beforehand to be shared between calls) """
     city, start, _, result_dict_temp = shortest_in_city(
         args.limit_start, args.limit_end, city_station,
         include_lines=args.include_lines, exclude_lines=args.exclude_lines,
-        exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express
+        exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express,
+        engine=args.engine, trains=trains
     )
     data_index = data_criteria.index(args.data_source)
     if any(x[data_index] is None for x in result_dict_temp.values()):
@@ -342,7 +347,7 @@ def get_map_data(
 
 def main() -> None:
     """ Main function """
-    args = map_args()
+    args = map_args(have_engine=True)
     cmap = get_colormap(args.color_map)
     levels = get_levels_from_source(args)
     city, start, result_dict = get_map_data(args)
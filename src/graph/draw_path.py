@@ -70,7 +70,8 @@ def fetch_avg_path_result(args: argparse.Namespace) -> tuple[City, DrawDict]:
     _, _, through_dict, result_dict = shortest_in_city(
         args.limit_start, args.limit_end, (city, start[0], start_date),
         include_lines=args.include_lines, exclude_lines=args.exclude_lines,
-        exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express
+        exclude_virtual=args.exclude_virtual, exclude_edge=args.exclude_edge, include_express=args.include_express,
+        engine=args.engine
     )
 
     data = result_dict[end[0]]
@@ -228,7 +229,7 @@ def main() -> None:
         parser.add_argument("--exclude-next-day", action="store_true",
                             help="Exclude path that spans into next day")
 
-    args = map_args(append_arg, contour_args=False, multi_source=False, have_single=True)
+    args = map_args(append_arg, contour_args=False, multi_source=False, have_single=True, have_engine=True)
     cmap = get_path_colormap(args.color_map)
     if args.strategy == "kth":
         if args.limit_start is not None or args.limit_end is not None:
@@ -27,7 +27,7 @@ def main() -> None:
         avg_shortest_args(parser)
         parser.add_argument("--only-best-path", action="store_true", help="Only consider best path")
 
-    args = map_args(append_arg, contour_args=False, multi_source=False, include_limits=False)
+    args = map_args(append_arg, contour_args=False, multi_source=False, include_limits=False, have_engine=True)
     args.show_path = True
     raw_cmap = get_path_colormap(args.color_map)
     cmap = raw_cmap[0] if isinstance(raw_cmap, list) else raw_cmap
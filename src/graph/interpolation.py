@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Linear interpolation of station values onto the map grid, triangulated only once per map """
+
+# Libraries
+import numpy as np
+from scipy.sparse import csr_matrix  # type: ignore
+from scipy.spatial import Delaunay  # type: ignore
+
+from src.graph.map import Map
+
+DEFAULT_RESOLUTION = 1000
+
+# (id of map, stations, image size, resolution) -> (map, interpolator)
+_interpolator_cache: dict[tuple[int, tuple[str, ...], tuple[int, int], int], tuple[Map, "GridInterpolator"]] = {}
+_INTERPOLATOR_CACHE_SIZE = 16
+
+
+class GridInterpolator:
+    """ Barycentric weights of every grid point in the Delaunay triangulation of the stations """
+
+    def __init__(
+        self, points: list[tuple[float, float]], img_size: tuple[int, int], resolution: int = DEFAULT_RESOLUTION
+    ) -> None:
+        """ Constructor """
+        self.X = np.linspace(0, img_size[0], resolution)
+        self.Y = np.linspace(0, img_size[1], resolution)
+        self.point_count = len(points)
+
+        # Same triangulation and weights as griddata(method="linear"), but kept for later values
+        triangulation = Delaunay(np.array(points, dtype=np.float64))
+        grid_x, grid_y = np.meshgrid(self.X, self.Y)
+        grid = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        simplices = triangulation.find_simplex(grid)
+        self.inside = simplices >= 0
+        transform = triangulation.transform[simplices[self.inside]]
+        barycentric = np.einsum("ijk,ik->ij", transform[:, :2], grid[self.inside] - transform[:, 2])
+        weights = np.column_stack((barycentric, 1 - barycentric.sum(axis=1)))
+        rows = np.repeat(np.flatnonzero(self.inside), 3)
+        self.matrix = csr_matrix(
+            (weights.ravel(), (rows, triangulation.simplices[simplices[self.inside]].ravel())),
+            shape=(len(grid), len(points))
+        )
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<GridInterpolator: {self.point_count} points onto {len(self.Y)}x{len(self.X)} grid>"
+
+    def __call__(self, values: np.ndarray | list[float]) -> np.ndarray:
+        """ Interpolate values (one per point, or a batch of shape (points, k)) onto the grid, NaN outside """
+        values = np.asarray(values, dtype=np.float64)
+        assert values.shape[0] == self.point_count, (values.shape, self.point_count)
+        result = self.matrix @ values
+        result[~self.inside] = np.nan
+        return result.reshape((len(self.Y), len(self.X)) + values.shape[1:])
+
+
+def get_interpolator(
+    map_obj: Map, points: dict[str, tuple[float, float]], img_size: tuple[int, int],
+    resolution: int = DEFAULT_RESOLUTION
+) -> GridInterpolator:
+    """ Get the interpolator of a map for these stations, built only once """
+    key = (id(map_obj), tuple(points.keys()), img_size, resolution)
+    if key in _interpolator_cache and _interpolator_cache[key][0] is map_obj:
+        return _interpolator_cache[key][1]
+    if len(_interpolator_cache) >= _INTERPOLATOR_CACHE_SIZE:
+        del _interpolator_cache[next(iter(_interpolator_cache))]
+    interpolator = GridInterpolator(list(points.values()), img_size, resolution)
+    _interpolator_cache[key] = (map_obj, interpolator)
+    return interpolator
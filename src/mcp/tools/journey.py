@@ -10,6 +10,7 @@ from datetime import datetime, time
 from typing import Any, Literal
 
 from src.bfs.k_shortest_path import k_shortest_path
+from src.bfs.pareto import pareto_journeys
 from src.dist_graph.adaptor import get_dist_graph, to_trains
 from src.dist_graph.shortest_path import shortest_path
 from src.mcp.context import get_city, get_train_dict, get_through_dict
@@ -94,8 +95,9 @@ def get_transfer_metrics(
 def plan_journey(
     start_station: str, end_station: str, date: str,
     departure_time: str | None = None,
-    strategy: Literal["min_time", "min_transfer"] = "min_time",
-    num_paths: int = 5
+    strategy: Literal["min_time", "min_transfer", "pareto"] = "min_time",
+    num_paths: int = 5,
+    engine: Literal["bfs", "raptor"] = "bfs"
 ) -> str:
     """
     Calculate the best route between two stations. Returns text-based description of routing.
@@ -104,14 +106,18 @@ def plan_journey(
     :param end_station: Ending station
     :param date: Departure date. Format: "YYYY-MM-DD"
     :param departure_time: Departure time. Format: "HH:MM"
-    :param strategy: Routing strategy. Supports only "min_time" / "min_transfer"
+    :param strategy: Routing strategy. Supports "min_time" / "min_transfer" / "pareto" (all journeys not beaten
+                     by another one in time, transfers and walking at once, then filtered by fare)
     :param num_paths: Number of shortest path to return. Only applicable if strategy is "min_time"
+    :param engine: Search engine to use. Supports "bfs" / "raptor". Only applicable if strategy is "min_time"
     """
     # Validate strategy early to avoid falling through silently
-    if strategy not in {"min_time", "min_transfer"}:
-        return "Error: Unsupported strategy. Use min_time or min_transfer."
+    if strategy not in {"min_time", "min_transfer", "pareto"}:
+        return "Error: Unsupported strategy. Use min_time, min_transfer or pareto."
     if num_paths < 1:
         return "Error: num_paths must be >= 1."
+    if engine not in {"bfs", "raptor"}:
+        return "Error: Unsupported engine. Use bfs or raptor."
 
     city = get_city()
     train_dict = get_train_dict()
@@ -162,19 +168,25 @@ def plan_journey(
             )
             results = [(bfs_result, path)]
 
+        elif strategy == 'pareto':
+            results = [(bfs_result, path) for bfs_result, path, _ in pareto_journeys(
+                city.lines, train_dict, through_dict, city.transfers, city.virtual_transfers,
+                start_station, end_station, query_date, (query_time, False), fare_rules=city.fare_rules
+            )]
+
         else:  # min_time
             results = k_shortest_path(
                 city.lines, train_dict, through_dict, city.transfers, city.virtual_transfers,
                 start_station, end_station,
                 query_date, (query_time, False),
-                k=num_paths
+                k=num_paths, engine=engine
             )
 
         if not results:
             return "Unreachable"
 
         for i, (bfs_result, path) in enumerate(results):
-            print(f"Shortest Path #{i + 1}:")
+            print(("Non-dominated" if strategy == 'pareto' else "Shortest") + f" Path #{i + 1}:")
             bfs_result.pretty_print_path(
                 path, city.lines, city.transfers,
                 through_dict=through_dict,
@@ -5,12 +5,13 @@
 
 # Libraries
 import io
+from bisect import bisect_left
 from contextlib import redirect_stdout
 from datetime import datetime
 from typing import Any
 
 from src.city.city import City
-from src.common.common import get_time_str
+from src.common.common import get_time_str, parse_time, to_minutes
 from src.mcp.context import get_city, get_train_dict
 from src.mcp.utils import fuzzy_match
 from src.timetable.print_timetable import in_route
@@ -56,6 +57,10 @@ def get_station_timetable(
         query_date = datetime.strptime(date, "%Y-%m-%d").date()
     except ValueError:
         return {"error": "Invalid date format. Use YYYY-MM-DD."}
+    try:
+        query_minute = None if not query_time else to_minutes(*parse_time(query_time))
+    except ValueError:
+        return {"error": "Invalid time format. Use HH:MM."}
 
     station_key = _resolve_station(city, station_name)
     if not station_key:
@@ -119,35 +124,28 @@ def get_station_timetable(
             if target_date_group not in train_dict[l_name][d]:
                 continue
 
-            trains = train_dict[l_name][d][target_date_group]
-
-            trains_at_station = [t for t in trains if station_key in t.arrival_time]
-            trains_at_station.sort(key=lambda t: get_time_str(*t.arrival_time[station_key]))
+            # Trains of the date group at this station (including those passing without stopping), sorted by time
+            trains_at_station = sorted(
+                (train for train in train_dict[l_name][d][target_date_group] if station_key in train.arrival_time),
+                key=lambda train: to_minutes(*train.arrival_time[station_key])
+            )
+            minutes = [to_minutes(*train.arrival_time[station_key]) for train in trains_at_station]
             last_train_obj = trains_at_station[-1] if trains_at_station else None
+            first_index = 0 if query_minute is None else bisect_left(minutes, query_minute)
 
             valid_trains: list[dict[str, Any]] = []
-            for train in trains:
-                if station_key not in train.arrival_time:
-                    continue
-
+            for train in trains_at_station[first_index:]:
                 if not in_route(train.routes, include_routes=set(include_routes) if include_routes else None, exclude_routes=set(exclude_routes) if exclude_routes else None):
                     continue
 
                 arr_time, arr_day = train.arrival_time[station_key]
-                time_str = get_time_str(arr_time, arr_day)
-
-                if query_time and time_str < query_time:
-                    continue
-
                 valid_trains.append({
                     "train_code": train.train_code(),
-                    "departure_time": time_str,
+                    "departure_time": get_time_str(arr_time, arr_day),
                     "is_last_train": (train == last_train_obj),
                     "routes": [r.name for r in train.routes],
                 })
 
-            valid_trains.sort(key=lambda x: x["departure_time"])
-
             if query_time:
                 valid_trains = valid_trains[:count]
 
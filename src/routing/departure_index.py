@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Index of the trains passing through each station, sorted by time """
+
+# Libraries
+from bisect import bisect_left
+from collections.abc import Iterable
+from datetime import date
+
+from src.city.service_pattern import LinePattern, train_pattern
+from src.city.train_route import TrainRoute
+from src.common.common import to_minutes
+from src.routing.train import Train
+
+# Sorted arrival minutes and the trains in the same order
+SortedTrains = tuple[list[int], list[Train]]
+_index_cache: dict[tuple[int, LinePattern], tuple[dict[str, dict[str, dict[str, list[Train]]]], "DepartureIndex"]] = {}
+_INDEX_CACHE_SIZE = 8
+
+
+def index_trains(trains: Iterable[Train]) -> dict[str, SortedTrains]:
+    """ Sort the trains stopping at each station by arrival time (ties are kept in the original order) """
+    passing: dict[str, list[tuple[int, Train]]] = {}
+    for train in trains:
+        for station, (arr_time, arr_day) in train.arrival_time.items():
+            if station in train.skip_stations:
+                continue
+            if station not in passing:
+                passing[station] = []
+            passing[station].append((to_minutes(arr_time, arr_day), train))
+    result: dict[str, SortedTrains] = {}
+    for station, train_list in passing.items():
+        train_list.sort(key=lambda x: x[0])
+        result[station] = ([x[0] for x in train_list], [x[1] for x in train_list])
+    return result
+
+
+class DepartureIndex:
+    """ Trains running on a date, indexed by (station, line, direction) """
+
+    def __init__(self, train_dict: dict[str, dict[str, dict[str, list[Train]]]], cur_date: date) -> None:
+        """ Constructor """
+        self.cur_date = cur_date
+        self.index: dict[tuple[str, str, str], SortedTrains] = {}
+
+        # For each (station, line, direction): one (minutes, positions in self.index) pair per set of routes
+        self.route_index: dict[tuple[str, str, str], list[tuple[list[int], list[int]]]] = {}
+        self.station_index: dict[str, SortedTrains] = {}
+        for line_name, line_dict in train_dict.items():
+            for direction, direction_dict in line_dict.items():
+                trains = [
+                    train for date_group, date_dict in direction_dict.items() for train in date_dict
+                    if train.line.date_groups[date_group].covers(cur_date)
+                ]
+                for station, (minutes, train_list) in index_trains(trains).items():
+                    self.index[(station, line_name, direction)] = (minutes, train_list)
+                    route_dict: dict[frozenset[TrainRoute], tuple[list[int], list[int]]] = {}
+                    for i, (minute, train) in enumerate(zip(minutes, train_list)):
+                        routes = frozenset(train.routes)
+                        if routes not in route_dict:
+                            route_dict[routes] = ([], [])
+                        route_dict[routes][0].append(minute)
+                        route_dict[routes][1].append(i)
+                    self.route_index[(station, line_name, direction)] = list(route_dict.values())
+
+    def passing(self, station: str, line_name: str, direction: str) -> SortedTrains:
+        """ Get all trains of a line/direction stopping at station """
+        return self.index.get((station, line_name, direction), ([], []))
+
+    def passing_all(self, station: str) -> SortedTrains:
+        """ Get all trains stopping at station """
+        if station not in self.station_index:
+            merged = sorted((
+                (minute, train) for (index_station, _, _), (minutes, train_list) in self.index.items()
+                if index_station == station for minute, train in zip(minutes, train_list)
+            ), key=lambda x: x[0])
+            self.station_index[station] = ([x[0] for x in merged], [x[1] for x in merged])
+        return self.station_index[station]
+
+    def next_trains(self, station: str, line_name: str, direction: str, minute: int) -> list[Train]:
+        """ Get the first train of each set of routes arriving at station no earlier than minute """
+        key = (station, line_name, direction)
+        if key not in self.route_index:
+            return []
+        positions: list[int] = []
+        for minutes, indices in self.route_index[key]:
+            position = bisect_left(minutes, minute)
+            if position < len(minutes):
+                positions.append(indices[position])
+        train_list = self.index[key][1]
+        return [train_list[i] for i in sorted(positions)]
+
+
+def get_departure_index(train_dict: dict[str, dict[str, dict[str, list[Train]]]], cur_date: date) -> DepartureIndex:
+    """ Get the departure index of a train dict on a date, building it only once for all the dates running the same """
+    key = (id(train_dict), train_pattern(train_dict, cur_date))
+    if key in _index_cache and _index_cache[key][0] is train_dict:
+        return _index_cache[key][1]
+    if len(_index_cache) >= _INDEX_CACHE_SIZE:
+        del _index_cache[next(iter(_index_cache))]
+    index = DepartureIndex(train_dict, cur_date)
+    _index_cache[key] = (train_dict, index)
+    return index
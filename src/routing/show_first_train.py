@@ -10,20 +10,21 @@ from typing import Literal
 from src.city.ask_for_city import ask_for_city, ask_for_station, ask_for_line, ask_for_direction, ask_for_date_group
 from src.city.date_group import DateGroup
 from src.city.line import Line
-from src.common.common import get_time_str, chin_len, pad_to
+from src.common.common import chin_len, pad_to
+from src.routing.departure_index import SortedTrains, index_trains
 from src.routing.train import parse_trains, Train
 
 FullMode = Literal["direction", "true_full"]
 
 
 def get_first_last(
-    station: str, train_list: list[Train], *, full_mode: FullMode = "direction"
+    station: str, train_list: list[Train], *, full_mode: FullMode = "direction",
+    indexed: dict[str, SortedTrains] | None = None
 ) -> tuple[Train, Train, Train, Train]:
     """ Get the first/last train for each station in the line """
-    filtered_list = [train for train in train_list if station in train.arrival_time
-                     and station not in train.skip_stations]
-    filtered_list = sorted(
-        filtered_list, key=lambda train: get_time_str(*train.arrival_time[station]))
+    if indexed is None:
+        indexed = index_trains(train_list)
+    filtered_list = indexed[station][1]
     if full_mode == "direction":
         filtered_full = [
             train for train in filtered_list if train.line.direction_stations(train.direction)[-1] in train.arrival_time
@@ -70,9 +71,12 @@ def output_line(line: Line, direction: str, date_group: DateGroup, full_mode: Fu
         print(max_station_len * " " + " Train  Full  Full Train")
 
     # Print for each station
+    indexed = index_trains(train_list)
     for station in line.direction_stations(direction):
         print(pad_to(line.station_full_name(station), max_station_len), end=" ")
-        first_train, first_full, last_full, last_train = get_first_last(station, train_list, full_mode=full_mode)
+        first_train, first_full, last_full, last_train = get_first_last(
+            station, train_list, full_mode=full_mode, indexed=indexed
+        )
         print(first_train.stop_time_str(station), end=" ")
         print(first_full.stop_time_str(station), end=" ")
         print(last_full.stop_time_str(station), end=" ")
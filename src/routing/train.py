@@ -7,14 +7,17 @@
 from __future__ import annotations
 
 import threading
+from array import array
 from collections.abc import Iterable
 from functools import lru_cache
+from typing import Any
 
 from src.city.line import Line
 from src.city.train_route import TrainRoute, stations_dist, route_dist
 from src.common.common import diff_time, get_time_repr, get_time_str, format_duration, \
     distance_str, chin_len, segment_speed, speed_str, add_min_tuple, suffix_s, TimeSpec, diff_time_tuple, pad_to, \
-    to_pinyin
+    to_pinyin, to_minutes, from_minutes
+from src.routing.train_store import TrainStore, write_train_store, open_train_store
 from src.timetable.timetable import Timetable, route_stations, route_skip_stations, route_without_timetable
 
 _PARSE_LOCK = threading.RLock()
@@ -39,6 +42,12 @@ class Train:
         self.loop_prev: Train | None = None
         self.loop_next: Train | None = None
 
+        # start_station -> arrival_time_virtual() in minutes, filled by minutes_virtual()
+        self.virtual_minutes: dict[str, list[tuple[str, int]]] = {}
+
+        # Index in line.train_store, if this train is stored there
+        self.store_index: int | None = None
+
     def last_station(self) -> str:
         """ Get last station in the timetable """
         if self.loop_next is not None:
@@ -92,6 +101,27 @@ class Train:
         """ Hash function """
         return self.equal_tuple().__hash__()
 
+    def __getattr__(self, name: str) -> Any:
+        """ Read the arrival times of a stored train from the mapped columns on first use """
+        if name != "arrival_time" or self.__dict__.get("store_index") is None:
+            raise AttributeError(name)
+        store = self.line.train_store
+        assert store is not None, self.line
+        stations: list[str] = store.header["stations"]
+        columns = store.columns
+        start, end = columns["offsets"][self.store_index], columns["offsets"][self.store_index + 1]
+        self.arrival_time = {
+            stations[station]: from_minutes(minute)
+            for station, minute in zip(columns["stations"][start:end], columns["minutes"][start:end])
+        }
+        return self.arrival_time
+
+    def __reduce_ex__(self, protocol: Any) -> str | tuple[Any, ...]:
+        """ Pickle a stored train as its index, so that other processes read it from the mapped file instead """
+        if self.store_index is None or self.line.train_store is None:
+            return super().__reduce_ex__(protocol)
+        return stored_train, (self.line, self.store_index)
+
     def train_capacity(self) -> int:
         """ Capacity for this line """
         return self.line.carriage_type.train_capacity(self.carriage_num)
@@ -217,6 +247,15 @@ class Train:
             cur_list += next_list
         return dict(cur_list)
 
+    def minutes_virtual(self, start_station: str) -> list[tuple[str, int]]:
+        """ Same as arrival_time_virtual(), but in minutes since the start of the service day (cached) """
+        if start_station not in self.virtual_minutes:
+            self.virtual_minutes[start_station] = [
+                (station, to_minutes(arr_time, arr_day))
+                for station, (arr_time, arr_day) in self.arrival_time_virtual(start_station).items()
+            ]
+        return self.virtual_minutes[start_station]
+
     def can_reach(self, start_station: str, end_station: str) -> bool:
         """ Determine whether this service stops at end_station after start_station """
         if start_station not in self.arrival_time or start_station in self.skip_stations:
@@ -516,7 +555,7 @@ def parse_trains_stations(
     for station in stations:
         assert station in processed_dict, (station, processed_dict)
         for route_id, timetable_trains_temp in processed_dict[station].items():
-            timetable_trains = sorted(timetable_trains_temp, key=lambda x: x.sort_key_str())
+            timetable_trains = sorted(timetable_trains_temp, key=lambda x: x.sort_minute())
             if route_id not in trains:
                 # Calculate initial trains
                 trains[route_id] = [Train(
@@ -540,12 +579,128 @@ def parse_trains_stations(
     return [train for train_list in trains.values() for train in train_list]
 
 
+# Integer columns of a train store, one entry per train unless noted
+TRAIN_COLUMNS = [
+    "offsets",  # one more entry than trains: start of each train in stations/minutes
+    "stations",  # station id of each stop
+    "minutes",  # arrival time of each stop, in minutes since the start of the service day
+    "patterns",  # route pattern id, i.e. the routes and everything computed from them
+    "date_groups",  # date group id
+    "loop_prev",  # index of loop_prev, or -1
+    "loop_next"  # index of loop_next, or -1
+]
+
+
+def save_compiled_trains(line: Line, train_dict: dict[str, dict[str, list[Train]]]) -> None:
+    """ Save the trains of a line (direction -> date_group -> trains) as a train store at line.trains_cache """
+    if line.trains_cache is None:
+        return
+    trains = [train for direction_dict in train_dict.values() for train_list in direction_dict.values()
+              for train in train_list]
+    positions = {id(train): i for i, train in enumerate(trains)}
+    station_ids: dict[str, int] = {}
+    date_group_ids: dict[str, int] = {}
+    pattern_ids: dict[tuple, int] = {}
+    columns = {name: array("i") for name in TRAIN_COLUMNS}
+    columns["offsets"].append(0)
+    for train in trains:
+        for station, (arr_time, arr_day) in train.arrival_time.items():
+            columns["stations"].append(station_ids.setdefault(station, len(station_ids)))
+            columns["minutes"].append(to_minutes(arr_time, arr_day))
+        columns["offsets"].append(len(columns["stations"]))
+
+        # Routes may be reassigned after construction (see assign_loop_next()), so keep the computed fields
+        pattern = (
+            tuple((route.direction, route.name) for route in train.routes), train.carriage_num, train.direction,
+            tuple(train.stations), train.real_end, frozenset(train.skip_stations), frozenset(train.without_timetable)
+        )
+        columns["patterns"].append(pattern_ids.setdefault(pattern, len(pattern_ids)))
+        columns["date_groups"].append(date_group_ids.setdefault(train.date_group, len(date_group_ids)))
+        for link, linked in [("loop_prev", train.loop_prev), ("loop_next", train.loop_next)]:
+            if linked is None:
+                columns[link].append(-1)
+            elif id(linked) in positions:
+                columns[link].append(positions[id(linked)])
+            else:
+                # Loops are only linked within a line (see assign_loop_next()), so train_dict is incomplete
+                print(f"Warning: not caching trains of {line.name}, {link} of {train!r} is not among them")
+                return
+    write_train_store(line.trains_cache, {
+        "stations": list(station_ids.keys()),
+        "date_groups": list(date_group_ids.keys()),
+        "patterns": list(pattern_ids.keys()),
+        "shape": [(direction, date_group, len(train_list))
+                  for direction, direction_dict in train_dict.items()
+                  for date_group, train_list in direction_dict.items()]
+    }, columns)
+
+
+def stored_trains(line: Line, store: TrainStore) -> list[Train]:
+    """ Construct all trains in a train store, leaving their arrival times in the store until used """
+    date_groups: list[str] = store.header["date_groups"]
+    patterns = [(
+        [line.train_routes[direction][name] for direction, name in route_keys], carriage_num, direction,
+        list(pattern_stations), real_end, set(skip_stations), set(without_timetable)
+    ) for route_keys, carriage_num, direction, pattern_stations, real_end, skip_stations, without_timetable
+        in store.header["patterns"]]
+    columns = store.columns
+    trains: list[Train] = []
+    for i, (pattern_id, date_group_id) in enumerate(zip(columns["patterns"], columns["date_groups"])):
+        # Trains of the same pattern share the (never modified) lists and sets
+        train = Train.__new__(Train)
+        (routes, train.carriage_num, train.direction, train.stations,
+         train.real_end, train.skip_stations, train.without_timetable) = patterns[pattern_id]
+        train.line = line
+        train.routes = list(routes)
+        train.date_group = date_groups[date_group_id]
+        train.loop_prev, train.loop_next = None, None
+        train.virtual_minutes = {}
+        train.store_index = i
+        trains.append(train)
+    for train, prev_index, next_index in zip(trains, columns["loop_prev"], columns["loop_next"]):
+        if prev_index >= 0:
+            train.loop_prev = trains[prev_index]
+        if next_index >= 0:
+            train.loop_next = trains[next_index]
+    return trains
+
+
+def stored_train(line: Line, index: int) -> Train:
+    """ Get a train of line.train_store, constructing them once for each line object """
+    if line.stored_trains is None:
+        assert line.train_store is not None, line
+        line.stored_trains = stored_trains(line, line.train_store)
+    return line.stored_trains[index]
+
+
+def load_compiled_trains(line: Line) -> dict[str, dict[str, list[Train]]] | None:
+    """ Load the trains of a line saved by save_compiled_trains(), or None if not available """
+    if line.trains_cache is None:
+        return None
+    store = open_train_store(line.trains_cache)
+    if store is None:
+        return None
+    line.train_store = store
+    trains = line.stored_trains = stored_trains(line, store)
+    result: dict[str, dict[str, list[Train]]] = {}
+    start = 0
+    for direction, date_group, count in store.header["shape"]:
+        result.setdefault(direction, {})[date_group] = trains[start:start + count]
+        start += count
+    return result
+
+
 def parse_trains(
     line: Line,
     only_direction: set[str] | None = None
 ) -> dict[str, dict[str, list[Train]]]:
     """ Parse the trains from a timetable """
     with _PARSE_LOCK:
+        compiled = load_compiled_trains(line)
+        if compiled is not None:
+            return {direction: direction_dict for direction, direction_dict in compiled.items()
+                    if only_direction is None or direction in only_direction}
+
         # reverse such that station is the innermost layer
         temp_dict: dict[str, dict[str, dict[str, Timetable]]] = {}
         timetable_dict = line.timetables()
@@ -571,6 +726,16 @@ def parse_trains(
                 result_dict[direction][date_group] = parse_trains_stations(
                     line, direction, date_group, station_dict2, line.direction_base_route[direction].stations
                 )
+        if only_direction is None:
+            save_compiled_trains(line, result_dict)
+            store = None if line.trains_cache is None else open_train_store(line.trains_cache)
+            if store is not None:
+                # Refer to the store when pickled (the order is the same as in save_compiled_trains())
+                line.train_store = store
+                line.stored_trains = [train for direction_dict in result_dict.values()
+                                      for train_list in direction_dict.values() for train in train_list]
+                for i, train in enumerate(line.stored_trains):
+                    train.store_index = i
         return result_dict
 
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Columnar storage of the trains of a line, in a memory-mapped file shared by all processes """
+
+# Libraries
+from __future__ import annotations
+
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from typing import Any
+
+from src.city.compiled_cache import write_atomic
+
+# File layout: header size, pickled header, then the int32 columns (each aligned to 8 bytes)
+_HEADER_SIZE = struct.Struct("<Q")
+_ALIGN = 8
+_stores: dict[str, TrainStore] = {}
+
+
+def align(offset: int) -> int:
+    """ Round offset up to the column alignment """
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class TrainStore:
+    """ Read-only view of a file written by write_train_store() """
+
+    def __init__(self, file: str) -> None:
+        """ Constructor """
+        self.file = file
+        with open(file, "rb") as fp:
+            self.buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = _HEADER_SIZE.unpack_from(self.buffer)[0]
+        self.header: dict[str, Any] = pickle.loads(self.buffer[_HEADER_SIZE.size:_HEADER_SIZE.size + header_size])
+
+        # Columns are views into the mapped pages, nothing is copied
+        view = memoryview(self.buffer)
+        start = align(_HEADER_SIZE.size + header_size)
+        self.columns: dict[str, memoryview] = {}
+        for name, length in self.header["columns"]:
+            self.columns[name] = view[start:start + length * 4].cast("i")
+            start = align(start + length * 4)
+
+    def __repr__(self) -> str:
+        """ Get string representation """
+        return f"<TrainStore {self.file}: " + ", ".join(
+            f"{name} ({len(column)})" for name, column in self.columns.items()
+        ) + ">"
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        """ Pickle as the file name, so that other processes map the same file """
+        return open_train_store, (self.file,)
+
+
+def write_train_store(file: str, header: dict[str, Any], columns: dict[str, array]) -> None:
+    """ Write the header and int32 columns into file """
+    header = dict(header, columns=[(name, len(column)) for name, column in columns.items()])
+    header_bytes = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    data = bytearray(_HEADER_SIZE.pack(len(header_bytes)) + header_bytes)
+    for column in columns.values():
+        assert column.typecode == "i" and column.itemsize == 4, column.typecode
+        data += bytes(align(len(data)) - len(data))
+        data += column.tobytes()
+    write_atomic(file, bytes(data))
+
+
+def open_train_store(file: str) -> TrainStore | None:
+    """ Map a train store, only once per process """
+    if file not in _stores:
+        if not os.path.exists(file):
+            return None
+        try:
+            _stores[file] = TrainStore(file)
+        except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError):
+            return None
+    return _stores[file]
@@ -9,7 +9,7 @@ import sys
 
 import questionary
 
-from src.bfs.avg_shortest_time import data_criteria, find_avg_paths
+from src.bfs.avg_shortest_time import NO_VIRTUAL, data_criteria, find_avg_paths, parse_city_trains
 from src.bfs.bfs import Path
 from src.bfs.common import AbstractPath
 from src.bfs.k_shortest_path import k_shortest_path, merge_path
@@ -22,8 +22,6 @@ from src.dist_graph.adaptor import get_dist_graph, simplify_path
 from src.dist_graph.longest_path import find_longest
 from src.dist_graph.shortest_path import shortest_path
 from src.fare.fare import to_abstract
-from src.routing.through_train import parse_through_train
-from src.routing.train import parse_all_trains
 from src.routing_pk.common import Route, route_str, back_to_string, print_routes, select_stations, select_routes, \
     closest_to
 
@@ -356,11 +354,10 @@ def get_multi_path(city: City, args: argparse.Namespace) -> Route:
     """" Get paths with intermediate stops """
     start, _ = ask_for_station(city, message="Please select a starting station:")
     lines = city.lines
-    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else {}
-    train_dict = parse_all_trains(
-        list(lines.values()), include_lines=args.include_lines, exclude_lines=args.exclude_lines
+    virtual_transfers = city.virtual_transfers if not args.exclude_virtual else NO_VIRTUAL
+    train_dict, through_dict = parse_city_trains(
+        city, include_lines=args.include_lines, exclude_lines=args.exclude_lines
     )
-    _, through_dict = parse_through_train(train_dict, city.through_specs)
 
     # Main loop for asking intermediate stops
     last = start
@@ -393,7 +390,7 @@ def get_multi_path(city: City, args: argparse.Namespace) -> Route:
         results = k_shortest_path(
             lines, train_dict, through_dict, city.transfers, virtual_transfers,
             start, end, start_date, current_tuple,
-            exclude_edge=args.exclude_edge, include_express=args.include_express
+            exclude_edge=args.exclude_edge, include_express=args.include_express, engine=args.engine
         )
         if len(results) == 0:
             print("Unreachable!")
@@ -419,16 +416,19 @@ def add_by_kth(city: City, args: argparse.Namespace, *, with_intermediate: bool
     """ Add routes by the k-th shortest path """
     local_args = argparse.Namespace(**vars(args))
     data_source = questionary.select(
-        "Please select a data source:", choices=["Time", "Station", "Distance"] + (
-            ["Fare"] if city.fare_rules is not None else []
-        )
+        "Please select a data source:", choices=["Time"] + ([] if with_intermediate else ["Pareto"]) + [
+            "Station", "Distance"
+        ] + (["Fare"] if city.fare_rules is not None else [])
     ).ask()
     if data_source is None:
         sys.exit(0)
     local_args.data_source = data_source.lower()
-    if data_source == "Time":
+    if data_source in ["Time", "Pareto"]:
         if with_intermediate:
             local_args.num_path = 1
+        elif data_source == "Pareto":
+            # All the non-dominated paths are found at once
+            local_args.num_path = None
         else:
             local_args.num_path = ask_for_int("Please enter the number of shortest paths to find:")
         local_args.exclude_next_day = False
@@ -66,7 +66,7 @@ def main() -> None:
     parser.add_argument("--dpi", type=int, help="DPI of output image", default=100)
     parser.add_argument("--exclude-stations", help="Don't allow path with these stations")
     parser.add_argument("--exclude-transfers", help="Don't allow transfer in these stations")
-    shortest_path_args(parser, have_single=True)
+    shortest_path_args(parser, have_single=True, have_engine=True)
     args = parser.parse_args()
     cmap = get_path_colormap(args.color_map)
 
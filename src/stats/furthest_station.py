@@ -12,7 +12,8 @@ from src.city.ask_for_city import ask_for_city
 from src.city.city import City
 from src.common.common import suffix_s, distance_str, stddev
 from src.dist_graph.adaptor import get_dist_graph
-from src.dist_graph.shortest_path import Graph, all_shortest
+from src.dist_graph.compiled_graph import all_shortest_dists
+from src.dist_graph.shortest_path import Graph
 from src.stats.common import display_first
 
 
@@ -22,11 +23,11 @@ def furthest_stations(
     sort_by: Literal["sum", "shortest", "longest"] = "sum", reverse: bool = False
 ) -> None:
     """ Print the smallest/largest sum of stations needed """
-    path_dict = all_shortest(city, graph, data_source=data_source)
+    path_dict = all_shortest_dists(graph, data_source=data_source)
     shortest_dict: dict[str, tuple[str, int]] = {}
     longest_dict: dict[str, tuple[str, int]] = {}
     for station, inner_dict in path_dict.items():
-        inner_list = sorted([(k, v[0]) for k, v in inner_dict.items()], key=lambda x: x[1])
+        inner_list = sorted(inner_dict.items(), key=lambda x: x[1])
         shortest_dict[station] = inner_list[0]
         longest_dict[station] = inner_list[-1]
 
@@ -38,7 +39,7 @@ def furthest_stations(
         return distance_str(data)
     display_first(
         sorted([
-            (k, sum(x[0] for x in v.values()), stddev([x[0] for x in v.values()])) for k, v in path_dict.items()
+            (k, sum(v.values()), stddev(list(v.values()))) for k, v in path_dict.items()
         ], key=lambda x: ({
             "sum": x[1], "stddev": x[2], "shortest": shortest_dict[x[0]][1], "longest": longest_dict[x[0]][1]
         }[sort_by], x[1]), reverse=reverse),
@@ -8,10 +8,13 @@ import argparse
 import json
 import os
 import sys
+from collections.abc import Iterable, Sequence
+
+import numpy as np
 
 from src.city.line import Line
 from src.city.through_spec import ThroughSpec
-from src.common.common import add_min_tuple, get_time_str, suffix_s
+from src.common.common import get_time_str, suffix_s, to_minutes, from_minutes
 from src.routing.through_train import ThroughTrain, get_train_set
 from src.routing.train import Train
 from src.stats.common import display_first, divide_by_line, parse_args, parse_args_through
@@ -45,34 +48,96 @@ def hour_trains(
     )
 
 
+def running_minutes(train: Train) -> tuple[int, int]:
+    """ First and last minute (inclusive) the train is running """
+    start = to_minutes(*train.start_time())
+    return start, start + train.duration()
+
+
+def minute_sums(
+    starts: Sequence[int], ends: Sequence[int], rows: Sequence[int], weights: Sequence[int], row_count: int
+) -> tuple[int, np.ndarray]:
+    """ Total weight in each row at each minute, from [start, end] minute ranges (returns first minute and array) """
+    if len(starts) == 0:
+        return 0, np.zeros((row_count, 0), dtype=np.int64)
+    start_array = np.asarray(starts, dtype=np.int64)
+    end_array = np.asarray(ends, dtype=np.int64)
+    row_array = np.asarray(rows, dtype=np.int64)
+    weight_array = np.asarray(weights, dtype=np.int64)
+    first = int(start_array.min())
+
+    # Difference array: +weight at the start, -weight right after the end
+    diff = np.zeros((row_count, int(end_array.max()) - first + 2), dtype=np.int64)
+    np.add.at(diff, (row_array, start_array - first), weight_array)
+    np.add.at(diff, (row_array, end_array - first + 1), -weight_array)
+    return first, np.cumsum(diff[:, :-1], axis=1)
+
+
+class MinuteTrains:
+    """ Number and capacity of the trains running at each minute, by (line, direction) """
+
+    def __init__(self, trains: Iterable[Train], *, full_only: bool = False) -> None:
+        """ Constructor """
+        self.keys: list[tuple[str, str]] = []
+        self.line_index: dict[str, int] = {}
+        key_ids: dict[tuple[str, str], int] = {}
+        starts: list[int] = []
+        ends: list[int] = []
+        rows: list[int] = []
+        capacities: list[int] = []
+        for train in trains:
+            if full_only and not train.is_full():
+                continue
+            key = (train.line.name, train.direction)
+            if key not in key_ids:
+                key_ids[key] = len(self.keys)
+                self.keys.append(key)
+                self.line_index[train.line.name] = train.line.index
+            start, end = running_minutes(train)
+            starts.append(start)
+            ends.append(end)
+            rows.append(key_ids[key])
+            capacities.append(train.train_capacity())
+
+        # Counts and capacities in one pass, as the first and second half of the rows
+        row_count = len(self.keys)
+        self.first_minute, sums = minute_sums(
+            starts * 2, ends * 2, rows + [row + row_count for row in rows], [1] * len(rows) + capacities, 2 * row_count
+        )
+        self.counts = sums[:row_count]
+        self.capacities = sums[row_count:]
+
+    def __repr__(self) -> str:
+        """ String representation """
+        return f"<MinuteTrains: {len(self.keys)} directions, {self.counts.shape[1]} minutes " + \
+            f"from {get_time_str(*from_minutes(self.first_minute))}>"
+
+    def select(self, line_name: str | None = None, direction: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """ Count and capacity at each minute, for one line or direction (default to all) """
+        rows = [i for i, (key_line, key_direction) in enumerate(self.keys) if (
+            line_name is None or key_line == line_name
+        ) and (direction is None or key_direction == direction)]
+        return self.counts[rows].sum(axis=0), self.capacities[rows].sum(axis=0)
+
+    def minute_dict(self, line_name: str | None = None, *, use_capacity: bool = False) -> dict[str, int]:
+        """ Time string -> count or capacity, for minutes with running trains """
+        counts, capacities = self.select(line_name)
+        values = (capacities if use_capacity else counts).tolist()
+        return {
+            get_time_str(*from_minutes(self.first_minute + i)): values[i] for i in np.flatnonzero(counts).tolist()
+        }
+
+
 def minute_trains(
     all_trains: dict[str, list[tuple[str, Train]]], *,
     full_only: bool = False, use_capacity: bool = False
 ) -> dict[str, dict[str, int]]:
     """ Print train number & capacity per minute """
-    minute_dict: dict[str, dict[str, int]] = {"Total": {}}
-    index_dict: dict[str, int] = {}
-    for _, train in {t for x in all_trains.values() for t in x}:
-        if full_only and not train.is_full():
-            continue
-        if train.line.name not in minute_dict:
-            minute_dict[train.line.name] = {}
-        index_dict[train.line.name] = train.line.index
-        start_tuple = train.start_time()
-        for i in range(0, train.duration() + 1):
-            cur_tuple = add_min_tuple(start_tuple, i)
-            cur_str = get_time_str(*cur_tuple)
-            train_cap = train.train_capacity()
-            if cur_str not in minute_dict[train.line.name]:
-                minute_dict[train.line.name][cur_str] = 0
-            minute_dict[train.line.name][cur_str] += train_cap if use_capacity else 1
-            if cur_str not in minute_dict["Total"]:
-                minute_dict["Total"][cur_str] = 0
-            minute_dict["Total"][cur_str] += train_cap if use_capacity else 1
-    index_dict["Total"] = max(index_dict.values()) + 1
-    for line, line_dict in minute_dict.items():
-        minute_dict[line] = dict(sorted(line_dict.items(), key=lambda x: x[0]))
-    return dict(sorted(minute_dict.items(), key=lambda x: index_dict[x[0]]))
+    minute_data = MinuteTrains([t for _, t in {t for x in all_trains.values() for t in x}], full_only=full_only)
+    line_names = sorted(minute_data.line_index.keys(), key=lambda x: minute_data.line_index[x])
+    minute_dict = {line_name: minute_data.minute_dict(line_name, use_capacity=use_capacity) for line_name in line_names}
+    minute_dict["Total"] = minute_data.minute_dict(use_capacity=use_capacity)
+    return minute_dict
 
 
 def main() -> None:
@@ -7,11 +7,16 @@
 import argparse
 from collections.abc import Sequence
 
-from src.common.common import moving_average_dict, arg_minmax, add_min_tuple, get_time_str, TimeSpec, diff_time_tuple, \
-    average, stddev
+import numpy as np
+
+from src.common.common import moving_average_batch, get_time_str, to_minutes, from_minutes
+from src.common.windowed import grouped_stats
 from src.routing.train import Train
 from src.stats.common import parse_args, append_table_args, output_table, get_all_trains_from_set
-from src.stats.hour_trains import minute_trains
+from src.stats.hour_trains import MinuteTrains, minute_sums
+
+# Section counts: section index, first and last minute, count and capacity of each window
+SectionCounts = tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
 
 
 def get_moving_average_data(
@@ -21,20 +26,20 @@ def get_moving_average_data(
     """ Get moving average data """
     line = list(train_date_set)[0][1].line
     all_trains = get_all_trains_from_set({line.name: line}, train_date_set)
-    line_dict = minute_trains(all_trains)[line.name]
-    capacity_dict = minute_trains(all_trains, use_capacity=True)
-
-    avg_cnt, stddev_cnt, (
+    minute_data = MinuteTrains([t for _, t in {t for x in all_trains.values() for t in x}])
+    line_items = list(minute_data.minute_dict(line.name).items())
+    cap_items = list(minute_data.minute_dict(line.name, use_capacity=True).items())
+    (avg_cnt, stddev_cnt, (
         min_cnt_beg, min_cnt_end, min_cnt
     ), (
         max_cnt_beg, max_cnt_end, max_cnt
-    ) = moving_average_dict(line_dict, moving_min, include_edge)
-    line_cap_dict = capacity_dict[line.name]
-    avg_cap_cnt, stddev_cap_cnt, (
+    )), (avg_cap_cnt, stddev_cap_cnt, (
         min_cap_cnt_beg, min_cap_cnt_end, min_cap_cnt
     ), (
         max_cap_cnt_beg, max_cap_cnt_end, max_cap_cnt
-    ) = moving_average_dict(line_cap_dict, moving_min, include_edge)
+    )) = [(avg, dev, (min_beg[0], min_end[0], min_value), (max_beg[0], max_end[0], max_value)) for (
+        avg, dev, (min_beg, min_end, min_value), (max_beg, max_end, max_value)
+    ) in moving_average_batch([line_items, cap_items], lambda x: x[1], moving_min, include_edge)]
 
     separator = "\n" if show_example == "newline" else " "
     return (
@@ -47,32 +52,48 @@ def get_moving_average_data(
     )
 
 
-def count_train(station: str, trains: Sequence[Train], *, moving_min: int = 60,
-                start_time: TimeSpec | None = None, end_time: TimeSpec | None = None) -> dict[str, tuple[int, int]]:
-    """ Count the trains as moving average of station-wise count/capacities """
-    result_dict: dict[str, tuple[int, int]] = {}
-    for train in trains:
-        start_tuple = train.arrival_time[station]
-        for i in range(-moving_min + 1, 1):
-            cur_tuple = add_min_tuple(start_tuple, i)
-            if start_time is not None and diff_time_tuple(start_time, cur_tuple) > 0:
-                continue
-            next_tuple = add_min_tuple(cur_tuple, moving_min - 1)
-            if end_time is not None and diff_time_tuple(end_time, next_tuple) < 0:
-                continue
-            cur_str = get_time_str(*cur_tuple) + " - " + get_time_str(*next_tuple)
-            if cur_str not in result_dict:
-                result_dict[cur_str] = (0, 0)
-            result_dict[cur_str] = (
-                result_dict[cur_str][0] + 1,
-                result_dict[cur_str][1] + train.train_capacity()
-            )
-    if len(result_dict) == 0:
-        assert start_time is not None and end_time is not None, (station, trains)
-        result_dict[get_time_str(*start_time) + " - " + get_time_str(*end_time)] = (
-            len(trains), sum(t.train_capacity() for t in trains)
-        )
-    return result_dict
+def count_sections(
+    sections: Sequence[tuple[str, Sequence[Train]]], *, moving_min: int = 60, include_edge: bool = False
+) -> SectionCounts:
+    """ Count the trains of many (station, trains) sections as moving sums of count/capacities at once """
+    # Each train is counted in the windows starting at most moving_min - 1 minutes before its arrival,
+    # with a count row and a capacity row for every section
+    arrivals: list[int] = []
+    rows: list[int] = []
+    capacities: list[int] = []
+    for row, (station, trains) in enumerate(sections):
+        for train in trains:
+            arrivals.append(to_minutes(*train.arrival_time[station]))
+            rows.append(row)
+            capacities.append(train.train_capacity())
+    first, sums = minute_sums(
+        [minute - moving_min + 1 for minute in arrivals] * 2, arrivals * 2,
+        rows + [row + len(sections) for row in rows], [1] * len(rows) + capacities, 2 * len(sections)
+    )
+    counts, caps = sums[:len(sections)], sums[len(sections):]
+    window_starts = first + np.arange(sums.shape[1])
+    section_first = np.full(len(sections), window_starts[-1], dtype=np.int64)
+    section_last = np.full(len(sections), window_starts[0], dtype=np.int64)
+    np.minimum.at(section_first, rows, arrivals)
+    np.maximum.at(section_last, rows, arrivals)
+    valid = (counts > 0) & (window_starts >= 0)
+    if not include_edge:
+        # Only windows inside the service time of the section
+        valid &= (window_starts >= section_first[:, None]) & (window_starts + moving_min - 1 <= section_last[:, None])
+
+    # Sections with no window inside count all their trains once
+    valid_rows, valid_columns = np.nonzero(valid)
+    empty_rows = np.flatnonzero(~valid.any(axis=1))
+    order = np.argsort(np.concatenate((valid_rows, empty_rows)), kind="stable")
+    section_counts = np.bincount(rows, minlength=len(sections))
+    section_caps = np.bincount(rows, weights=capacities, minlength=len(sections)).astype(np.int64)
+    return (
+        np.concatenate((valid_rows, empty_rows))[order],
+        np.concatenate((first + valid_columns, section_first[empty_rows]))[order],
+        np.concatenate((first + valid_columns + moving_min - 1, section_last[empty_rows]))[order],
+        np.concatenate((counts[valid_rows, valid_columns], section_counts[empty_rows]))[order],
+        np.concatenate((caps[valid_rows, valid_columns], section_caps[empty_rows]))[order]
+    )
 
 
 def get_section_data(
@@ -95,37 +116,37 @@ def get_section_data(
                 processed_dict[train.line.name][key] = []
             processed_dict[train.line.name][key].append(train)
 
-    # Calculate train count/capacity dict
-    # After this, the structure will be (date_group, direction, station, time) -> count/capacity
+    # Calculate train count/capacity of all sections at once
+    # After this, each entry will be (date_group, direction, station, time) -> count/capacity
     processed_line = processed_dict[line.name]
-    count_dict: dict[tuple[str, str, str, str], int] = {}
-    cap_dict: dict[tuple[str, str, str, str], int] = {}
-    for key, value in processed_line.items():
-        station = key[2]
-        sorted_list = sorted(value, key=lambda t: t.stop_time_str(station))
-        for time_str, (count_value, cap_value) in count_train(
-            station, value, moving_min=moving_min,
-            start_time=None if include_edge else sorted_list[0].arrival_time[station],
-            end_time=None if include_edge else sorted_list[-1].arrival_time[station]
-        ).items():
-            count_dict[key + (time_str,)] = count_value
-            cap_dict[key + (time_str,)] = cap_value
+    keys = list(processed_line.keys())
+    rows, window_first, window_last, counts, caps = count_sections(
+        [(key[2], value) for key, value in processed_line.items()], moving_min=moving_min, include_edge=include_edge
+    )
+
+    def entry_key(index: int) -> tuple[str, str, str, str]:
+        """ (date_group, direction, station, time) of an entry """
+        return keys[rows[index]] + (get_time_str(*from_minutes(int(window_first[index]))) + " - " +
+                                    get_time_str(*from_minutes(int(window_last[index]))),)
 
     # Calculate min/max
-    min_cnt_key, max_cnt_key = arg_minmax(count_dict)
-    min_cap_cnt_key, max_cap_cnt_key = arg_minmax(cap_dict)
+    groups = np.zeros(len(rows), dtype=np.int64)
+    (avg_cnt,), (stddev_cnt,), (min_cnt_index,), (max_cnt_index,) = grouped_stats(counts, groups, 1)
+    (avg_cap,), (stddev_cap,), (min_cap_index,), (max_cap_index,) = grouped_stats(caps, groups, 1)
+    min_cnt_key, max_cnt_key = entry_key(min_cnt_index), entry_key(max_cnt_index)
+    min_cap_cnt_key, max_cap_cnt_key = entry_key(min_cap_index), entry_key(max_cap_index)
     separator = "\n" if show_example == "newline" else " "
     return (
-        average(count_dict.values()), stddev(count_dict.values()),
-        f"{count_dict[min_cnt_key]}" +
+        float(avg_cnt), float(stddev_cnt),
+        f"{counts[min_cnt_index]}" +
         (f"{separator}[{min_cnt_key[2]} {min_cnt_key[1]} {min_cnt_key[0]} {min_cnt_key[3]}]" if show_example else ""),
-        f"{count_dict[max_cnt_key]}" +
+        f"{counts[max_cnt_index]}" +
         (f"{separator}[{max_cnt_key[2]} {max_cnt_key[1]} {max_cnt_key[0]} {max_cnt_key[3]}]" if show_example else ""),
-        average(cap_dict.values()), stddev(cap_dict.values()),
-        f"{cap_dict[min_cap_cnt_key]}" +
+        float(avg_cap), float(stddev_cap),
+        f"{caps[min_cap_index]}" +
         (f"{separator}[{min_cap_cnt_key[2]} {min_cap_cnt_key[1]} {min_cap_cnt_key[0]} {min_cap_cnt_key[3]}]"
          if show_example else ""),
-        f"{cap_dict[max_cap_cnt_key]}" +
+        f"{caps[max_cap_index]}" +
         (f"{separator}[{max_cap_cnt_key[2]} {max_cap_cnt_key[1]} {max_cap_cnt_key[0]} {max_cap_cnt_key[3]}]"
          if show_example else "")
     )
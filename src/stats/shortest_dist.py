@@ -16,7 +16,8 @@ from src.city.ask_for_city import ask_for_date, ask_for_time
 from src.city.city import City
 from src.common.common import suffix_s, to_pinyin, format_duration, speed_str, segment_speed
 from src.dist_graph.adaptor import get_dist_graph, simplify_path, all_bfs_path
-from src.dist_graph.shortest_path import Path, Graph, all_shortest
+from src.dist_graph.compiled_graph import all_shortest
+from src.dist_graph.shortest_path import Path, Graph
 from src.routing.show_express_trains import average_speed
 from src.routing.train import parse_all_trains, Train
 from src.stats.common import display_first, parse_args
@@ -164,7 +165,7 @@ def main() -> None:
                         fare = city.fare_rules.get_total_fare(lines, bfs_path, end, start_date)
                         processed_dict[start][end] = [(fare, path, None)]
         else:
-            shortest_dict = all_shortest(city, graph, data_source=args.data_source)
+            shortest_dict = all_shortest(graph, data_source=args.data_source)
             processed_dict = {
                 start: {end: [(elem[0], elem[1], None)] for end, elem in inner_dict.items()}
                 for start, inner_dict in shortest_dict.items()
@@ -13,7 +13,7 @@ from typing import Any
 from src.city.date_group import DateGroup
 from src.city.train_route import TrainRoute
 from src.common.common import parse_time, add_min, get_time_str, get_time_repr, \
-    distribute_braces, combine_brace, TimeSpec
+    distribute_braces, combine_brace, TimeSpec, to_minutes
 
 
 class Timetable:
@@ -78,6 +78,10 @@ class Timetable:
             """ Get the key for sorting, considering next_day """
             return get_time_str(*self.sort_key())
 
+        def sort_minute(self) -> int:
+            """ Get the key for sorting as minutes, considering next_day """
+            return to_minutes(self.leaving_time, self.next_day)
+
     def __init__(self, trains: dict[time, Train], base_route: TrainRoute) -> None:
         """ Constructor """
         self.trains = trains
@@ -93,7 +97,7 @@ class Timetable:
 
     def trains_sorted(self) -> list[Train]:
         """ All trains sorted by time """
-        return sorted(self.trains.values(), key=lambda x: x.sort_key_str())
+        return sorted(self.trains.values(), key=lambda x: x.sort_minute())
 
     def pretty_print(
         self, *, with_time: dict[str, int | None] | None = None,
@@ -234,7 +238,7 @@ def parse_timetable(station: str, base_route: TrainRoute, date_group: DateGroup,
                 leaving_time, next_day = add_min(leaving_time, delta, next_day)
                 trains[leaving_time] = Timetable.Train(
                     station, date_group, leaving_time, base_route, next_day)
-    trains = dict(sorted(trains.items(), key=lambda x: x[1].sort_key_str()))
+    trains = dict(sorted(trains.items(), key=lambda x: x[1].sort_minute()))
 
     # Add filters
     for entry in filters:
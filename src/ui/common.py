@@ -16,6 +16,7 @@ from src.city.city import City
 from src.city.line import Line, station_full_name
 from src.common.common import get_text_color, to_pinyin, TimeSpec, from_minutes, to_minutes, get_time_repr, \
     get_time_str, to_polar, parse_time, parse_time_opt, parse_date_opt
+from src.common.windowed import WindowStats
 from src.routing.through_train import ThroughTrain, parse_through_train
 from src.routing.train import Train, parse_all_trains
 from src.stats.common import get_all_trains_through, is_possible_to_board, get_virtual_dict
@@ -387,15 +388,16 @@ def calculate_moving_average(
     """ Calculate moving average of data """
     assert moving_average > 0, moving_average
     minutes: set[str] = set()
-    for line_name, inner_dict in result_dict.items():
-        new_dict: dict[str, float] = {}
-        inner_list = sorted(inner_dict.items(), key=lambda x: x[0])
-        for i in range(moving_average // 2, len(inner_list) - moving_average + moving_average // 2):
-            minutes.add(inner_list[i][0])
-            new_dict[inner_list[i][0]] = sum(
-                inner_list[j][1] for j in range(i - moving_average // 2, i + moving_average - moving_average // 2)
-            ) / moving_average
-        result_dict[line_name] = new_dict
+    inner_lists = [sorted(inner_dict.items(), key=lambda x: x[0]) for inner_dict in result_dict.values()]
+    stats = WindowStats(
+        [[value for _, value in inner_list] for inner_list in inner_lists], moving_average, at_least_one=False
+    )
+
+    # Each average is labelled with the middle of its window
+    for index, (line_name, inner_list) in enumerate(zip(list(result_dict.keys()), inner_lists)):
+        labels = [inner_list[start + moving_average // 2][0] for start in stats.series_starts(index).tolist()]
+        minutes.update(labels)
+        result_dict[line_name] = dict(zip(labels, stats.series_means(index).tolist()))
     return minutes, result_dict
 
 
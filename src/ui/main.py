@@ -19,7 +19,8 @@ from src.ui.common import get_default_line, get_default_direction, get_default_s
 from src.ui.drawers import right_drawer, assign_globals
 from src.ui.info_tab import info_tab, InfoData
 from src.ui.route_tab import route_tab
-from src.ui.stats_tab import stats_tab, StatsData, train_chart_data, speed_graph_data, collect_directions
+from src.ui.stats_tab import stats_tab, StatsData, train_chart_data, speed_graph_data, collect_directions, \
+    get_stats_key
 from src.ui.timetable_tab import get_train_dict, timetable_tab, TimetableData
 from src.ui.trains_tab import get_train_list, trains_tab, TrainsData
 
@@ -265,12 +266,12 @@ async def main_page(city_name: str) -> None:
                 trains_data.train_list = train_list
                 trains_data.train_list_key = trains_key
 
-        stats_key = (stats_data.cur_date, tuple(sorted(info_data.lines.keys())))
+        stats_key = get_stats_key(stats_data)
         if stats_data.train_dict_key != stats_key:
             train_dict = await run.io_bound(get_train_dict, info_data.lines.values(), stats_data.cur_date)
             if train_dict is None:
                 return
-            if stats_key == (stats_data.cur_date, tuple(sorted(info_data.lines.keys()))):
+            if stats_key == get_stats_key(stats_data):
                 stats_data.train_dict = train_dict
                 stats_data.train_dict_key = stats_key
 
@@ -302,7 +303,7 @@ async def main_page(city_name: str) -> None:
                 if build_result is None:
                     return
                 dimensions, dataset, total_data = build_result
-                if stats_key == (stats_data.cur_date, tuple(sorted(info_data.lines.keys()))):
+                if stats_key == get_stats_key(stats_data):
                     stats_data.chart_cache_key = chart_key
                     stats_data.chart_cache = (dimensions, dataset, total_data)
 
@@ -315,7 +316,7 @@ async def main_page(city_name: str) -> None:
                 speed_dataset = await run.io_bound(build_speed)
                 if speed_dataset is None:
                     return
-                if stats_key == (stats_data.cur_date, tuple(sorted(info_data.lines.keys()))):
+                if stats_key == get_stats_key(stats_data):
                     stats_data.speed_cache_key = speed_key
                     stats_data.speed_cache = speed_dataset
 
@@ -20,7 +20,7 @@ from nicegui.elements.progress import LinearProgress
 from nicegui.elements.select import Select
 from nicegui.elements.switch import Switch
 
-from src.bfs.avg_shortest_time import PathInfo, get_waiting_time
+from src.bfs.avg_shortest_time import PathInfo, NO_VIRTUAL, get_waiting_time, parse_city_trains
 from src.bfs.bfs import path_distance, expand_path, total_transfer, total_transfer_duration
 from src.bfs.k_shortest_path import k_shortest_path
 from src.city.city import City
@@ -32,8 +32,7 @@ from src.dist_graph.adaptor import all_time_paths, reduce_abstract_path, get_dis
 from src.dist_graph.exotic_path import PathMetric
 from src.dist_graph.shortest_path import shortest_path, Path
 from src.fare.fare import to_abstract
-from src.routing.through_train import parse_through_train, ThroughTrain
-from src.routing.train import parse_all_trains
+from src.routing.through_train import ThroughTrain
 from src.routing_pk.add_routes import validate_shorthand, parse_shorthand
 from src.routing_pk.analyze_routes import PathData, calculate_data, strip_routes, reassign_index
 from src.routing_pk.common import Route, route_str, RouteData, reverse_route
@@ -540,21 +539,19 @@ def add_route_shorthand(city: City, on_route_change: Callable[[Route], None]) ->
 async def get_kth_routes(
     progress_callback: Callable[[int, int], None], city: City, start_station: str, end_station: str,
     start_date: date, start_time: TimeSpec | None, k: int,
-    *, metric: PathMetric, exclude_virtual: bool = False, include_express: bool = False
+    *, metric: PathMetric, exclude_virtual: bool = False, include_express: bool = False, engine: str = "bfs"
 ) -> list[PathInfo] | tuple[int, Path, str] | None:
     """ Analyze selected routes """
-    lines = city.lines
     if metric == "time":
         assert start_time is not None, start_time
-        train_dict = parse_all_trains(list(lines.values()))
-        _, through_dict = parse_through_train(train_dict, city.through_specs)
+        train_dict, through_dict = parse_city_trains(city)
         progress_callback(0, k)
         results = await run.io_bound(
             k_shortest_path,
             city.lines, train_dict, through_dict, city.transfers,
-            {} if exclude_virtual else city.virtual_transfers,
+            NO_VIRTUAL if exclude_virtual else city.virtual_transfers,
             start_station, end_station, start_date, start_time,
-            k=k, include_express=include_express, progress_callback=progress_callback
+            k=k, include_express=include_express, engine=engine, progress_callback=progress_callback
         )
         if results is None or len(results) == 0:
             return None
@@ -610,7 +607,7 @@ def add_route_top(city: City, on_route_change: Callable[[Route | list[Route]], N
             progress, get_kth_routes, city, start_station.value, end_station.value,
             start_date, start_time, int(kth_select.value),
             metric=metric_select.value, exclude_virtual=(not virtual_switch.value),
-            include_express=express_switch.value
+            include_express=express_switch.value, engine=("raptor" if raptor_switch.value else "bfs")
         )
         calc_button.set_enabled(True)
         await kth_table.refresh(start_date=start_date, results=results)
@@ -619,6 +616,7 @@ def add_route_top(city: City, on_route_change: Callable[[Route | list[Route]], N
         with ui.row().classes("w-full items-center gap-x-2"):
             virtual_switch = ui.switch("Allow virtual transfers", value=False, on_change=on_input_change)
             express_switch = ui.switch("Include express lines", value=False, on_change=on_input_change)
+            raptor_switch = ui.switch("Use round-based (RAPTOR) search", value=False, on_change=on_input_change)
         with ui.row().classes("items-center route-tab-top-selection w-full flex-nowrap"):
             metric_select = ui.select({
                 "time": "Fastest", "distance": "Shortest", "station": "Fewest station"
@@ -770,9 +768,7 @@ async def analyze_routes(
     progress_callback: Callable[[int, int], None], city: City, routes: list[Route], start_date: date
 ) -> tuple[list[PathData], dict[ThroughSpec, list[ThroughTrain]]]:
     """ Analyze selected routes """
-    lines = city.lines
-    train_dict = parse_all_trains(list(lines.values()))
-    _, through_dict = parse_through_train(train_dict, city.through_specs)
+    train_dict, through_dict = parse_city_trains(city)
     path_dict = await run.cpu_bound(
         all_time_paths,
         city, train_dict, {
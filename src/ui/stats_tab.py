@@ -8,15 +8,18 @@ from datetime import date
 from math import sqrt
 from typing import Callable, Literal
 
+import numpy as np
 from nicegui import background_tasks, binding, run, ui
 
 from src.city.city import City
 from src.city.line import Line
+from src.city.service_pattern import LinePattern, line_pattern
 from src.common.common import get_time_str, add_min_tuple, get_time_repr, to_minutes, from_minutes, diff_time_tuple, \
     TimeSpec, get_text_color, chin_len, shift_max, valid_positive, to_polar, zero_div, average, suffix_s, to_pinyin, \
     speed_str, format_duration, distance_str, parse_time, unique_on
 from src.routing.train import Train, get_train_id
 from src.stats.common import is_possible_to_board
+from src.stats.hour_trains import minute_sums
 from src.ui.common import get_date_input, get_time_input, get_default_line, get_default_direction, get_default_station, \
     get_line_selector_options, get_direction_selector_options, get_station_selector_options, get_line_html, \
     get_station_html, find_train_id, draw_arc, draw_text, get_line_row, get_station_row, calculate_moving_average, \
@@ -32,7 +35,7 @@ class StatsData:
     info_data: InfoData
     cur_date: date
     train_dict: dict[tuple[str, str], list[Train]]
-    train_dict_key: tuple[date, tuple[str, ...]] | None
+    train_dict_key: tuple[LinePattern, tuple[str, ...]] | None
     chart_cache_key: tuple | None
     chart_cache: tuple[list[str], dict[str, dict[str, float]], dict[str, float]] | None
     speed_cache_key: tuple | None
@@ -66,6 +69,11 @@ def split_directions(train_dict: dict[tuple[str, str], list[Train]]) -> tuple[di
     return result_dict1, result_dict2
 
 
+def get_stats_key(data: StatsData) -> tuple[LinePattern, tuple[str, ...]]:
+    """ Key of the trains shown, the same for all the dates on which the selected lines run the same """
+    return line_pattern(data.info_data.lines.values(), data.cur_date), tuple(sorted(data.info_data.lines.keys()))
+
+
 def stats_tab(city: City, data: StatsData) -> None:
     """ Statistics tab for the main page """
     with ui.row().classes("items-center justify-between"):
@@ -83,7 +91,7 @@ def stats_tab(city: City, data: StatsData) -> None:
                 loading.set_visibility(False)
                 return
             data.train_dict = train_dict
-            data.train_dict_key = (cur_date, lines_key)
+            data.train_dict_key = get_stats_key(data)
             data.chart_cache_key = None
             data.chart_cache = None
             data.speed_cache_key = None
@@ -95,8 +103,7 @@ def stats_tab(city: City, data: StatsData) -> None:
 
         def on_any_change() -> None:
             """ Update the train list based on current data """
-            key = (data.cur_date, tuple(sorted(data.info_data.lines.keys())))
-            if data.train_dict_key == key:
+            if data.train_dict_key == get_stats_key(data):
                 final_train_radar.refresh(**radar_kwargs())
                 display_train_chart.refresh(data=data)
                 display_speed_graph.refresh(data=data)
@@ -315,41 +322,47 @@ def train_chart_data(
     full_only: bool = False, moving_average: int = 1
 ) -> tuple[list[str], dict[str, dict[str, float]]]:
     """ Return the chart dataset for train-related statistics. Returns line -> (time -> value) """
-    minutes: set[str] = set()
-    result_dict: dict[str, dict[str, float]] = {}
-    for line_name, train_list in train_dict.items():
-        if line_name not in result_dict:
-            result_dict[line_name] = {}
-
-        line_minutes: set[str] = set()
+    starts: list[int] = []
+    ends: list[int] = []
+    rows: list[int] = []
+    weights: list[int] = []
+    line_names = list(train_dict.keys())
+    for i, train_list in enumerate(train_dict.values()):
         for train in train_list:
             if full_only and not train.is_full():
                 continue
-            start = to_minutes(*train.start_time())
-            end = to_minutes(*train.last_time())
-            for minute in range(start, end + (0 if train.loop_next is not None else 1)):
-                time_spec = from_minutes(minute)
-                key = get_time_str(*time_spec)
-                minutes.add(key)
-                line_minutes.add(key)
-                if key not in result_dict[line_name]:
-                    result_dict[line_name][key] = 0
-                if view_metric == "count":
-                    result_dict[line_name][key] += 1
-                elif view_metric == "capacity":
-                    result_dict[line_name][key] += train.train_capacity()
-                elif view_metric == "distance":
-                    result_dict[line_name][key] += train.distance()
-                else:
-                    result_dict[line_name][key] += train.line.total_distance(train.direction)
+            starts.append(to_minutes(*train.start_time()))
+            ends.append(to_minutes(*train.last_time()) - (1 if train.loop_next is not None else 0))
+            rows.append(i)
+            if view_metric == "count":
+                weights.append(1)
+            elif view_metric == "capacity":
+                weights.append(train.train_capacity())
+            elif view_metric == "distance":
+                weights.append(train.distance())
+            else:
+                weights.append(train.line.total_distance(train.direction))
+
+    # Count in the second half of the rows, to tell the minutes with running trains
+    first, sums = minute_sums(
+        starts * 2, ends * 2, rows + [row + len(line_names) for row in rows], weights + [1] * len(rows),
+        2 * len(line_names)
+    )
+    minute_strs = [get_time_str(*from_minutes(first + i)) for i in range(sums.shape[1])]
+    minutes: set[str] = set()
+    result_dict: dict[str, dict[str, float]] = {}
+    for i, line_name in enumerate(line_names):
+        running = np.flatnonzero(sums[len(line_names) + i])
+        if len(running) == 0:
+            result_dict[line_name] = {}
+            continue
+        minutes.update(minute_strs[j] for j in running.tolist())
 
         # Fill 0 for all other times
-        start_min = to_minutes(*parse_time(min(line_minutes)))
-        end_min = to_minutes(*parse_time(max(line_minutes)))
-        for minute in range(start_min, end_min + 1):
-            key = get_time_str(*from_minutes(minute))
-            if key not in result_dict[line_name]:
-                result_dict[line_name][key] = 0
+        values = sums[i].tolist()
+        result_dict[line_name] = {
+            minute_strs[j]: values[j] for j in range(int(running[0]), int(running[-1]) + 1)
+        }
 
     if moving_average > 1:
         minutes, result_dict = calculate_moving_average(result_dict, moving_average)